@@ -0,0 +1,71 @@
+from collections import deque
+import threading
+import traceback
+
+class CallbackDispatcher():
+    # CallbackDispatcher calls the callback by a background thread, so a slow callback, e.g.
+    # logging to disk, doesn't stall the evolution loop. The calls are kept in a bounded queue and
+    # the policy decides what happens while the queue is full:
+    #   "block" - dispatch waits until the callback thread takes a call.
+    #   "drop_oldest" - the oldest pending call is dropped.
+    #   "coalesce" - all pending calls are dropped, only the latest one is kept.
+    # The calls are delivered in order. dropped counts the calls which are never delivered.
+    POLICIES = ["block", "drop_oldest", "coalesce"]
+
+    def __init__(self, callback, size=64, policy="block"):
+        assert size >= 1
+        assert policy in CallbackDispatcher.POLICIES
+        self.__callback = callback
+        self.__size = size
+        self.__policy = policy
+        self.__pending = deque()
+        self.__running = 0
+        self.__dropped = 0
+        self.__condition = threading.Condition()
+        self.__thread = threading.Thread(target=self.__dispatch_loop)
+        self.__thread.daemon = True
+        self.__thread.start()
+
+    @property
+    def dropped(self):
+        return self.__dropped
+
+    def dispatch(self, *args):
+        with self.__condition:
+            if len(self.__pending) >= self.__size:
+                if self.__policy == "block":
+                    while len(self.__pending) >= self.__size:
+                        self.__condition.wait()
+                elif self.__policy == "drop_oldest":
+                    self.__pending.popleft()
+                    self.__dropped += 1
+                else:
+                    self.__dropped += len(self.__pending)
+                    self.__pending.clear()
+            self.__pending.append(args)
+            self.__condition.notify_all()
+
+    def flush(self):
+        # waits until all pending calls are delivered. It must not be called from the callback.
+        with self.__condition:
+            while len(self.__pending) > 0 or self.__running > 0:
+                self.__condition.wait()
+
+    def __dispatch_loop(self):
+        while True:
+            with self.__condition:
+                while len(self.__pending) == 0:
+                    self.__condition.wait()
+                args = self.__pending.popleft()
+                self.__running += 1
+                # a blocked dispatch can put the next call now.
+                self.__condition.notify_all()
+            try:
+                self.__callback(*args)
+            except Exception as e:
+                print("exception while calling the callback")
+                print(traceback.format_exc())
+            finally:
+                with self.__condition:
+                    self.__running -= 1
+                    self.__condition.notify_all()
@@ -0,0 +1,249 @@
+# We need to put ancenstor directory in sys.path to import utils and algorithm
+import os
+import sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+# start to import what we want.
+import json
+import time
+import random
+import argparse
+import platform
+import multiprocessing
+import pyopencl as cl
+import utils
+from ocl_ga import OpenCLGA
+from shuffler_chromosome import ShufflerChromosome
+from simple_chromosome import SimpleChromosome
+from simple_gene import SimpleGene
+from examples.taiwan_travel.taiwan_travel import read_all_cities
+try:
+    import resource
+except ImportError:
+    # the peak host memory isn't reported at Windows.
+    resource = None
+
+'''
+The end-to-end throughput benchmark of OpenCLGA. The simple_tsp, algebra_expansion and
+taiwan_travel workloads run headless across a grid of population sizes and gene counts at a CPU
+OpenCL device (pocl is preferred). Each case runs at a new process, so the compile time isn't
+shortened by a built program and the peak host memory belongs to the case. The results are written
+as JSON and compared with a baseline, e.g. the JSON of the last release:
+
+  $> python3 evaluation/benchmark/benchmark.py --output current.json --baseline baseline.json
+
+The compile time counts the build, the first population and a warm-up generation since pocl builds
+kernels at their first launch. The rates are measured by the statistics of the generations after
+the warm-up one.
+The exit status is 1 if any metric of a case is worse than the baseline beyond the tolerance.
+algebra_expansion always has 11 genes. At a CPU device the device buffers are at host memory, so
+they are counted by the peak host memory too.
+'''
+
+ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+OCL_KERNELS = os.path.join(ROOT, "kernel")
+WORKLOADS = ["simple_tsp", "algebra_expansion", "taiwan_travel"]
+# metric name : True if a larger value is better.
+METRICS = {"generations_per_second": True,
+           "evaluations_per_second": True,
+           "compile_seconds": False,
+           "peak_host_bytes": False,
+           "device_bytes": False}
+
+def find_cpu_device():
+    # Returns the platform and device indices of a CPU device, pocl is preferred.
+    found = None
+    for p_idx, plat in enumerate(cl.get_platforms()):
+        for d_idx, device in enumerate(plat.get_devices()):
+            if not device.type & cl.device_type.CPU:
+                continue
+            if "Portable Computing Language" in plat.name:
+                return p_idx, d_idx
+            if found is None:
+                found = (p_idx, d_idx)
+    assert found is not None, "no CPU OpenCL device"
+    return found
+
+def read_kernel(*path):
+    f = open(os.path.join(ROOT, *path), "r")
+    fstr = "".join(f.readlines())
+    f.close()
+    return fstr
+
+def simple_tsp_options(genes):
+    city_ids = list(range(genes))
+    xs = [random.random() * 100 for v in city_ids]
+    ys = [random.random() * 100 for v in city_ids]
+    distances, defines = utils.create_distance_table(xs, ys)
+    return {"sample_chromosome": ShufflerChromosome([SimpleGene(v, city_ids) for v in city_ids]),
+            "fitness_kernel_str": defines + read_kernel("examples", "tsp", "kernel",
+                                                        "simple_tsp.c"),
+            "fitness_func": "simple_tsp_table_fitness",
+            "fitness_args": [distances],
+            "opt_for_max": "min"}
+
+def algebra_expansion_options(genes):
+    value_ranges = [10, 20, 50, 150, 250, 300, 250, 150, 50, 20, 10]
+    return {"sample_chromosome": SimpleChromosome([SimpleGene(0, list(range(v)))
+                                                   for v in value_ranges]),
+            "fitness_kernel_str": read_kernel("examples", "algebra_expansion", "kernel",
+                                              "expansion.c"),
+            "fitness_func": "expansion_fitness",
+            "opt_for_max": "min"}
+
+def taiwan_travel_options(genes):
+    cities, city_info, city_infoX, city_infoY = read_all_cities(
+        "TW319_368Addresses-no-far-islands.json")
+    assert genes <= len(cities)
+    city_ids = list(range(genes))
+    sample = ShufflerChromosome([SimpleGene(v, cities) for v in city_ids])
+    sample.use_improving_only_mutation("tsp_table_swap_delta", delta=True)
+    sample.use_local_search("tsp_table_edge_distance")
+    distances, defines = utils.create_distance_table(city_infoX[:genes], city_infoY[:genes],
+                                                     spherical=True, packed=True)
+    return {"sample_chromosome": sample,
+            "fitness_kernel_str": defines + read_kernel("examples", "taiwan_travel", "kernel",
+                                                        "taiwan_fitness.c"),
+            "fitness_func": "taiwan_fitness",
+            "fitness_args": [distances],
+            "opt_for_max": "min"}
+
+def device_bytes():
+    # The total size of the live device buffers.
+    import gc
+    return sum(o.size for o in gc.get_objects() if isinstance(o, cl.MemoryObjectHolder))
+
+def run_case(case, device_indices, generations):
+    random.seed(119)
+    options = globals()[case["workload"] + "_options"](case["genes"])
+    device = cl.get_platforms()[device_indices[0]].get_devices()[device_indices[1]]
+    # the first generation is a warm-up, pocl builds the kernels lazily at their first launch.
+    options.update({"termination": {"type": "count", "count": generations + 1},
+                    "population": case["population"],
+                    "extra_include_path": [OCL_KERNELS],
+                    "device": device,
+                    "program_cache": False})
+    start = time.time()
+    ga = OpenCLGA(options)
+    ga.prepare()
+    setup_seconds = time.time() - start
+    ga.run(0.1, 0.8)
+    # the rates are measured by the generations after the warm-up one, which may be less than
+    # generations if the population is converged.
+    records = ga.get_statistics()
+    steady_generations = len(records) - 1
+    steady_seconds = float(records["elapsed"][-1] - records["elapsed"][0])
+    rated = steady_generations > 0 and steady_seconds > 0
+    result = dict(case)
+    result.update({"generations": steady_generations,
+                   # the build, the first population and the warm-up generation.
+                   "compile_seconds": setup_seconds + ga.elapsed_time - steady_seconds,
+                   "run_seconds": steady_seconds,
+                   "generations_per_second": steady_generations / steady_seconds if rated\
+                                             else None,
+                   "evaluations_per_second": case["population"] * steady_generations /\
+                                             steady_seconds if rated else None,
+                   "peak_host_bytes": None,
+                   "device_bytes": device_bytes(),
+                   "best_fitness": float(ga.get_the_best()[1])})
+    if resource is not None:
+        # ru_maxrss is in kilobytes at Linux and in bytes at macOS.
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        result["peak_host_bytes"] = peak if sys.platform == "darwin" else peak * 1024
+    return result
+
+def run_case_process(case, device_indices, generations):
+    # spawn gives each case a fresh process without the memory of the others.
+    ctx = multiprocessing.get_context("spawn")
+    with ctx.Pool(1) as pool:
+        return pool.apply(run_case, (case, device_indices, generations))
+
+def create_cases(workloads, populations, genes):
+    cases = []
+    for workload in workloads:
+        for population in populations:
+            for gene_count in ([11] if workload == "algebra_expansion" else genes):
+                cases.append({"workload": workload, "population": population,
+                              "genes": gene_count})
+    return cases
+
+def case_key(case):
+    return "%s/%d/%d"%(case["workload"], case["population"], case["genes"])
+
+def compare(results, baseline, tolerance):
+    # Returns the regressions of the cases which are in both results and baseline.
+    base_results = {case_key(r): r for r in baseline["results"]}
+    regressions = []
+    for result in results:
+        base = base_results.get(case_key(result))
+        if base is None:
+            continue
+        for metric, larger_is_better in METRICS.items():
+            if result[metric] is None or base.get(metric) is None or base[metric] == 0:
+                continue
+            change = (result[metric] - base[metric]) / float(base[metric])
+            if (larger_is_better and change < -tolerance) or\
+               (not larger_is_better and change > tolerance):
+                regressions.append({"case": case_key(result), "metric": metric,
+                                    "baseline": base[metric], "current": result[metric],
+                                    "change": change})
+    return regressions
+
+def format_rate(rate, fmt):
+    return "-" if rate is None else fmt%(rate,)
+
+def run(workloads, populations, genes, generations, output, baseline_path, tolerance):
+    # the kernel cache of pocl would hide the compile time, the processes of cases inherit it.
+    os.environ.setdefault("POCL_KERNEL_CACHE", "0")
+    device_indices = find_cpu_device()
+    device = cl.get_platforms()[device_indices[0]].get_devices()[device_indices[1]]
+    report = {"platform": device.platform.name,
+              "device": device.name,
+              "driver_version": device.driver_version,
+              "python": platform.python_version(),
+              "pyopencl": cl.VERSION_TEXT,
+              "generations": generations,
+              "results": []}
+    for case in create_cases(workloads, populations, genes):
+        result = run_case_process(case, device_indices, generations)
+        gen_rate = format_rate(result["generations_per_second"], "%.1f")
+        eval_rate = format_rate(result["evaluations_per_second"], "%.0f")
+        print("%s\t%s gen/s\t%s eval/s\tcompile %.2fs"%(case_key(case), gen_rate, eval_rate,
+                                                          result["compile_seconds"]))
+        report["results"].append(result)
+
+    if baseline_path is not None:
+        with open(baseline_path, "r") as f:
+            baseline = json.load(f)
+        report["baseline"] = baseline_path
+        report["tolerance"] = tolerance
+        report["regressions"] = compare(report["results"], baseline, tolerance)
+        for regression in report["regressions"]:
+            print("REGRESSION %s %s: %s => %s (%+.1f%%)"%(regression["case"],
+                                                        regression["metric"],
+                                                        regression["baseline"],
+                                                        regression["current"],
+                                                        regression["change"] * 100))
+
+    if output is not None:
+        with open(output, "w") as f:
+            json.dump(report, f, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
+    return report
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="End-to-end throughput benchmark of OpenCLGA.")
+    parser.add_argument("--workloads", nargs="+", choices=WORKLOADS, default=WORKLOADS)
+    parser.add_argument("--populations", nargs="+", type=int, default=[1000, 4000, 16000])
+    parser.add_argument("--genes", nargs="+", type=int, default=[20, 50, 100],
+                        help="gene counts of simple_tsp and taiwan_travel")
+    parser.add_argument("--generations", type=int, default=100)
+    parser.add_argument("--output", help="the JSON file of results, stdout by default")
+    parser.add_argument("--baseline", help="the JSON file of a previous run to compare with")
+    parser.add_argument("--tolerance", type=float, default=0.1,
+                        help="the allowed relative change of metrics (default 0.1)")
+    args = parser.parse_args()
+    report = run(args.workloads, args.populations, args.genes, args.generations, args.output,
+                 args.baseline, args.tolerance)
+    sys.exit(1 if len(report.get("regressions", [])) > 0 else 0)
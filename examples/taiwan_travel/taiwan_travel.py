@@ -114,11 +114,16 @@ def run(num_chromosomes, generations, ext_proc):
     fstr = "".join(f.readlines())
     f.close()
 
-    fstr = "#define TAIWAN_POINT_X {" + ", ".join([str(v) for v in city_infoX]) + "}\n" +\
-           "#define TAIWAN_POINT_Y {" + ", ".join([str(v) for v in city_infoY]) + "}\n" +\
-           fstr
-
-    sample.use_improving_only_mutation("improving_only_mutation_helper")
+    # The spherical distances between cities are computed once and looked up by the fitness
+    # function and the improving only mutation.
+    distances, defines = utils.create_distance_table(city_infoX, city_infoY, spherical=True,
+                                                     packed=True)
+    fstr = defines + fstr
+
+    # The improving only mutation searches the best swap by the changed edges of tours.
+    sample.use_improving_only_mutation("tsp_table_swap_delta", delta=True)
+    # The best 16 tours are improved by 2-opt and Or-opt every 10 generations.
+    sample.use_local_search("tsp_table_edge_distance")
     tsp_ga_cl = OpenCLGA({"sample_chromosome": sample,
                           "termination": {
                             "type": "time",
@@ -127,13 +132,14 @@ def run(num_chromosomes, generations, ext_proc):
                           "population": num_chromosomes,
                           "fitness_kernel_str": fstr,
                           "fitness_func": "taiwan_fitness",
+                          "fitness_args": [distances],
                           "extra_include_path": [ocl_kernels],
                           "opt_for_max": "min",
                           "generation_callback": show_generation_info})
 
-    if os.path.isfile(os.path.join(tsp_path, "test.pickle")):
-        print("test.pickle found, we will resume previous execution")
-        tsp_ga_cl.restore(os.path.join(tsp_path, "test.pickle"))
+    if os.path.isfile(os.path.join(tsp_path, "test.snapshot")):
+        print("test.snapshot found, we will resume previous execution")
+        tsp_ga_cl.restore(os.path.join(tsp_path, "test.snapshot"))
     else:
         tsp_ga_cl.prepare()
 
@@ -182,7 +188,7 @@ def run(num_chromosomes, generations, ext_proc):
                     ttt.start()
                 elif "s" == user_input:
                     print("saving ...")
-                    tsp_ga_cl.save(os.path.join(tsp_path, "test.pickle"))
+                    tsp_ga_cl.save(os.path.join(tsp_path, "test.snapshot"))
                 elif "x" == user_input:
                     print("force stop")
                     tsp_ga_cl.stop()
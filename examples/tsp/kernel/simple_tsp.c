@@ -1,8 +1,4 @@
-
-float calc_linear_distance(float x1, float y1, float x2, float y2)
-{
-  return sqrt(pown(x2 - x1, 2) + pown(y2 - y1, 2));
-}
+#include "tsp_fitness.c"
 
 void simple_tsp_fitness(global __ShufflerChromosome* chromosome,
                         global float* fitnesses,
@@ -24,3 +20,12 @@ void simple_tsp_fitness(global __ShufflerChromosome* chromosome,
                                 pointsY[chromosome->genes[chromosome_size - 1]]);
   *fitnesses = dist;
 }
+
+void simple_tsp_table_fitness(global __ShufflerChromosome* chromosome,
+                              global float* fitnesses,
+                              int chromosome_size,
+                              int chromosome_count,
+                              TSP_TABLE_SPACE tsp_table_t* distances)
+{
+  *fitnesses = tsp_table_tour_length(distances, chromosome->genes, chromosome_size);
+}
@@ -30,8 +30,9 @@ def run(num_chromosomes, generations):
     fstr = "".join(f.readlines())
     f.close()
 
-    pointX = [str(city_info[v][0]) for v in city_info];
-    pointY = [str(city_info[v][1]) for v in city_info]
+    # The distances between cities are computed once and looked up by the fitness function.
+    distances, defines = utils.create_distance_table([city_info[v][0] for v in city_ids],
+                                                     [city_info[v][1] for v in city_ids])
 
     tsp_ga_cl = OpenCLGA({"sample_chromosome": sample,
                           "termination": {
@@ -39,10 +40,9 @@ def run(num_chromosomes, generations):
                             "count": generations
                           },
                           "population": num_chromosomes,
-                          "fitness_kernel_str": fstr,
-                          "fitness_func": "simple_tsp_fitness",
-                          "fitness_args": [{"t": "float", "v": pointX, "n": "x"},
-                                           {"t": "float", "v": pointY, "n": "y"}],
+                          "fitness_kernel_str": defines + fstr,
+                          "fitness_func": "simple_tsp_table_fitness",
+                          "fitness_args": [distances],
                           "extra_include_path": [ocl_kernels],
                           "opt_for_max": "min",
                           "debug": True,
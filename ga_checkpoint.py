@@ -0,0 +1,103 @@
+import os
+from queue import Queue, Empty
+import threading
+import traceback
+import numpy
+import ga_snapshot
+
+class BackgroundCheckpointer():
+    # BackgroundCheckpointer writes snapshots of a running OpenCLGA by a background thread. The
+    # device buffers are copied to staging buffers at the GA queue, so the next generation only
+    # waits for a device-side copy. The staging buffers are read back by another queue and written
+    # to the snapshot file by the thread. There are two staging slots, a checkpoint is skipped if both
+    # of them are still being written.
+    # The snapshot is written to a temporary file and renamed, so a crash while writing keeps the
+    # last complete checkpoint.
+    def __init__(self, path, compress=False, ctx=None, slots=2):
+        self.__path = path
+        self.__compress = compress
+        self.__ctx = ctx
+        self.__read_queue = None
+        if ctx is not None:
+            import pyopencl as cl
+            self.__cl = cl
+            self.__read_queue = cl.CommandQueue(ctx)
+        self.__slots = [{} for i in range(slots)]
+        self.__free_slots = Queue()
+        for i in range(slots):
+            self.__free_slots.put(i)
+        self.__jobs = Queue()
+        self.__thread = threading.Thread(target=self.__write_loop)
+        self.__thread.daemon = True
+        self.__thread.start()
+
+    def __staging(self, slot, name, size, dtype, with_device):
+        # the staging memory of a slot is allocated at the first checkpoint and reused. It's
+        # reallocated if the size is changed, e.g. the statistics grow by generations.
+        staging = self.__slots[slot]
+        if name not in staging or staging[name][1].nbytes != size:
+            host = numpy.empty(size // numpy.dtype(dtype).itemsize, dtype=dtype)
+            dev = self.__cl.Buffer(self.__ctx, self.__cl.mem_flags.READ_WRITE, size)\
+                      if with_device else None
+            staging[name] = (dev, host)
+        return staging[name]
+
+    def __write_loop(self):
+        while True:
+            slot, values, arrays, events = self.__jobs.get()
+            try:
+                if len(events) > 0:
+                    self.__cl.wait_for_events(events)
+                tmp_path = self.__path + ".tmp"
+                ga_snapshot.write_snapshot(tmp_path, values, arrays, self.__compress)
+                os.replace(tmp_path, self.__path)
+            except Exception as e:
+                print("exception while writing checkpoint %s"%(self.__path))
+                print(traceback.format_exc())
+            finally:
+                self.__free_slots.put(slot)
+                self.__jobs.task_done()
+
+    def checkpoint_buffers(self, queue, values, buffers, wait_for=None, arrays=None):
+        # values - the JSON serializable values of the snapshot.
+        # buffers - a dict maps names to (device buffer, numpy dtype).
+        # arrays - a dict of host arrays which are staged as checkpoint_arrays.
+        # Returns False if the checkpoint is skipped.
+        try:
+            slot = self.__free_slots.get_nowait()
+        except Empty:
+            return False
+        cl = self.__cl
+        staged = self.__stage_arrays(slot, arrays if arrays is not None else {})
+        events = []
+        for name, (buf, dtype) in buffers.items():
+            dev, host = self.__staging(slot, name, buf.size, dtype, True)
+            evt = cl.enqueue_copy(queue, dev, buf, wait_for=wait_for)
+            events.append(cl.enqueue_copy(self.__read_queue, host, dev, wait_for=[evt],
+                                          is_blocking=False))
+            staged[name] = host
+        queue.flush()
+        self.__read_queue.flush()
+        self.__jobs.put((slot, values, staged, events))
+        return True
+
+    def checkpoint_arrays(self, values, arrays):
+        # The host arrays are copied to a staging slot before returning.
+        try:
+            slot = self.__free_slots.get_nowait()
+        except Empty:
+            return False
+        self.__jobs.put((slot, values, self.__stage_arrays(slot, arrays), []))
+        return True
+
+    def __stage_arrays(self, slot, arrays):
+        staged = {}
+        for name, array in arrays.items():
+            dev, host = self.__staging(slot, name, array.nbytes, array.dtype, False)
+            numpy.copyto(host.reshape(array.shape), array)
+            staged[name] = host.reshape(array.shape)
+        return staged
+
+    def flush(self):
+        # waits for all pending checkpoints.
+        self.__jobs.join()
@@ -0,0 +1,105 @@
+import json
+import zlib
+import numpy
+
+# The snapshot file of OpenCLGA.save. It is laid out as:
+#   magic (8 bytes) | version (uint32) | header size (uint32) | header (JSON) | sections
+# The header keeps the scalar values and the layout of array sections. Each section starts at a
+# multiple of ALIGNMENT, so an uncompressed one could be memory-mapped without copying. A compressed
+# section is stored by zlib with the narrowest integer type which keeps its values.
+
+MAGIC = b"OCLGASNP"
+VERSION = 1
+ALIGNMENT = 64
+PREFIX_SIZE = len(MAGIC) + 8
+
+def _align(size):
+    return (size + ALIGNMENT - 1) // ALIGNMENT * ALIGNMENT
+
+def _to_json(value):
+    # numpy scalars, e.g. the fitnesses in statistics.
+    if isinstance(value, numpy.integer):
+        return int(value)
+    if isinstance(value, numpy.floating):
+        return float(value)
+    raise TypeError("%s is not serializable"%(type(value)))
+
+def _from_json(pairs):
+    # JSON converts int keys, e.g. generation index of statistics, to str.
+    return {int(k) if k.lstrip("-").isdigit() else k: v for k, v in pairs}
+
+def _narrow(array):
+    if array.dtype.kind not in "iu" or array.size == 0:
+        return array
+    low, high = array.min(), array.max()
+    for t in [numpy.uint8, numpy.int8, numpy.uint16, numpy.int16, numpy.uint32, numpy.int32]:
+        info = numpy.iinfo(t)
+        if numpy.dtype(t).itemsize < array.itemsize and info.min <= low and high <= info.max:
+            return array.astype(t)
+    return array
+
+def is_snapshot(filename):
+    with open(filename, "rb") as f:
+        return f.read(len(MAGIC)) == MAGIC
+
+def write_snapshot(filename, values, arrays, compress=False):
+    # values - a dict of JSON serializable values.
+    # arrays - a dict of numpy arrays.
+    sections = {}
+    payloads = []
+    offset = 0
+    for name, array in arrays.items():
+        array = numpy.ascontiguousarray(array)
+        section = {"dtype": array.dtype.str, "shape": list(array.shape), "offset": offset}
+        if array.dtype.names is not None:
+            # the fields of structured arrays, e.g. the statistics, aren't kept by dtype.str.
+            section["descr"] = array.dtype.descr
+        if compress:
+            narrowed = _narrow(array)
+            payload = zlib.compress(narrowed.tobytes())
+            section["stored_dtype"] = narrowed.dtype.str
+            section["compression"] = "zlib"
+        else:
+            payload = array
+        section["size"] = len(payload) if compress else array.nbytes
+        sections[name] = section
+        payloads.append(payload)
+        offset = _align(offset + section["size"])
+
+    header = json.dumps({"values": values, "sections": sections}, default=_to_json).encode("utf-8")
+    data_start = _align(PREFIX_SIZE + len(header))
+    with open(filename, "wb") as f:
+        f.write(MAGIC)
+        f.write(numpy.array([VERSION, len(header)], dtype="<u4").tobytes())
+        f.write(header)
+        for name, payload in zip(sections.keys(), payloads):
+            f.seek(data_start + sections[name]["offset"])
+            f.write(payload if isinstance(payload, bytes) else memoryview(payload).cast("B"))
+        f.truncate(data_start + offset)
+
+def read_snapshot(filename):
+    # Returns the values and arrays. The uncompressed arrays are read-only memory maps of the file.
+    with open(filename, "rb") as f:
+        assert f.read(len(MAGIC)) == MAGIC, "%s isn't a snapshot"%(filename)
+        version, header_size = numpy.frombuffer(f.read(8), dtype="<u4")
+        assert version <= VERSION, "unsupported snapshot version %d"%(version)
+        header = json.loads(f.read(int(header_size)).decode("utf-8"), object_pairs_hook=_from_json)
+        data_start = _align(PREFIX_SIZE + int(header_size))
+        arrays = {}
+        for name, section in header["sections"].items():
+            dtype = numpy.dtype([tuple(field) for field in section["descr"]])\
+                        if "descr" in section else numpy.dtype(section["dtype"])
+            shape = tuple(section["shape"])
+            if "compression" in section:
+                f.seek(data_start + section["offset"])
+                stored_dtype = dtype if "descr" in section\
+                                     else numpy.dtype(section["stored_dtype"])
+                stored = numpy.frombuffer(zlib.decompress(f.read(section["size"])),
+                                          dtype=stored_dtype)
+                arrays[name] = stored.astype(dtype).reshape(shape)
+            elif section["size"] == 0:
+                arrays[name] = numpy.zeros(shape, dtype=dtype)
+            else:
+                arrays[name] = numpy.memmap(filename, dtype=dtype, mode="r",
+                                            offset=data_start + section["offset"], shape=shape)
+    return header["values"], arrays
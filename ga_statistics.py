@@ -0,0 +1,123 @@
+import numpy
+
+# The statistics of OpenCLGA are recorded as a structured array, a record per generation. The
+# device writes best, worst, avg, std and diversity of a generation to a ring buffer, see
+# ocl_ga_statistics of ocl_ga.c, and they are drained to the array in bulk.
+# generation - the generation index.
+# std - the standard deviation of fitnesses.
+# diversity - the mean fraction of genes which differ from the best chromosome, it's NaN if it
+#             isn't enabled by the "statistics_diversity" option.
+# elapsed - the evolution time in seconds when the record is drained.
+DTYPE = numpy.dtype([("generation", "<i8"),
+                     ("best", "<f4"),
+                     ("worst", "<f4"),
+                     ("avg", "<f4"),
+                     ("std", "<f4"),
+                     ("diversity", "<f4"),
+                     ("elapsed", "<f8")])
+
+# The fields of a record at the device ring buffer, in order.
+DEVICE_FIELDS = ["best", "worst", "avg", "std", "diversity"]
+
+# The population is converged if the difference of best and worst fitnesses is less than it.
+CONVERGED_EPSILON = 0.0001
+
+def converged(record):
+    return abs(record["worst"] - record["best"]) < CONVERGED_EPSILON
+
+def calculate(chromosomes, fitnesses, opt_for_max, with_diversity):
+    # The counterpart of ocl_ga_statistics for the numpy backend, chromosomes is a 2D array.
+    # Returns the values of DEVICE_FIELDS.
+    best_index = numpy.argmax(fitnesses) if opt_for_max else numpy.argmin(fitnesses)
+    worst = fitnesses.min() if opt_for_max else fitnesses.max()
+    diversity = numpy.nan
+    if with_diversity:
+        diversity = numpy.mean(chromosomes != chromosomes[best_index])
+    return numpy.array([fitnesses[best_index], worst, fitnesses.mean(), fitnesses.std(),
+                        diversity], dtype=numpy.float32)
+
+def record_to_dict(record):
+    # The statistics of a generation which is passed to generation_callback.
+    return {name: record[name] for name in DEVICE_FIELDS}
+
+def avg_time_per_gen(records):
+    if len(records) == 0:
+        return 0
+    return float(records["elapsed"][-1]) / (int(records["generation"][-1]) + 1)
+
+def to_dict(records):
+    # Converts the records to the dict of older versions, {generation: {"best", "worst", "avg"},
+    # "avg_time_per_gen": seconds}.
+    statistics = {int(record["generation"]): {"best": record["best"],
+                                              "worst": record["worst"],
+                                              "avg": record["avg"]} for record in records}
+    if len(records) > 0:
+        statistics["avg_time_per_gen"] = avg_time_per_gen(records)
+    return statistics
+
+def from_dict(statistics):
+    # Converts the dict of older versions, e.g. the statistics of legacy snapshots, to records.
+    # std and diversity are unknown.
+    generations = sorted(k for k in statistics.keys() if k != "avg_time_per_gen")
+    records = numpy.zeros(len(generations), dtype=DTYPE)
+    for i, generation in enumerate(generations):
+        records[i]["generation"] = generation
+        for name in ["best", "worst", "avg"]:
+            records[i][name] = statistics[generation][name]
+    records["std"] = numpy.nan
+    records["diversity"] = numpy.nan
+    if "avg_time_per_gen" in statistics:
+        records["elapsed"] = (records["generation"] + 1) * statistics["avg_time_per_gen"]
+    return records
+
+class GAStatistics():
+    # GAStatistics keeps the records in a preallocated array which grows by doubling. If path is
+    # given, the records are streamed to the file as raw DTYPE records instead, and records is a
+    # read-only memory map of it. The file can be read by numpy.fromfile(path, dtype=DTYPE).
+    def __init__(self, path=None, capacity=1024):
+        self.__path = path
+        self.__size = 0
+        self.__records = numpy.zeros(0 if path is not None else capacity, dtype=DTYPE)
+        if path is not None:
+            open(path, "wb").close()
+
+    @property
+    def records(self):
+        if self.__path is None:
+            return self.__records[:self.__size]
+        if self.__size == 0:
+            return numpy.zeros(0, dtype=DTYPE)
+        return numpy.memmap(self.__path, dtype=DTYPE, mode="r", shape=(self.__size,))
+
+    def append(self, generations, values, elapsed):
+        # generations - the generation indices of records.
+        # values - a 2D array of DEVICE_FIELDS of records.
+        # Returns the appended records.
+        records = numpy.zeros(len(generations), dtype=DTYPE)
+        records["generation"] = generations
+        for i, name in enumerate(DEVICE_FIELDS):
+            records[name] = values[:, i]
+        records["elapsed"] = elapsed
+        self.__write(records)
+        return records
+
+    def reset(self, records):
+        # Replaces all records, e.g. by the ones of a snapshot.
+        self.__size = 0
+        if self.__path is not None:
+            open(self.__path, "wb").close()
+        self.__write(numpy.asarray(records, dtype=DTYPE))
+
+    def __write(self, records):
+        if self.__path is not None:
+            with open(self.__path, "ab") as f:
+                f.write(records.tobytes())
+            self.__size += len(records)
+            return
+        size = self.__size + len(records)
+        if size > len(self.__records):
+            grown = numpy.zeros(max(size, 2 * len(self.__records)), dtype=DTYPE)
+            grown[:self.__size] = self.__records[:self.__size]
+            self.__records = grown
+        self.__records[self.__size:size] = records
+        self.__size = size
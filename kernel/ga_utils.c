@@ -1,7 +1,55 @@
 #ifndef __ga_utils__
 #define __ga_utils__
 
-#include "Noise.cl"
+// The random numbers are generated by Philox4x32-10, a counter-based RNG (Salmon et al., "Parallel
+// random numbers: as easy as 1, 2, 3"). A work-item keys it by the seed of OpenCLGA and counts by
+// (chromosome, generation, stream, n), so there is no state kept at global memory and a run is
+// reproducible from the seed. Each kernel uses its own stream to get independent numbers for the
+// same chromosome and generation.
+#define GA_RAND_STREAM_POPULATE 0
+#define GA_RAND_STREAM_PICK 1
+#define GA_RAND_STREAM_CROSSOVER 2
+#define GA_RAND_STREAM_MUTATE 3
+#define GA_RAND_STREAM_ISLAND 4
+
+#define GA_PHILOX_M0 0xD2511F53u
+#define GA_PHILOX_M1 0xCD9E8D57u
+#define GA_PHILOX_W0 0x9E3779B9u
+#define GA_PHILOX_W1 0xBB67AE85u
+
+typedef struct {
+  uint key[2];
+  uint counter[4];
+  // the 4 numbers of the last block and the number of used ones.
+  uint output[4];
+  uint used;
+} ga_rand;
+
+void ga_philox4x32_10(uint* counter, uint* key, uint* output)
+{
+  uint c0 = counter[0];
+  uint c1 = counter[1];
+  uint c2 = counter[2];
+  uint c3 = counter[3];
+  uint k0 = key[0];
+  uint k1 = key[1];
+  for (int round = 0; round < 10; round++) {
+    uint hi0 = mul_hi(GA_PHILOX_M0, c0);
+    uint lo0 = GA_PHILOX_M0 * c0;
+    uint hi1 = mul_hi(GA_PHILOX_M1, c2);
+    uint lo1 = GA_PHILOX_M1 * c2;
+    c0 = hi1 ^ c1 ^ k0;
+    c1 = lo1;
+    c2 = hi0 ^ c3 ^ k1;
+    c3 = lo0;
+    k0 += GA_PHILOX_W0;
+    k1 += GA_PHILOX_W1;
+  }
+  output[0] = c0;
+  output[1] = c1;
+  output[2] = c2;
+  output[3] = c3;
+}
 
 void print_chromosomes(global int* chromosomes, int size_of_chromosome,
                        int num_of_chromosomes, global float* fitnesses)
@@ -30,6 +78,14 @@ void chromosome_swap(int idx, global int* chromosomes, int chromosome_size,
   chromosomes[c1+p1] = temp_p;
 }
 
+// Copies count elements of type T from the global src to the local dst by all work-items of a
+// work-group. It's used by FITNESS_PRELOAD for the fitness arguments placed at local memory, a
+// barrier must follow it before reading dst.
+#define GA_PRELOAD_LOCAL(T, dst, src, count)                                  \
+  for (int _i = get_local_id(0); _i < (count); _i += get_local_size(0)) {     \
+    ((local T*)(dst))[_i] = ((global T*)(src))[_i];                           \
+  }
+
 void calc_min_max_fitness(global float* fitnesses, int num_of_chromosomes, float* min, float* max)
 {
   for (int i = 0; i < num_of_chromosomes; i++) {
@@ -38,28 +94,29 @@ void calc_min_max_fitness(global float* fitnesses, int num_of_chromosomes, float
   }
 }
 
-// holder - A lenght 1 array which stores the last rand value.
+// holder - The state of a work-item which is initialized by init_rand.
 // Returns a random uint value.
-uint rand(uint* holder)
+uint rand(ga_rand* holder)
 {
-  uint b = ParallelRNG(holder[0]);
-  uint c = ParallelRNG2(b, holder[0]);
-  uint d = ParallelRNG3(c, b, holder[0]);
-  holder[0] = c;
-  return d;
+  if (holder->used == 4) {
+    ga_philox4x32_10(holder->counter, holder->key, holder->output);
+    holder->counter[3]++;
+    holder->used = 0;
+  }
+  return holder->output[holder->used++];
 }
 
-// holder - A lenght 1 array which stores the last rand value.
+// holder - The state of a work-item which is initialized by init_rand.
 // Returns a random uint value in the range.
-uint rand_range(uint* holder, uint range)
+uint rand_range(ga_rand* holder, uint range)
 {
   uint r = rand(holder) % range;
   return r;
 }
 
-// holder - A lenght 1 array which stores the last rand value.
+// holder - The state of a work-item which is initialized by init_rand.
 // Returns a random uint value in the range except aExcluded.
-uint rand_range_exclude(uint* holder, uint range, uint aExcluded)
+uint rand_range_exclude(ga_rand* holder, uint range, uint aExcluded)
 {
   uint r = rand(holder) % range;
   while (r == aExcluded) {
@@ -68,24 +125,33 @@ uint rand_range_exclude(uint* holder, uint range, uint aExcluded)
   return r;
 }
 
-// holder - A lenght 1 array which stores the last rand value.
+// holder - The state of a work-item which is initialized by init_rand.
 // Returns a random float value from 0.0~1.0
-float rand_prob(uint* holder)
+float rand_prob(ga_rand* holder)
 {
   uint r = rand(holder);
   float p = r / (float)UINT_MAX;
   return p;
 }
 
-// idx - global id
-// holder - A lenght 1 array which stores the last rand value.
-void init_rand(int idx, uint* holder)
+// seed - The seed of OpenCLGA.
+// generation - The generation index.
+// idx - The chromosome index, usually the global id.
+// stream - One of GA_RAND_STREAM_*.
+// holder - The state of a work-item.
+void init_rand(ulong seed, int generation, int idx, uint stream, ga_rand* holder)
 {
-  holder[0] = ParallelRNG(idx);
+  holder->key[0] = (uint)seed;
+  holder->key[1] = (uint)(seed >> 32);
+  holder->counter[0] = idx;
+  holder->counter[1] = generation;
+  holder->counter[2] = stream;
+  holder->counter[3] = 0;
+  holder->used = 4;
 }
 
 
-int random_choose_by_ratio(global float* ratio, uint* ra, int population)
+int random_choose_by_ratio(global float* ratio, ga_rand* ra, int population)
 {
 
   // generate a random number from between 0 and 1
@@ -102,40 +168,198 @@ int random_choose_by_ratio(global float* ratio, uint* ra, int population)
   return population - 1;
 }
 
-void utils_calc_ratio(global float* fitness,
-                      global float* ratio,
-                      global float* best,
-                      global float* worst,
-                      global float* avg,
-                      int idx,
-                      int population)
+// Reduces min, max and sum of the values at local memory by a tree reduction. The local size must
+// be a power of 2. The results are stored at the first element of l_min, l_max and l_sum.
+void utils_local_reduce_min_max_sum(local float* l_min, local float* l_max, local float* l_sum)
+{
+  int lid = get_local_id(0);
+  for (int stride = get_local_size(0) / 2; stride > 0; stride >>= 1) {
+    if (lid < stride) {
+      l_min[lid] = fmin(l_min[lid], l_min[lid + stride]);
+      l_max[lid] = fmax(l_max[lid], l_max[lid + stride]);
+      l_sum[lid] += l_sum[lid + stride];
+    }
+    barrier(CLK_LOCAL_MEM_FENCE);
+  }
+}
+
+// The first pass of ratio calculation. Each work-group reduces a part of fitnesses to the min, max
+// and sum and stores them at partials[group_id * 3 + 0~2]. A work-item handles more than one
+// fitness when the global size is smaller than the population.
+void utils_calc_ratio_partial(global float* fitness,
+                              global float* partials,
+                              local float* l_min,
+                              local float* l_max,
+                              local float* l_sum,
+                              int population)
+{
+  int lid = get_local_id(0);
+  float v_min = INFINITY;
+  float v_max = -INFINITY;
+  float v_sum = 0;
+  for (int i = get_global_id(0); i < population; i += get_global_size(0)) {
+    v_min = fmin(v_min, fitness[i]);
+    v_max = fmax(v_max, fitness[i]);
+    v_sum += fitness[i];
+  }
+  l_min[lid] = v_min;
+  l_max[lid] = v_max;
+  l_sum[lid] = v_sum;
+  barrier(CLK_LOCAL_MEM_FENCE);
+  utils_local_reduce_min_max_sum(l_min, l_max, l_sum);
+  if (lid == 0) {
+    int group = get_group_id(0);
+    partials[group * 3] = l_min[0];
+    partials[group * 3 + 1] = l_max[0];
+    partials[group * 3 + 2] = l_sum[0];
+  }
+}
+
+// The second pass of ratio calculation which is executed by a single work-group. It merges the
+// partial results to best, worst and avg and then calculates the total of squared differences to
+// the worst one for normalizing ratios.
+void utils_calc_ratio_final(global float* fitness,
+                            global float* partials,
+                            int num_of_partials,
+                            global float* best,
+                            global float* worst,
+                            global float* avg,
+                            global float* diff_total,
+                            local float* l_min,
+                            local float* l_max,
+                            local float* l_sum,
+                            int population)
 {
-  float local_min = INT_MAX;
-  float local_max = 0;
+  int lid = get_local_id(0);
+  int lsize = get_local_size(0);
+  float v_min = INFINITY;
+  float v_max = -INFINITY;
+  float v_sum = 0;
+  for (int i = lid; i < num_of_partials; i += lsize) {
+    v_min = fmin(v_min, partials[i * 3]);
+    v_max = fmax(v_max, partials[i * 3 + 1]);
+    v_sum += partials[i * 3 + 2];
+  }
+  l_min[lid] = v_min;
+  l_max[lid] = v_max;
+  l_sum[lid] = v_sum;
+  barrier(CLK_LOCAL_MEM_FENCE);
+  utils_local_reduce_min_max_sum(l_min, l_max, l_sum);
+
 #if OPTIMIZATION_FOR_MAX
-  calc_min_max_fitness(fitness, population, &local_max, &local_min);
-  *best = local_max;
-  *worst = local_min;
+  float temp_best = l_max[0];
+  float temp_worst = l_min[0];
 #else
-  calc_min_max_fitness(fitness, population, &local_min, &local_max);
-  *best = local_min;
-  *worst = local_max;
+  float temp_best = l_min[0];
+  float temp_worst = l_max[0];
 #endif
+  float temp_avg = l_sum[0] / population;
+  // all work-items read the reduced values before l_sum is reused.
+  barrier(CLK_LOCAL_MEM_FENCE);
 
+  float diff = 0;
+  for (int i = lid; i < population; i += lsize) {
+    diff += (temp_worst - fitness[i]) * (temp_worst - fitness[i]);
+  }
+  l_sum[lid] = diff;
+  barrier(CLK_LOCAL_MEM_FENCE);
+  for (int stride = lsize / 2; stride > 0; stride >>= 1) {
+    if (lid < stride) {
+      l_sum[lid] += l_sum[lid + stride];
+    }
+    barrier(CLK_LOCAL_MEM_FENCE);
+  }
+
+  if (lid == 0) {
+    *best = temp_best;
+    *worst = temp_worst;
+    *avg = temp_avg;
+    *diff_total = l_sum[0];
+  }
+}
+
+// Inclusive scan of the values at local memory (Hillis-Steele). It works for any local size.
+void utils_local_inclusive_scan(local float* l_data)
+{
+  int lid = get_local_id(0);
+  for (int offset = 1; offset < get_local_size(0); offset <<= 1) {
+    float v = lid >= offset ? l_data[lid - offset] : 0;
+    barrier(CLK_LOCAL_MEM_FENCE);
+    l_data[lid] += v;
+    barrier(CLK_LOCAL_MEM_FENCE);
+  }
+}
+
+// The third pass of ratio calculation which is executed by a work-item per chromosome. Each
+// work-item normalizes the ratio of a chromosome and the work-group scans them to the cumulative
+// ratios inside the group. The total of the work-group is stored at group_sums for the next pass.
+void utils_calc_ratio_scan(global float* fitness,
+                           global float* cumulative,
+                           global float* group_sums,
+                           global float* worst,
+                           global float* diff_total,
+                           local float* l_data,
+                           int population)
+{
+  int idx = get_global_id(0);
+  int lid = get_local_id(0);
   float temp_worst = *worst;
-  float diffTotal = 0;
-  float avg_local = 0;
-  int i;
-  // we use total and diff to calculate the probability for each chromosome
-  for (i = 0; i < population; i++) {
-    diffTotal += (temp_worst - fitness[i]) * (temp_worst - fitness[i]);
-    avg_local += fitness[i] / population;
+  // padding work-items must join the barriers, they contribute nothing to the scan.
+  l_data[lid] = idx < population ? (temp_worst - fitness[idx]) * (temp_worst - fitness[idx]) /
+                                   *diff_total
+                                 : 0;
+  barrier(CLK_LOCAL_MEM_FENCE);
+  utils_local_inclusive_scan(l_data);
+  if (idx < population) {
+    cumulative[idx] = l_data[lid];
   }
-  // calculate probability for each one
-  for (i = 0; i < population; i++) {
-    ratio[i] = (temp_worst - fitness[i]) * (temp_worst - fitness[i]) / diffTotal;
+  if (lid == get_local_size(0) - 1) {
+    group_sums[get_group_id(0)] = l_data[lid];
+  }
+}
+
+// The fourth pass of ratio calculation which is executed by a single work-group. It replaces the
+// group sums with their exclusive prefix sums. Each work-item handles a contiguous chunk of them
+// when there are more groups than work-items.
+void utils_scan_group_sums(global float* group_sums, int num_of_groups, local float* l_data)
+{
+  int lid = get_local_id(0);
+  int chunk = (num_of_groups + get_local_size(0) - 1) / get_local_size(0);
+  int start = min(lid * chunk, num_of_groups);
+  int end = min(start + chunk, num_of_groups);
+  float total = 0;
+  for (int i = start; i < end; i++) {
+    total += group_sums[i];
+  }
+  l_data[lid] = total;
+  barrier(CLK_LOCAL_MEM_FENCE);
+  utils_local_inclusive_scan(l_data);
+  float offset = l_data[lid] - total;
+  for (int i = start; i < end; i++) {
+    float v = group_sums[i];
+    group_sums[i] = offset;
+    offset += v;
+  }
+}
+
+// Returns the index of the first cumulative ratio which is larger than a random number. This is
+// the binary search version of random_choose_by_ratio.
+int random_choose_by_cumulative_ratio(global float* cumulative, ga_rand* ra, int population)
+{
+  // generate a random number from between 0 and the total ratio which may be a little bit
+  // different from 1 because of rounding.
+  float rand_choose = rand_prob(ra) * cumulative[population - 1];
+  int low = 0;
+  int high = population - 1;
+  while (low < high) {
+    int mid = (low + high) / 2;
+    if (cumulative[mid] > rand_choose) {
+      high = mid;
+    } else {
+      low = mid + 1;
+    }
   }
-  *avg = avg_local;
+  return low;
 }
 
 #endif
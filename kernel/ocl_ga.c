@@ -1,8 +1,10 @@
 #include "ga_utils.c"
 
-__kernel void ocl_ga_calculate_fitness(global int* chromosomes,
-                                       global float* fitness FITNESS_ARGS)
+__kernel void ocl_ga_calculate_fitness(global GENE_TYPE* chromosomes,
+                                       global float* fitness FITNESS_KERNEL_ARGS)
 {
+  // the fitness arguments at local memory are loaded before any work-item returns.
+  FITNESS_PRELOAD
   int idx = get_global_id(0);
   // out of bound kernel task for padding
   if (idx >= POPULATION_SIZE) {
@@ -11,3 +13,186 @@ __kernel void ocl_ga_calculate_fitness(global int* chromosomes,
   CALCULATE_FITNESS(((global CHROMOSOME_TYPE*) chromosomes) + idx, fitness + idx,
                     CHROMOSOME_SIZE, POPULATION_SIZE FITNESS_ARGV);
 }
+
+// The maximal k of ocl_ga_top_k, OpenCLGA reads the whole population back for a larger one.
+#define OCL_GA_TOP_K_MAX 64
+
+#if OPTIMIZATION_FOR_MAX
+#define OCL_GA_BETTER(a, b) ((a) > (b))
+#else
+#define OCL_GA_BETTER(a, b) ((a) < (b))
+#endif
+
+// Inserts the chromosome index with fitness into the sorted top list of size entries, at most k
+// entries are kept. Returns the new size of the list.
+int ocl_ga_top_k_insert(float* top_fitness, int* top_index, int size, int k,
+                        float fitness, int index)
+{
+  if (size == k && !OCL_GA_BETTER(fitness, top_fitness[k - 1])) {
+    return size;
+  }
+  int i = size < k ? size : k - 1;
+  while (i > 0 && OCL_GA_BETTER(fitness, top_fitness[i - 1])) {
+    top_fitness[i] = top_fitness[i - 1];
+    top_index[i] = top_index[i - 1];
+    i--;
+  }
+  top_fitness[i] = fitness;
+  top_index[i] = index;
+  return size < k ? size + 1 : k;
+}
+
+// A single work-group selects the best k chromosomes from the best one. Each work-item keeps the
+// top k of a stride of the population, then the sorted lists are merged in pairs at local memory.
+// The k chromosomes and fitnesses are copied to top_chromosomes and top_fitnesses, so only they
+// are read back. l_fitness and l_index hold k entries per work-item, an unused one is -1.
+__kernel void ocl_ga_top_k(global GENE_TYPE* chromosomes,
+                           global float* fitness,
+                           global GENE_TYPE* top_chromosomes,
+                           global float* top_fitnesses,
+                           int k,
+                           local float* l_fitness,
+                           local int* l_index)
+{
+  int lid = get_local_id(0);
+  int local_size = get_local_size(0);
+  float top_fitness[OCL_GA_TOP_K_MAX];
+  int top_index[OCL_GA_TOP_K_MAX];
+  int size = 0;
+  int i;
+  for (i = lid; i < POPULATION_SIZE; i += local_size) {
+    size = ocl_ga_top_k_insert(top_fitness, top_index, size, k, fitness[i], i);
+  }
+  for (i = 0; i < k; i++) {
+    l_fitness[lid * k + i] = i < size ? top_fitness[i] : 0.0f;
+    l_index[lid * k + i] = i < size ? top_index[i] : -1;
+  }
+  barrier(CLK_LOCAL_MEM_FENCE);
+
+  for (int stride = 1; stride < local_size; stride *= 2) {
+    if (lid % (2 * stride) == 0 && lid + stride < local_size) {
+      int a = lid * k;
+      int b = (lid + stride) * k;
+      int a_end = a + k;
+      int b_end = b + k;
+      for (i = 0; i < k; i++) {
+        int take_a = b == b_end || l_index[b] < 0 ||
+                     (a < a_end && l_index[a] >= 0 && !OCL_GA_BETTER(l_fitness[b], l_fitness[a]));
+        if (take_a && a < a_end && l_index[a] >= 0) {
+          top_fitness[i] = l_fitness[a];
+          top_index[i] = l_index[a++];
+        } else if (!take_a) {
+          top_fitness[i] = l_fitness[b];
+          top_index[i] = l_index[b++];
+        } else {
+          top_index[i] = -1;
+        }
+      }
+      for (i = 0; i < k; i++) {
+        l_fitness[lid * k + i] = top_fitness[i];
+        l_index[lid * k + i] = top_index[i];
+      }
+    }
+    barrier(CLK_LOCAL_MEM_FENCE);
+  }
+
+  for (i = lid; i < k; i += local_size) {
+    top_fitnesses[i] = l_fitness[i];
+    ((global CHROMOSOME_TYPE*) top_chromosomes)[i] =
+        ((global CHROMOSOME_TYPE*) chromosomes)[l_index[i]];
+  }
+}
+
+// The number of floats of a record at the ring buffer of ocl_ga_statistics, they are best, worst,
+// avg, std and diversity, see ga_statistics.py.
+#define OCL_GA_STATISTICS_FIELDS 5
+
+// A single work-group calculates the statistics of the population and writes them to the slot of
+// the ring buffer, the local size must be a power of 2. The diversity is the mean fraction of
+// genes which differ from the best chromosome, it's only calculated if with_diversity is 1.
+__kernel void ocl_ga_statistics(global GENE_TYPE* chromosomes,
+                                global float* fitness,
+                                global float* ring,
+                                int slot,
+                                int with_diversity,
+                                local float* l_best,
+                                local float* l_worst,
+                                local float* l_sum,
+                                local int* l_index)
+{
+  int lid = get_local_id(0);
+  int local_size = get_local_size(0);
+  int i;
+  int s;
+  float best = fitness[0];
+  float worst = fitness[0];
+  float sum = 0.0f;
+  int best_index = 0;
+  for (i = lid; i < POPULATION_SIZE; i += local_size) {
+    float f = fitness[i];
+    if (OCL_GA_BETTER(f, best)) {
+      best = f;
+      best_index = i;
+    }
+    if (OCL_GA_BETTER(worst, f)) {
+      worst = f;
+    }
+    sum += f;
+  }
+  l_best[lid] = best;
+  l_worst[lid] = worst;
+  l_sum[lid] = sum;
+  l_index[lid] = best_index;
+  barrier(CLK_LOCAL_MEM_FENCE);
+  for (s = local_size / 2; s > 0; s >>= 1) {
+    if (lid < s) {
+      if (OCL_GA_BETTER(l_best[lid + s], l_best[lid])) {
+        l_best[lid] = l_best[lid + s];
+        l_index[lid] = l_index[lid + s];
+      }
+      if (OCL_GA_BETTER(l_worst[lid], l_worst[lid + s])) {
+        l_worst[lid] = l_worst[lid + s];
+      }
+      l_sum[lid] += l_sum[lid + s];
+    }
+    barrier(CLK_LOCAL_MEM_FENCE);
+  }
+  best = l_best[0];
+  worst = l_worst[0];
+  best_index = l_index[0];
+  float avg = l_sum[0] / POPULATION_SIZE;
+  barrier(CLK_LOCAL_MEM_FENCE);
+
+  // the second pass sums the squared deviations and the different genes, l_best and l_sum are
+  // reused for them.
+  global CHROMOSOME_TYPE* cs = (global CHROMOSOME_TYPE*) chromosomes;
+  float deviation = 0.0f;
+  float differences = 0.0f;
+  for (i = lid; i < POPULATION_SIZE; i += local_size) {
+    float d = fitness[i] - avg;
+    deviation += d * d;
+    if (with_diversity) {
+      for (int g = 0; g < CHROMOSOME_SIZE; g++) {
+        differences += cs[i].genes[g] != cs[best_index].genes[g];
+      }
+    }
+  }
+  l_sum[lid] = deviation;
+  l_best[lid] = differences;
+  barrier(CLK_LOCAL_MEM_FENCE);
+  for (s = local_size / 2; s > 0; s >>= 1) {
+    if (lid < s) {
+      l_sum[lid] += l_sum[lid + s];
+      l_best[lid] += l_best[lid + s];
+    }
+    barrier(CLK_LOCAL_MEM_FENCE);
+  }
+  if (lid == 0) {
+    global float* record = ring + slot * OCL_GA_STATISTICS_FIELDS;
+    record[0] = best;
+    record[1] = worst;
+    record[2] = avg;
+    record[3] = sqrt(l_sum[0] / POPULATION_SIZE);
+    record[4] = with_diversity ? l_best[0] / ((float)POPULATION_SIZE * CHROMOSOME_SIZE) : NAN;
+  }
+}
@@ -4,7 +4,7 @@
 #include "ga_utils.c"
 
 typedef struct {
-  int genes[SHUFFLER_CHROMOSOME_GENE_SIZE];
+  GENE_TYPE genes[SHUFFLER_CHROMOSOME_GENE_SIZE];
 } __ShufflerChromosome;
 
 void shuffler_chromosome_check_duplicate(global __ShufflerChromosome* chromosome) {
@@ -19,7 +19,8 @@ void shuffler_chromosome_check_duplicate(global __ShufflerChromosome* chromosome
 }
 
 // functions for populate
-void shuffler_chromosome_do_populate(global __ShufflerChromosome* chromosome, uint* rand_holder) {
+void shuffler_chromosome_do_populate(global __ShufflerChromosome* chromosome,
+                                     ga_rand* rand_holder) {
   int gene_elements[] = SIMPLE_GENE_ELEMENTS;
   int rndIdx;
   for (int i = 0; i < SHUFFLER_CHROMOSOME_GENE_SIZE - 1; i++) {
@@ -30,17 +31,16 @@ void shuffler_chromosome_do_populate(global __ShufflerChromosome* chromosome, ui
   chromosome->genes[SHUFFLER_CHROMOSOME_GENE_SIZE - 1] = gene_elements[0];
 }
 
-__kernel void shuffler_chromosome_populate(global int* chromosomes, global uint* input_rand) {
+__kernel void shuffler_chromosome_populate(global GENE_TYPE* chromosomes, ulong seed) {
   int idx = get_global_id(0);
   // out of bound kernel task for padding
   if (idx >= POPULATION_SIZE) {
     return;
   }
   // create a private variable for each kernel to hold randome number.
-  uint ra[1];
-  init_rand(input_rand[idx], ra);
+  ga_rand ra[1];
+  init_rand(seed, 0, idx, GA_RAND_STREAM_POPULATE, ra);
   shuffler_chromosome_do_populate(((global CHROMOSOME_TYPE*) chromosomes) + idx, ra);
-  input_rand[idx] = ra[0];
 }
 
 // functions for mutation
@@ -51,94 +51,172 @@ void shuffler_chromosome_swap(global __ShufflerChromosome* chromosome, int cp, i
   chromosome->genes[p1] = temp_p;
 }
 
-int shuffler_chromosome_dummy_improving_func(global int* chromosome,
+int shuffler_chromosome_dummy_improving_func(global GENE_TYPE* chromosome,
                                              int idx,
-                                             int chromosome_size)
+                                             int chromosome_size FITNESS_ARGS)
 {
   return 0;
 }
 
-__kernel void shuffler_chromosome_single_gene_mutate(global int* cs,
-                                                     float prob_mutate,
-                                                     global uint* input_rand,
-                                                     int improve)
+#ifdef IMPROVING_DELTA_FUNC
+// Returns the index to swap with idx which improves the fitness most, or idx if no swap improves
+// it. IMPROVING_DELTA_FUNC only computes the changed part of fitness by a swap.
+int shuffler_chromosome_delta_improving_func(global GENE_TYPE* chromosome,
+                                             int idx,
+                                             int chromosome_size FITNESS_ARGS)
 {
-  int idx = get_global_id(0);
-  // out of bound kernel task for padding
-  if (idx >= POPULATION_SIZE) {
-    return;
+  int best_index = idx;
+  float best_delta = 0.0;
+  float delta;
+  for (int i = 0; i < chromosome_size; i++) {
+    if (i == idx) {
+      continue;
+    }
+    delta = IMPROVING_DELTA_FUNC(chromosome, idx, i, chromosome_size FITNESS_ARGV);
+#if OPTIMIZATION_FOR_MAX
+    if (delta > best_delta) {
+#else
+    if (delta < best_delta) {
+#endif
+      best_delta = delta;
+      best_index = i;
+    }
   }
+  return best_index;
+}
+#endif
 
-  uint ra[1];
-  init_rand(input_rand[idx], ra);
+// Swaps a gene of the chromosome with another one by probability. The other one is chosen by
+// IMPROVED_FITNESS_FUNC if improve is 1, or randomly.
+void shuffler_chromosome_do_mutate(global __ShufflerChromosome* chromosome,
+                                   float prob_mutate,
+                                   int improve,
+                                   ga_rand* ra FITNESS_ARGS)
+{
   float prob_m =  rand_prob(ra);
   if (prob_m > prob_mutate) {
-    input_rand[idx] = ra[0];
     return;
   }
-  global __ShufflerChromosome* chromosomes = (global __ShufflerChromosome*) cs;
   uint i = rand_range(ra, SHUFFLER_CHROMOSOME_GENE_SIZE);
   uint j;
   if (improve == 1) {
-    // we only gives global int* type to IMPROVED_FITNESS_FUNC instead of __ShufflerChromosome
-    j = IMPROVED_FITNESS_FUNC((global int*)(chromosomes + idx), i, SHUFFLER_CHROMOSOME_GENE_SIZE);
+    // we only gives global GENE_TYPE* type to IMPROVED_FITNESS_FUNC instead of
+    // __ShufflerChromosome
+    j = IMPROVED_FITNESS_FUNC((global GENE_TYPE*)chromosome, i,
+                              SHUFFLER_CHROMOSOME_GENE_SIZE FITNESS_ARGV);
     if (i != j) {
-      shuffler_chromosome_swap(chromosomes + idx, i, j);
+      shuffler_chromosome_swap(chromosome, i, j);
     }
   } else {
     j = rand_range_exclude(ra, SHUFFLER_CHROMOSOME_GENE_SIZE, i);
-    shuffler_chromosome_swap(chromosomes + idx, i, j);
+    shuffler_chromosome_swap(chromosome, i, j);
+  }
+  shuffler_chromosome_check_duplicate(chromosome);
+}
+
+// The random mutation of shuffler_chromosome_do_mutate for a chromosome at private memory.
+void shuffler_chromosome_do_mutate_private(__ShufflerChromosome* chromosome,
+                                           float prob_mutate,
+                                           ga_rand* ra)
+{
+  float prob_m =  rand_prob(ra);
+  if (prob_m > prob_mutate) {
+    return;
+  }
+  uint i = rand_range(ra, SHUFFLER_CHROMOSOME_GENE_SIZE);
+  uint j = rand_range_exclude(ra, SHUFFLER_CHROMOSOME_GENE_SIZE, i);
+  GENE_TYPE gene = chromosome->genes[i];
+  chromosome->genes[i] = chromosome->genes[j];
+  chromosome->genes[j] = gene;
+}
+
+__kernel void shuffler_chromosome_single_gene_mutate(global GENE_TYPE* cs,
+                                                     float prob_mutate,
+                                                     ulong seed,
+                                                     int generation_idx,
+                                                     int improve,
+                                                     global float* best_local,
+                                                     global float* worst_local FITNESS_KERNEL_ARGS)
+{
+  // the fitness arguments at local memory are loaded before any work-item returns.
+  FITNESS_PRELOAD
+  // the population is converged, keep it as it is.
+  if (fabs(*worst_local - *best_local) < 0.00001) {
+    return;
+  }
+  int idx = get_global_id(0);
+  // out of bound kernel task for padding
+  if (idx >= POPULATION_SIZE) {
+    return;
   }
-  input_rand[idx] = ra[0];
-  shuffler_chromosome_check_duplicate(chromosomes + idx);
+
+  ga_rand ra[1];
+  init_rand(seed, generation_idx, idx, GA_RAND_STREAM_MUTATE, ra);
+  shuffler_chromosome_do_mutate(((global __ShufflerChromosome*) cs) + idx, prob_mutate, improve,
+                                ra FITNESS_ARGV);
+}
+
+__kernel void shuffler_chromosome_calc_ratio_partial(global float* fitness,
+                                                     global float* partials,
+                                                     local float* l_min,
+                                                     local float* l_max,
+                                                     local float* l_sum)
+{
+  utils_calc_ratio_partial(fitness, partials, l_min, l_max, l_sum, POPULATION_SIZE);
+}
+
+__kernel void shuffler_chromosome_calc_ratio_final(global float* fitness,
+                                                   global float* partials,
+                                                   int num_of_partials,
+                                                   global float* best,
+                                                   global float* worst,
+                                                   global float* avg,
+                                                   global float* diff_total,
+                                                   local float* l_min,
+                                                   local float* l_max,
+                                                   local float* l_sum)
+{
+  utils_calc_ratio_final(fitness, partials, num_of_partials, best, worst, avg, diff_total,
+                         l_min, l_max, l_sum, POPULATION_SIZE);
 }
 
 __kernel void shuffler_chromosome_calc_ratio(global float* fitness,
-                                             global float* ratio,
-                                             global float* best,
+                                             global float* cumulative,
+                                             global float* group_sums,
                                              global float* worst,
-                                             global float* avg)
+                                             global float* diff_total,
+                                             local float* l_data)
+{
+  utils_calc_ratio_scan(fitness, cumulative, group_sums, worst, diff_total, l_data,
+                        POPULATION_SIZE);
+}
+
+__kernel void shuffler_chromosome_calc_ratio_scan_groups(global float* group_sums,
+                                                         int num_of_groups,
+                                                         local float* l_data)
+{
+  utils_scan_group_sums(group_sums, num_of_groups, l_data);
+}
+
+__kernel void shuffler_chromosome_calc_ratio_add_offsets(global float* cumulative,
+                                                         global float* group_sums)
 {
   int idx = get_global_id(0);
-  // we use the first kernel to calculate the ratio
-  if (idx > 0) {
+  // out of bound kernel task for padding
+  if (idx >= POPULATION_SIZE) {
     return;
   }
-  utils_calc_ratio(fitness, ratio, best, worst, avg, idx, POPULATION_SIZE);
-  // float local_min = INT_MAX;
-  // float local_max = 0;
-  // if (OPTIMIZATION_FOR_MAX) {
-  //   calc_min_max_fitness(fitness, POPULATION_SIZE, &local_max, &local_min);
-  //   *best = local_max;
-  //   *worst = local_min;
-  // } else {
-  //   calc_min_max_fitness(fitness, POPULATION_SIZE, &local_min, &local_max);
-  //   *best = local_min;
-  //   *worst = local_max;
-  // }
-  // float temp_worst = *worst;
-  // float diffTotal = 0;
-  // float avg_local = 0;
-  // int i;
-  // // we use total and diff to calculate the probability for each chromosome
-  // for (i = 0; i < POPULATION_SIZE; i++) {
-  //   diffTotal += (temp_worst - fitness[i]) * (temp_worst - fitness[i]);
-  //   avg_local += fitness[i] / POPULATION_SIZE;
-  // }
-  // // calculate probability for each one
-  // for (i = 0; i < POPULATION_SIZE; i++) {
-  //   ratio[i] = (temp_worst - fitness[i]) * (temp_worst - fitness[i]) / diffTotal;
-  // }
-  // *avg = avg_local;
-}
-
-__kernel void shuffler_chromosome_pick_chromosomes(global int* cs,
-                                                   global float* fitness,
-                                                   global int* p_other,
-                                                   global float* ratio,
+  // it must be launched with the same local size as shuffler_chromosome_calc_ratio.
+  cumulative[idx] += group_sums[get_group_id(0)];
+}
+
+// Picks the other parent of each chromosome, only its index is written to parents.
+__kernel void shuffler_chromosome_pick_chromosomes(global float* cumulative,
+                                                   global int* parents,
                                                    global float* best_local,
                                                    global float* worst_local,
-                                                   global uint* input_rand)
+                                                   ulong seed,
+                                                   int generation_idx)
 {
   if (fabs(*worst_local - *best_local) < 0.00001) {
     return;
@@ -148,80 +226,248 @@ __kernel void shuffler_chromosome_pick_chromosomes(global int* cs,
   if (idx >= POPULATION_SIZE) {
     return;
   }
-  uint ra[1];
-  init_rand(input_rand[idx], ra);
-  global __ShufflerChromosome* chromosomes = (global __ShufflerChromosome*) cs;
-  global __ShufflerChromosome* parent_other = (global __ShufflerChromosome*) p_other;
+  ga_rand ra[1];
+  init_rand(seed, generation_idx, idx, GA_RAND_STREAM_PICK, ra);
+  parents[idx] = random_choose_by_cumulative_ratio(cumulative, ra, POPULATION_SIZE);
+}
+
+// The crossover operators create child from the parents self and other at private memory.
+// SHUFFLER_CHROMOSOME_CROSSOVER is the one chosen by ShufflerChromosome. The gene values must be
+// less than SHUFFLER_CHROMOSOME_GENE_SIZE, the used ones are marked at a private bitmap.
+#define SHUFFLER_CHROMOSOME_BITMAP_SIZE ((SHUFFLER_CHROMOSOME_GENE_SIZE + 31) / 32)
+#define SHUFFLER_BITMAP_SET(bitmap, v) (bitmap)[(v) >> 5] |= (1u << ((v) & 31))
+#define SHUFFLER_BITMAP_TEST(bitmap, v) (((bitmap)[(v) >> 5] >> ((v) & 31)) & 1u)
+
+void shuffler_chromosome_clear_bitmap(uint* bitmap)
+{
+  for (int i = 0; i < SHUFFLER_CHROMOSOME_BITMAP_SIZE; i++) {
+    bitmap[i] = 0;
+  }
+}
+
+// Picks 2 cut points, from <= to.
+void shuffler_chromosome_cut_points(ga_rand* ra, int* from, int* to)
+{
+  int a = rand_range(ra, SHUFFLER_CHROMOSOME_GENE_SIZE);
+  int b = rand_range(ra, SHUFFLER_CHROMOSOME_GENE_SIZE);
+  *from = min(a, b);
+  *to = max(a, b);
+}
+
+// The genes before a cut point are copied from other and the rest of genes are sorted as self.
+void shuffler_chromosome_cut_crossover(__ShufflerChromosome* self,
+                                       __ShufflerChromosome* other,
+                                       __ShufflerChromosome* child,
+                                       ga_rand* ra)
+{
+  uint used[SHUFFLER_CHROMOSOME_BITMAP_SIZE];
+  shuffler_chromosome_clear_bitmap(used);
   int i;
-  int cross_idx = random_choose_by_ratio(ratio, ra, POPULATION_SIZE);
-  // copy the chromosome to local memory for cross over
+  // we must be cross over at least one element and must not cross over all of the element.
+  int cross_point = rand_range(ra, SHUFFLER_CHROMOSOME_GENE_SIZE - 1) + 1;
+  for (i = 0; i < cross_point; i++) {
+    child->genes[i] = other->genes[i];
+    SHUFFLER_BITMAP_SET(used, other->genes[i]);
+  }
   for (i = 0; i < SHUFFLER_CHROMOSOME_GENE_SIZE; i++) {
-    parent_other[idx].genes[i] = chromosomes[cross_idx].genes[i];
+    if (!SHUFFLER_BITMAP_TEST(used, self->genes[i])) {
+      child->genes[cross_point++] = self->genes[i];
+    }
   }
-  input_rand[idx] = ra[0];
 }
 
-__kernel void shuffler_chromosome_do_crossover(global int* cs,
-                                               global float* fitness,
-                                               global int* p_other,
-                                               global int* c_map,
-                                               global float* best_local,
-                                               global float* worst_local,
-                                               global float* avg_local,
-                                               float prob_crossover,
-                                               global uint* input_rand,
-                                               int generation_idx)
+// Order crossover (OX), the genes between 2 cut points are copied from other and the rest of genes
+// are filled after the second cut point in the order of self.
+void shuffler_chromosome_ox_crossover(__ShufflerChromosome* self,
+                                      __ShufflerChromosome* other,
+                                      __ShufflerChromosome* child,
+                                      ga_rand* ra)
 {
-  if (fabs(*worst_local - *best_local) < 0.00001) {
-    return;
+  uint used[SHUFFLER_CHROMOSOME_BITMAP_SIZE];
+  shuffler_chromosome_clear_bitmap(used);
+  int from, to, i, gene;
+  shuffler_chromosome_cut_points(ra, &from, &to);
+  for (i = from; i <= to; i++) {
+    child->genes[i] = other->genes[i];
+    SHUFFLER_BITMAP_SET(used, other->genes[i]);
   }
-  int idx = get_global_id(0);
-  // out of bound kernel task for padding
-  if (idx >= POPULATION_SIZE) {
-    return;
+  int k = (to + 1) % SHUFFLER_CHROMOSOME_GENE_SIZE;
+  for (i = 1; i <= SHUFFLER_CHROMOSOME_GENE_SIZE; i++) {
+    gene = self->genes[(to + i) % SHUFFLER_CHROMOSOME_GENE_SIZE];
+    if (!SHUFFLER_BITMAP_TEST(used, gene)) {
+      child->genes[k] = gene;
+      k = (k + 1) % SHUFFLER_CHROMOSOME_GENE_SIZE;
+    }
   }
-  uint ra[1];
-  init_rand(input_rand[idx], ra);
+}
 
-  // keep the shortest path, we have to return here to prevent async barrier if someone is returned.
-  if (fabs(fitness[idx] - *best_local) < 0.000001) {
-    input_rand[idx] = ra[0];
-    return;
-  } else if (rand_prob(ra) >= prob_crossover) {
-    input_rand[idx] = ra[0];
-    return;
+// Partially mapped crossover (PMX), the genes between 2 cut points are copied from other and the
+// displaced genes of self are moved to the positions of the copied ones.
+void shuffler_chromosome_pmx_crossover(__ShufflerChromosome* self,
+                                       __ShufflerChromosome* other,
+                                       __ShufflerChromosome* child,
+                                       ga_rand* ra)
+{
+  ushort position[SHUFFLER_CHROMOSOME_GENE_SIZE];
+  int from, to, i, gene, displaced;
+  shuffler_chromosome_cut_points(ra, &from, &to);
+  for (i = 0; i < SHUFFLER_CHROMOSOME_GENE_SIZE; i++) {
+    child->genes[i] = self->genes[i];
+    position[self->genes[i]] = i;
+  }
+  for (i = from; i <= to; i++) {
+    gene = other->genes[i];
+    displaced = child->genes[i];
+    // swap the gene into place, it's the same as following the mapping of PMX.
+    child->genes[position[gene]] = displaced;
+    position[displaced] = position[gene];
+    child->genes[i] = gene;
+    position[gene] = i;
+  }
+}
+
+// Fills the neighbors of gene at self and other.
+void shuffler_chromosome_erx_neighbors(__ShufflerChromosome* self,
+                                       __ShufflerChromosome* other,
+                                       ushort* self_position,
+                                       ushort* other_position,
+                                       int gene,
+                                       int* neighbors)
+{
+  int n = SHUFFLER_CHROMOSOME_GENE_SIZE;
+  neighbors[0] = self->genes[(self_position[gene] + n - 1) % n];
+  neighbors[1] = self->genes[(self_position[gene] + 1) % n];
+  neighbors[2] = other->genes[(other_position[gene] + n - 1) % n];
+  neighbors[3] = other->genes[(other_position[gene] + 1) % n];
+}
+
+// Edge recombination crossover (ERX), the next gene is the unused neighbor of the current gene at
+// both parents which has the fewest unused neighbors. If all neighbors are used, it's the next
+// unused gene of self.
+void shuffler_chromosome_erx_crossover(__ShufflerChromosome* self,
+                                       __ShufflerChromosome* other,
+                                       __ShufflerChromosome* child,
+                                       ga_rand* ra)
+{
+  ushort self_position[SHUFFLER_CHROMOSOME_GENE_SIZE];
+  ushort other_position[SHUFFLER_CHROMOSOME_GENE_SIZE];
+  uint used[SHUFFLER_CHROMOSOME_BITMAP_SIZE];
+  int neighbors[4];
+  int candidates[4];
+  int i, j, k, count, best_count;
+  int scan = 0;
+  shuffler_chromosome_clear_bitmap(used);
+  for (i = 0; i < SHUFFLER_CHROMOSOME_GENE_SIZE; i++) {
+    self_position[self->genes[i]] = i;
+    other_position[other->genes[i]] = i;
+  }
+  int current = self->genes[rand_range(ra, SHUFFLER_CHROMOSOME_GENE_SIZE)];
+  child->genes[0] = current;
+  SHUFFLER_BITMAP_SET(used, current);
+  for (k = 1; k < SHUFFLER_CHROMOSOME_GENE_SIZE; k++) {
+    shuffler_chromosome_erx_neighbors(self, other, self_position, other_position, current,
+                                      neighbors);
+    current = -1;
+    best_count = 5;
+    for (i = 0; i < 4; i++) {
+      if (SHUFFLER_BITMAP_TEST(used, neighbors[i])) {
+        continue;
+      }
+      shuffler_chromosome_erx_neighbors(self, other, self_position, other_position,
+                                        neighbors[i], candidates);
+      // count the distinct unused neighbors of the candidate.
+      count = 0;
+      for (j = 0; j < 4; j++) {
+        if (!SHUFFLER_BITMAP_TEST(used, candidates[j]) &&
+            (j == 0 || candidates[j] != candidates[0]) &&
+            (j <= 1 || candidates[j] != candidates[1]) &&
+            (j <= 2 || candidates[j] != candidates[2])) {
+          count++;
+        }
+      }
+      if (count < best_count) {
+        best_count = count;
+        current = neighbors[i];
+      }
+    }
+    if (current == -1) {
+      while (SHUFFLER_BITMAP_TEST(used, self->genes[scan])) {
+        scan++;
+      }
+      current = self->genes[scan];
+    }
+    child->genes[k] = current;
+    SHUFFLER_BITMAP_SET(used, current);
   }
-  global __ShufflerChromosome* chromosomes = (global __ShufflerChromosome*) cs;
-  global __ShufflerChromosome* parent_other = (global __ShufflerChromosome*) p_other;
-  // we use chromosome as a map object for checking the existence of Nth item.
-  global __ShufflerChromosome* cross_map = (global __ShufflerChromosome*) c_map;
+}
+
+// Builds the offspring of chromosome idx at private memory. It's crossed over with chromosome
+// other_idx, or copied as it is if other_idx is -1.
+void shuffler_chromosome_build_offspring(global __ShufflerChromosome* chromosomes,
+                                         int idx,
+                                         int other_idx,
+                                         __ShufflerChromosome* offspring,
+                                         ga_rand* ra)
+{
   __ShufflerChromosome self;
+  __ShufflerChromosome other;
   int i;
-  int cross_point;
-
+  if (other_idx < 0) {
+    for (i = 0; i < SHUFFLER_CHROMOSOME_GENE_SIZE; i++) {
+      offspring->genes[i] = chromosomes[idx].genes[i];
+    }
+    return;
+  }
+  // copy the parents to private memory for cross over
   for (i = 0; i < SHUFFLER_CHROMOSOME_GENE_SIZE; i++) {
-    // copy self chromosome to local memory for cross over
     self.genes[i] = chromosomes[idx].genes[i];
-    // reset the cross_map to 0
-    cross_map[idx].genes[i] = 0;
+    other.genes[i] = chromosomes[other_idx].genes[i];
   }
+  SHUFFLER_CHROMOSOME_CROSSOVER(&self, &other, offspring, ra);
+}
 
-  // we must be cross over at least one element and must not cross over all of the element.
-  cross_point = rand_range(ra, SHUFFLER_CHROMOSOME_GENE_SIZE - 1) + 1;
+void shuffler_chromosome_write(__ShufflerChromosome* chromosome,
+                               global __ShufflerChromosome* slot)
+{
+  for (int i = 0; i < SHUFFLER_CHROMOSOME_GENE_SIZE; i++) {
+    slot->genes[i] = chromosome->genes[i];
+  }
+}
 
-  // copy the first part from other chromosome
-  for (i = 0; i < cross_point; i++) {
-    chromosomes[idx].genes[i] = parent_other[idx].genes[i];
-    cross_map[idx].genes[parent_other[idx].genes[i]] = 1;
+// Writes the offspring of all chromosomes to next_cs, the parents at cs are only read, so the
+// population is never rewritten in place.
+__kernel void shuffler_chromosome_do_crossover(global GENE_TYPE* cs,
+                                               global float* fitness,
+                                               global int* parents,
+                                               global GENE_TYPE* next_cs,
+                                               global float* best_local,
+                                               global float* worst_local,
+                                               float prob_crossover,
+                                               ulong seed,
+                                               int generation_idx)
+{
+  int idx = get_global_id(0);
+  // out of bound kernel task for padding
+  if (idx >= POPULATION_SIZE) {
+    return;
   }
-  // sort the second part at self chromosome
-  for (i = 0; i < SHUFFLER_CHROMOSOME_GENE_SIZE; i++) {
-    if (cross_map[idx].genes[self.genes[i]] == 0) {
-        chromosomes[idx].genes[cross_point++] = self.genes[i];
-    }
+  ga_rand ra[1];
+  init_rand(seed, generation_idx, idx, GA_RAND_STREAM_CROSSOVER, ra);
+  int other_idx = -1;
+  // the population is converged, keep it as it is. Keep the shortest path and cross over the
+  // others by probability.
+  if (fabs(*worst_local - *best_local) >= 0.00001 && fabs(fitness[idx] - *best_local) >= 0.000001 &&
+      rand_prob(ra) < prob_crossover) {
+    other_idx = parents[idx];
+  }
+  global __ShufflerChromosome* child = ((global __ShufflerChromosome*) next_cs) + idx;
+  __ShufflerChromosome offspring;
+  shuffler_chromosome_build_offspring((global __ShufflerChromosome*) cs, idx, other_idx, &offspring,
+                                      ra);
+  shuffler_chromosome_write(&offspring, child);
+  if (other_idx >= 0) {
+    shuffler_chromosome_check_duplicate(child);
   }
-  shuffler_chromosome_check_duplicate(chromosomes + idx);
-  input_rand[idx] = ra[0];
 }
 
 #endif
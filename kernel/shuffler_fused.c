@@ -0,0 +1,65 @@
+#ifndef __oclga_shuffler_fused__
+#define __oclga_shuffler_fused__
+
+#include "shuffler_chromosome.c"
+
+// The fused generation of ShufflerChromosome. After calc_ratio, a work-item picks the other parent,
+// crosses over, mutates and evaluates an offspring in a single launch. The offspring is crossed
+// over and mutated at private memory, and only it and its fitness are written, to next_cs and
+// next_fitness, so the host swaps the two populations after each launch. The improving mutation
+// and the fitness function take global chromosomes, so they read the offspring at next_cs. The
+// random numbers are drawn from the streams of pick_chromosomes, do_crossover and
+// single_gene_mutate, it evolves the same population as the separated kernels.
+// It must be included after the fitness function since it calls CALCULATE_FITNESS.
+__kernel void shuffler_chromosome_fused_generation(global GENE_TYPE* cs,
+                                                   global float* fitness,
+                                                   global GENE_TYPE* next_cs,
+                                                   global float* next_fitness,
+                                                   global float* cumulative,
+                                                   global float* best_local,
+                                                   global float* worst_local,
+                                                   float prob_crossover,
+                                                   float prob_mutate,
+                                                   ulong seed,
+                                                   int generation_idx,
+                                                   int improve FITNESS_KERNEL_ARGS)
+{
+  // the fitness arguments at local memory are loaded before any work-item returns.
+  FITNESS_PRELOAD
+  int idx = get_global_id(0);
+  // out of bound kernel task for padding
+  if (idx >= POPULATION_SIZE) {
+    return;
+  }
+  global __ShufflerChromosome* child = ((global __ShufflerChromosome*) next_cs) + idx;
+  int other_idx = -1;
+  // the population is converged, keep it as it is.
+  int converged = fabs(*worst_local - *best_local) < 0.00001;
+  ga_rand ra[1];
+  init_rand(seed, generation_idx, idx, GA_RAND_STREAM_CROSSOVER, ra);
+  // keep the best one and cross over the others by probability.
+  if (!converged && fabs(fitness[idx] - *best_local) >= 0.000001 &&
+      rand_prob(ra) < prob_crossover) {
+    ga_rand pick[1];
+    init_rand(seed, generation_idx, idx, GA_RAND_STREAM_PICK, pick);
+    other_idx = random_choose_by_cumulative_ratio(cumulative, pick, POPULATION_SIZE);
+  }
+  __ShufflerChromosome offspring;
+  shuffler_chromosome_build_offspring((global __ShufflerChromosome*) cs, idx, other_idx, &offspring,
+                                      ra);
+  init_rand(seed, generation_idx, idx, GA_RAND_STREAM_MUTATE, ra);
+  if (!converged && improve == 0) {
+    shuffler_chromosome_do_mutate_private(&offspring, prob_mutate, ra);
+  }
+  shuffler_chromosome_write(&offspring, child);
+  if (other_idx >= 0 || !converged) {
+    shuffler_chromosome_check_duplicate(child);
+  }
+  // the improving helpers take global chromosomes, so the offspring is mutated at its slot.
+  if (!converged && improve == 1) {
+    shuffler_chromosome_do_mutate(child, prob_mutate, improve, ra FITNESS_ARGV);
+  }
+  CALCULATE_FITNESS(child, next_fitness + idx, CHROMOSOME_SIZE, POPULATION_SIZE FITNESS_ARGV);
+}
+
+#endif
@@ -0,0 +1,207 @@
+#ifndef __oclga_shuffler_island__
+#define __oclga_shuffler_island__
+
+#include "shuffler_chromosome.c"
+
+// The persistent island engine of ShufflerChromosome. A work-group evolves an island whose
+// chromosomes and fitnesses are kept at local memory for many generations in a single launch.
+// It must be included after the fitness function since it calls CALCULATE_FITNESS.
+
+// Reduces the island fitnesses to best and worst. All work-items get the same values.
+void shuffler_island_best_worst(local float* l_fitness, local float* l_min, local float* l_max,
+                                local float* l_sum, float* best, float* worst)
+{
+  int lid = get_local_id(0);
+  l_min[lid] = l_fitness[lid];
+  l_max[lid] = l_fitness[lid];
+  l_sum[lid] = 0;
+  barrier(CLK_LOCAL_MEM_FENCE);
+  utils_local_reduce_min_max_sum(l_min, l_max, l_sum);
+#if OPTIMIZATION_FOR_MAX
+  *best = l_max[0];
+  *worst = l_min[0];
+#else
+  *best = l_min[0];
+  *worst = l_max[0];
+#endif
+  // all work-items read the reduced values before the local memory is reused.
+  barrier(CLK_LOCAL_MEM_FENCE);
+}
+
+// Returns the smallest local id whose fitness is the value. All work-items get the same value.
+int shuffler_island_find(local float* l_fitness, local int* l_index, float value)
+{
+  int lid = get_local_id(0);
+  if (lid == 0) {
+    l_index[0] = get_local_size(0) - 1;
+  }
+  barrier(CLK_LOCAL_MEM_FENCE);
+  if (l_fitness[lid] == value) {
+    atomic_min(l_index, lid);
+  }
+  barrier(CLK_LOCAL_MEM_FENCE);
+  int found = l_index[0];
+  barrier(CLK_LOCAL_MEM_FENCE);
+  return found;
+}
+
+// Returns the local id of a chromosome chosen by the inclusive scan of ratios at l_cumulative.
+int shuffler_island_choose(local float* l_cumulative, ga_rand* ra)
+{
+  int high = get_local_size(0) - 1;
+  float rand_choose = rand_prob(ra) * l_cumulative[high];
+  int low = 0;
+  while (low < high) {
+    int mid = (low + high) / 2;
+    if (l_cumulative[mid] > rand_choose) {
+      high = mid;
+    } else {
+      low = mid + 1;
+    }
+  }
+  return low;
+}
+
+// The same crossover as shuffler_chromosome_do_crossover but the parents are at local memory and
+// the child is at private memory.
+void shuffler_island_crossover(local __ShufflerChromosome* self,
+                               local __ShufflerChromosome* other,
+                               __ShufflerChromosome* child,
+                               ga_rand* ra)
+{
+  __ShufflerChromosome self_copy;
+  __ShufflerChromosome other_copy;
+  for (int i = 0; i < SHUFFLER_CHROMOSOME_GENE_SIZE; i++) {
+    self_copy.genes[i] = self->genes[i];
+    other_copy.genes[i] = other->genes[i];
+  }
+  SHUFFLER_CHROMOSOME_CROSSOVER(&self_copy, &other_copy, child, ra);
+}
+
+// The same mutation as shuffler_chromosome_single_gene_mutate. Returns 1 if it's mutated.
+int shuffler_island_mutate(global __ShufflerChromosome* chromosome, float prob_mutate,
+                           int improve, ga_rand* ra FITNESS_ARGS)
+{
+  if (rand_prob(ra) > prob_mutate) {
+    return 0;
+  }
+  uint i = rand_range(ra, SHUFFLER_CHROMOSOME_GENE_SIZE);
+  uint j;
+  if (improve == 1) {
+    j = IMPROVED_FITNESS_FUNC((global GENE_TYPE*)chromosome, i, SHUFFLER_CHROMOSOME_GENE_SIZE
+                              FITNESS_ARGV);
+  } else {
+    j = rand_range_exclude(ra, SHUFFLER_CHROMOSOME_GENE_SIZE, i);
+  }
+  if (i == j) {
+    return 0;
+  }
+  shuffler_chromosome_swap(chromosome, i, j);
+  return 1;
+}
+
+// A work-item per chromosome, a work-group per island. The local size must be a power of 2 and
+// POPULATION_SIZE must be a multiple of it. A work-group replaces its worst chromosome with the
+// best one of the previous island at migrants_in before evolving, and writes its best one to
+// migrants_out at the end. The mutated chromosome is written to cs for calculating fitness since
+// fitness functions only take global pointers.
+__kernel void shuffler_chromosome_island_evolve(global GENE_TYPE* cs,
+                                                global float* fitness,
+                                                ulong seed,
+                                                int generation_idx,
+                                                global GENE_TYPE* migrants_in,
+                                                global float* migrant_fitnesses_in,
+                                                global GENE_TYPE* migrants_out,
+                                                global float* migrant_fitnesses_out,
+                                                int migrate,
+                                                int generations,
+                                                float prob_mutate,
+                                                float prob_crossover,
+                                                int improve,
+                                                local GENE_TYPE* l_genes,
+                                                local float* l_fitness,
+                                                local float* l_min,
+                                                local float* l_max,
+                                                local float* l_sum,
+                                                local int* l_index FITNESS_KERNEL_ARGS)
+{
+  FITNESS_PRELOAD
+  int idx = get_global_id(0);
+  int lid = get_local_id(0);
+  int group = get_group_id(0);
+  int i;
+  float best;
+  float worst;
+  global __ShufflerChromosome* chromosomes = (global __ShufflerChromosome*) cs;
+  local __ShufflerChromosome* island = (local __ShufflerChromosome*) l_genes;
+  global __ShufflerChromosome* migrants = (global __ShufflerChromosome*) migrants_in;
+  ga_rand ra[1];
+  init_rand(seed, generation_idx, idx, GA_RAND_STREAM_ISLAND, ra);
+
+  for (i = 0; i < SHUFFLER_CHROMOSOME_GENE_SIZE; i++) {
+    island[lid].genes[i] = chromosomes[idx].genes[i];
+  }
+  l_fitness[lid] = fitness[idx];
+  barrier(CLK_LOCAL_MEM_FENCE);
+
+  if (migrate) {
+    int from = (group + get_num_groups(0) - 1) % get_num_groups(0);
+    shuffler_island_best_worst(l_fitness, l_min, l_max, l_sum, &best, &worst);
+    if (shuffler_island_find(l_fitness, l_index, worst) == lid) {
+      for (i = 0; i < SHUFFLER_CHROMOSOME_GENE_SIZE; i++) {
+        island[lid].genes[i] = migrants[from].genes[i];
+        chromosomes[idx].genes[i] = migrants[from].genes[i];
+      }
+      l_fitness[lid] = migrant_fitnesses_in[from];
+      fitness[idx] = migrant_fitnesses_in[from];
+    }
+    barrier(CLK_LOCAL_MEM_FENCE);
+  }
+
+  __ShufflerChromosome child;
+  for (int gen = 0; gen < generations; gen++) {
+    shuffler_island_best_worst(l_fitness, l_min, l_max, l_sum, &best, &worst);
+    // the island is converged, all work-items leave the loop together.
+    if (fabs(worst - best) < 0.00001) {
+      break;
+    }
+    // the ratios don't need to be normalized since the random number is scaled by the total.
+    l_sum[lid] = (worst - l_fitness[lid]) * (worst - l_fitness[lid]);
+    barrier(CLK_LOCAL_MEM_FENCE);
+    utils_local_inclusive_scan(l_sum);
+    int other = shuffler_island_choose(l_sum, ra);
+    // keep the best chromosome as shuffler_chromosome_do_crossover does.
+    int crossed = fabs(l_fitness[lid] - best) >= 0.000001 && rand_prob(ra) < prob_crossover;
+    if (crossed) {
+      shuffler_island_crossover(island + lid, island + other, &child, ra);
+    }
+    // all work-items finish reading the parents before the island is changed.
+    barrier(CLK_LOCAL_MEM_FENCE);
+    if (crossed) {
+      for (i = 0; i < SHUFFLER_CHROMOSOME_GENE_SIZE; i++) {
+        chromosomes[idx].genes[i] = child.genes[i];
+      }
+    }
+    if (shuffler_island_mutate(chromosomes + idx, prob_mutate, improve, ra FITNESS_ARGV) ||
+        crossed) {
+      CALCULATE_FITNESS(chromosomes + idx, fitness + idx,
+                        CHROMOSOME_SIZE, POPULATION_SIZE FITNESS_ARGV);
+      for (i = 0; i < SHUFFLER_CHROMOSOME_GENE_SIZE; i++) {
+        island[lid].genes[i] = chromosomes[idx].genes[i];
+      }
+      l_fitness[lid] = fitness[idx];
+    }
+    barrier(CLK_LOCAL_MEM_FENCE);
+  }
+
+  shuffler_island_best_worst(l_fitness, l_min, l_max, l_sum, &best, &worst);
+  if (shuffler_island_find(l_fitness, l_index, best) == lid) {
+    migrants = (global __ShufflerChromosome*) migrants_out;
+    for (i = 0; i < SHUFFLER_CHROMOSOME_GENE_SIZE; i++) {
+      migrants[group].genes[i] = island[lid].genes[i];
+    }
+    migrant_fitnesses_out[group] = l_fitness[lid];
+  }
+}
+
+#endif
@@ -0,0 +1,143 @@
+#ifndef __shuffler_local_search__
+#define __shuffler_local_search__
+
+// The local search of ShufflerChromosome.use_local_search. It's included after the fitness
+// function and improves tours by 2-opt and Or-opt moves.
+// LOCAL_SEARCH_DISTANCE(a, b, n FITNESS_ARGV) returns the symmetric distance between gene values
+// a and b, and the fitness is the sum of distances of a closed tour which should be minimized.
+
+#define LOCAL_SEARCH_EPSILON 0.00001
+#define LOCAL_SEARCH_MAX_SEGMENT 3
+
+#define LS_DIST(a, b) LOCAL_SEARCH_DISTANCE((a), (b), SHUFFLER_CHROMOSOME_GENE_SIZE FITNESS_ARGV)
+
+// Reverses genes[from..to].
+void shuffler_local_search_reverse(global GENE_TYPE* genes, int from, int to)
+{
+  int temp;
+  while (from < to) {
+    temp = genes[from];
+    genes[from] = genes[to];
+    genes[to] = temp;
+    from++;
+    to--;
+  }
+}
+
+// Applies the first improving 2-opt move of each i, the edges (i, i + 1) and (j, j + 1) are
+// replaced by (i, j) and (i + 1, j + 1). Returns 1 if the tour is improved.
+int shuffler_local_search_2opt(global GENE_TYPE* genes FITNESS_ARGS)
+{
+  int n = SHUFFLER_CHROMOSOME_GENE_SIZE;
+  int improved = 0;
+  float delta;
+  for (int i = 0; i < n - 2; i++) {
+    for (int j = i + 2; j < n; j++) {
+      if (i == 0 && j == n - 1) {
+        // the 2 edges are adjacent.
+        continue;
+      }
+      delta = LS_DIST(genes[i], genes[j]) + LS_DIST(genes[i + 1], genes[(j + 1) % n]) -
+              LS_DIST(genes[i], genes[i + 1]) - LS_DIST(genes[j], genes[(j + 1) % n]);
+      if (delta < -LOCAL_SEARCH_EPSILON) {
+        shuffler_local_search_reverse(genes, i + 1, j);
+        improved = 1;
+      }
+    }
+  }
+  return improved;
+}
+
+// Moves genes[i..i + length - 1] between genes[j] and genes[j + 1], reversed if reversed is 1.
+void shuffler_local_search_move(global GENE_TYPE* genes, int i, int length, int j, int reversed)
+{
+  int segment[LOCAL_SEARCH_MAX_SEGMENT];
+  int k;
+  for (k = 0; k < length; k++) {
+    segment[k] = genes[i + k];
+  }
+  if (j > i) {
+    for (k = i; k <= j - length; k++) {
+      genes[k] = genes[k + length];
+    }
+    i = j - length + 1;
+  } else {
+    for (k = i + length - 1; k > j + length; k--) {
+      genes[k] = genes[k - length];
+    }
+    i = j + 1;
+  }
+  for (k = 0; k < length; k++) {
+    genes[i + k] = reversed ? segment[length - 1 - k] : segment[k];
+  }
+}
+
+// Applies the first improving Or-opt move of each segment of 1 to LOCAL_SEARCH_MAX_SEGMENT genes,
+// the segment is moved to another edge as is or reversed. Returns 1 if the tour is improved.
+int shuffler_local_search_or_opt(global GENE_TYPE* genes FITNESS_ARGS)
+{
+  int n = SHUFFLER_CHROMOSOME_GENE_SIZE;
+  int improved = 0;
+  int first, last, prev, next, a, b;
+  float removed, forward, backward;
+  for (int length = 1; length <= LOCAL_SEARCH_MAX_SEGMENT && length < n - 2; length++) {
+    for (int i = 0; i + length <= n; i++) {
+      first = genes[i];
+      last = genes[i + length - 1];
+      prev = genes[(i + n - 1) % n];
+      next = genes[(i + length) % n];
+      removed = LS_DIST(prev, first) + LS_DIST(last, next) - LS_DIST(prev, next);
+      for (int j = 0; j < n; j++) {
+        // the edge (j, j + 1) shouldn't touch the segment.
+        if ((j >= i - 1 && j < i + length) || (i == 0 && j == n - 1)) {
+          continue;
+        }
+        a = genes[j];
+        b = genes[(j + 1) % n];
+        forward = LS_DIST(a, first) + LS_DIST(last, b) - LS_DIST(a, b);
+        backward = LS_DIST(a, last) + LS_DIST(first, b) - LS_DIST(a, b);
+        if (forward - removed < -LOCAL_SEARCH_EPSILON ||
+            backward - removed < -LOCAL_SEARCH_EPSILON) {
+          shuffler_local_search_move(genes, i, length, j, backward < forward);
+          improved = 1;
+          break;
+        }
+      }
+    }
+  }
+  return improved;
+}
+
+// A work-item per selected chromosome. It runs at most iterations rounds of 2-opt and Or-opt until
+// no move improves the tour, then calculates the fitness of the improved tour.
+__kernel void shuffler_chromosome_local_search(global GENE_TYPE* cs,
+                                               global float* fitness,
+                                               global int* indices,
+                                               int count,
+                                               int iterations FITNESS_KERNEL_ARGS)
+{
+  // the fitness arguments at local memory are loaded before any work-item returns.
+  FITNESS_PRELOAD
+  int gid = get_global_id(0);
+  if (gid >= count) {
+    return;
+  }
+  int idx = indices[gid];
+  global __ShufflerChromosome* chromosomes = (global __ShufflerChromosome*) cs;
+  global GENE_TYPE* genes = (global GENE_TYPE*)(chromosomes + idx);
+  int improved = 0;
+  for (int k = 0; k < iterations; k++) {
+    int changed = shuffler_local_search_2opt(genes FITNESS_ARGV);
+    changed = shuffler_local_search_or_opt(genes FITNESS_ARGV) || changed;
+    if (!changed) {
+      break;
+    }
+    improved = 1;
+  }
+  if (improved) {
+    CALCULATE_FITNESS(chromosomes + idx, fitness + idx,
+                      CHROMOSOME_SIZE, POPULATION_SIZE FITNESS_ARGV);
+  }
+}
+
+#endif
@@ -4,34 +4,33 @@
 #include "ga_utils.c"
 
 typedef struct {
-  int genes[SIMPLE_CHROMOSOME_GENE_SIZE];
+  GENE_TYPE genes[SIMPLE_CHROMOSOME_GENE_SIZE];
 } __SimpleChromosome;
 
 /* ============== populate functions ============== */
 // functions for populate
-void simple_chromosome_do_populate(global __SimpleChromosome* chromosome, uint* rand_holder) {
+void simple_chromosome_do_populate(global __SimpleChromosome* chromosome, ga_rand* rand_holder) {
   uint gene_elements_size[] = SIMPLE_CHROMOSOME_GENE_ELEMENTS_SIZE;
   for (int i = 0; i < SIMPLE_CHROMOSOME_GENE_SIZE; i++) {
     chromosome->genes[i] = rand_range(rand_holder, gene_elements_size[i]);
   }
 }
 
-__kernel void simple_chromosome_populate(global int* chromosomes, global uint* input_rand) {
+__kernel void simple_chromosome_populate(global GENE_TYPE* chromosomes, ulong seed) {
   int idx = get_global_id(0);
   // out of bound kernel task for padding
   if (idx >= POPULATION_SIZE) {
     return;
   }
   // create a private variable for each kernel to hold randome number.
-  uint ra[1];
-  init_rand(input_rand[idx], ra);
+  ga_rand ra[1];
+  init_rand(seed, 0, idx, GA_RAND_STREAM_POPULATE, ra);
   simple_chromosome_do_populate(((global __SimpleChromosome*) chromosomes) + idx, ra);
-  input_rand[idx] = ra[0];
 }
 
 /* ============== mutate functions ============== */
 
-void simple_chromosome_do_mutate(global __SimpleChromosome* chromosome, uint* ra) {
+void simple_chromosome_do_mutate(global __SimpleChromosome* chromosome, ga_rand* ra) {
   // create element size list
   uint elements_size[] = SIMPLE_CHROMOSOME_GENE_ELEMENTS_SIZE;
   uint gene_idx = rand_range(ra, SIMPLE_CHROMOSOME_GENE_SIZE);
@@ -39,9 +38,10 @@ void simple_chromosome_do_mutate(global __SimpleChromosome* chromosome, uint* ra
   SIMPLE_CHROMOSOME_GENE_MUTATE_FUNC(chromosome->genes + gene_idx, elements_size[gene_idx], ra);
 }
 
-__kernel void simple_chromosome_mutate(global int* cs,
+__kernel void simple_chromosome_mutate(global GENE_TYPE* cs,
                                        float prob_mutate,
-                                       global uint* input_rand)
+                                       ulong seed,
+                                       int generation_idx)
 {
   int idx = get_global_id(0);
   // out of bound kernel task for padding
@@ -49,85 +49,181 @@ __kernel void simple_chromosome_mutate(global int* cs,
     return;
   }
 
-  uint ra[1];
-  init_rand(input_rand[idx], ra);
+  ga_rand ra[1];
+  init_rand(seed, generation_idx, idx, GA_RAND_STREAM_MUTATE, ra);
   float prob_m = rand_prob(ra);
   if (prob_m > prob_mutate) {
-    input_rand[idx] = ra[0];
     return;
   }
 
   simple_chromosome_do_mutate((global __SimpleChromosome*) cs, ra);
 }
 
-__kernel void simple_chromosome_mutate_all(global int* cs,
-                                           float prob_mutate,
-                                           global uint* input_rand)
+// Mutates each gene of the chromosome by probability.
+void simple_chromosome_do_mutate_all(global __SimpleChromosome* chromosome,
+                                     float prob_mutate,
+                                     ga_rand* ra)
 {
-  int idx = get_global_id(0);
-  // out of bound kernel task for padding
-  if (idx >= POPULATION_SIZE) {
-    return;
+  uint elements_size[] = SIMPLE_CHROMOSOME_GENE_ELEMENTS_SIZE;
+  for (int i = 0; i < SIMPLE_CHROMOSOME_GENE_SIZE; i++) {
+    if (rand_prob(ra) > prob_mutate) {
+      continue;
+    }
+    SIMPLE_CHROMOSOME_GENE_MUTATE_FUNC(chromosome->genes + i, elements_size[i], ra);
   }
+}
+
+// The same as simple_chromosome_do_mutate_all for a chromosome at private memory.
+void simple_chromosome_do_mutate_all_private(__SimpleChromosome* chromosome,
+                                             float prob_mutate,
+                                             ga_rand* ra)
+{
   uint elements_size[] = SIMPLE_CHROMOSOME_GENE_ELEMENTS_SIZE;
-  int i;
-  uint ra[1];
-  init_rand(input_rand[idx], ra);
-  for (i = 0; i < SIMPLE_CHROMOSOME_GENE_SIZE; i++) {
+  for (int i = 0; i < SIMPLE_CHROMOSOME_GENE_SIZE; i++) {
     if (rand_prob(ra) > prob_mutate) {
       continue;
     }
-    SIMPLE_CHROMOSOME_GENE_MUTATE_FUNC(cs + i, elements_size[i], ra);
+    SIMPLE_CHROMOSOME_GENE_PRIVATE_MUTATE_FUNC(chromosome->genes + i, elements_size[i], ra);
   }
+}
 
-  input_rand[idx] = ra[0];
+__kernel void simple_chromosome_mutate_all(global GENE_TYPE* cs,
+                                           float prob_mutate,
+                                           ulong seed,
+                                           int generation_idx,
+                                           global float* best_local,
+                                           global float* worst_local)
+{
+  // the population is converged, keep it as it is.
+  if (fabs(*worst_local - *best_local) < 0.00001) {
+    return;
+  }
+  int idx = get_global_id(0);
+  // out of bound kernel task for padding
+  if (idx >= POPULATION_SIZE) {
+    return;
+  }
+  ga_rand ra[1];
+  init_rand(seed, generation_idx, idx, GA_RAND_STREAM_MUTATE, ra);
+  simple_chromosome_do_mutate_all(((global __SimpleChromosome*) cs) + idx, prob_mutate, ra);
 }
 
 /* ============== crossover functions ============== */
+__kernel void simple_chromosome_calc_ratio_partial(global float* fitness,
+                                                   global float* partials,
+                                                   local float* l_min,
+                                                   local float* l_max,
+                                                   local float* l_sum)
+{
+  utils_calc_ratio_partial(fitness, partials, l_min, l_max, l_sum, POPULATION_SIZE);
+}
+
+__kernel void simple_chromosome_calc_ratio_final(global float* fitness,
+                                                 global float* partials,
+                                                 int num_of_partials,
+                                                 global float* best,
+                                                 global float* worst,
+                                                 global float* avg,
+                                                 global float* diff_total,
+                                                 local float* l_min,
+                                                 local float* l_max,
+                                                 local float* l_sum)
+{
+  utils_calc_ratio_final(fitness, partials, num_of_partials, best, worst, avg, diff_total,
+                         l_min, l_max, l_sum, POPULATION_SIZE);
+}
+
 __kernel void simple_chromosome_calc_ratio(global float* fitness,
-                                           global float* ratio,
-                                           global float* best,
+                                           global float* cumulative,
+                                           global float* group_sums,
                                            global float* worst,
-                                           global float* avg)
+                                           global float* diff_total,
+                                           local float* l_data)
+{
+  utils_calc_ratio_scan(fitness, cumulative, group_sums, worst, diff_total, l_data,
+                        POPULATION_SIZE);
+}
+
+__kernel void simple_chromosome_calc_ratio_scan_groups(global float* group_sums,
+                                                       int num_of_groups,
+                                                       local float* l_data)
+{
+  utils_scan_group_sums(group_sums, num_of_groups, l_data);
+}
+
+__kernel void simple_chromosome_calc_ratio_add_offsets(global float* cumulative,
+                                                       global float* group_sums)
 {
   int idx = get_global_id(0);
-  // we use the first kernel to calculate the ratio
-  if (idx > 0) {
+  // out of bound kernel task for padding
+  if (idx >= POPULATION_SIZE) {
     return;
   }
-  utils_calc_ratio(fitness, ratio, best, worst, avg, idx, POPULATION_SIZE);
+  // it must be launched with the same local size as simple_chromosome_calc_ratio.
+  cumulative[idx] += group_sums[get_group_id(0)];
 }
 
-__kernel void simple_chromosome_pick_chromosomes(global int* cs,
-                                                 global float* fitness,
-                                                 global int* p_other,
-                                                 global float* ratio,
-                                                 global uint* input_rand)
+// Picks the other parent of each chromosome, only its index is written to parents.
+__kernel void simple_chromosome_pick_chromosomes(global float* cumulative,
+                                                 global int* parents,
+                                                 global float* best_local,
+                                                 global float* worst_local,
+                                                 ulong seed,
+                                                 int generation_idx)
 {
+  if (fabs(*worst_local - *best_local) < 0.00001) {
+    return;
+  }
   int idx = get_global_id(0);
   // out of bound kernel task for padding
   if (idx >= POPULATION_SIZE) {
     return;
   }
-  uint ra[1];
-  init_rand(input_rand[idx], ra);
-  global __SimpleChromosome* chromosomes = (global __SimpleChromosome*) cs;
-  global __SimpleChromosome* parent_other = (global __SimpleChromosome*) p_other;
+  ga_rand ra[1];
+  init_rand(seed, generation_idx, idx, GA_RAND_STREAM_PICK, ra);
+  parents[idx] = random_choose_by_cumulative_ratio(cumulative, ra, POPULATION_SIZE);
+}
+
+// Builds the offspring of chromosome idx at private memory. The genes between 2 cut points are
+// copied from chromosome other_idx, or it's copied as it is if other_idx is -1.
+void simple_chromosome_build_offspring(global __SimpleChromosome* chromosomes,
+                                       int idx,
+                                       int other_idx,
+                                       __SimpleChromosome* offspring,
+                                       ga_rand* ra)
+{
   int i;
-  int cross_idx = random_choose_by_ratio(ratio, ra, POPULATION_SIZE);
-  // copy the chromosome to local memory for cross over
   for (i = 0; i < SIMPLE_CHROMOSOME_GENE_SIZE; i++) {
-    parent_other[idx].genes[i] = chromosomes[cross_idx].genes[i];
+    offspring->genes[i] = chromosomes[idx].genes[i];
+  }
+  if (other_idx >= 0) {
+    // keep at least one for .
+    int cross_start = rand_range(ra, SIMPLE_CHROMOSOME_GENE_SIZE - 1);
+    int cross_end = cross_start + rand_range(ra, SIMPLE_CHROMOSOME_GENE_SIZE - cross_start);
+    // copy partial genes from other chromosome
+    for (i = cross_start; i < cross_end; i++) {
+      offspring->genes[i] = chromosomes[other_idx].genes[i];
+    }
+  }
+}
+
+void simple_chromosome_write(__SimpleChromosome* chromosome, global __SimpleChromosome* slot)
+{
+  for (int i = 0; i < SIMPLE_CHROMOSOME_GENE_SIZE; i++) {
+    slot->genes[i] = chromosome->genes[i];
   }
-  input_rand[idx] = ra[0];
 }
 
-__kernel void simple_chromosome_do_crossover(global int* cs,
+// Writes the offspring of all chromosomes to next_cs, the parents at cs are only read, so the
+// population is never rewritten in place.
+__kernel void simple_chromosome_do_crossover(global GENE_TYPE* cs,
                                              global float* fitness,
-                                             global int* p_other,
+                                             global int* parents,
+                                             global GENE_TYPE* next_cs,
                                              global float* best_local,
+                                             global float* worst_local,
                                              float prob_crossover,
-                                             global uint* input_rand,
+                                             ulong seed,
                                              int generation_idx)
 {
   int idx = get_global_id(0);
@@ -135,29 +231,19 @@ __kernel void simple_chromosome_do_crossover(global int* cs,
   if (idx >= POPULATION_SIZE) {
     return;
   }
-  uint ra[1];
-  init_rand(input_rand[idx], ra);
-
-  // keep the shortest path, we have to return here to prevent async barrier if someone is returned.
-  if (fabs(fitness[idx] - *best_local) < 0.000001) {
-    input_rand[idx] = ra[0];
-    return;
-  } else if (rand_prob(ra) >= prob_crossover) {
-    input_rand[idx] = ra[0];
-    return;
+  ga_rand ra[1];
+  init_rand(seed, generation_idx, idx, GA_RAND_STREAM_CROSSOVER, ra);
+  int other_idx = -1;
+  // the population is converged, keep it as it is. Keep the best one and cross over the others
+  // by probability.
+  if (fabs(*worst_local - *best_local) >= 0.00001 && fabs(fitness[idx] - *best_local) >= 0.000001 &&
+      rand_prob(ra) < prob_crossover) {
+    other_idx = parents[idx];
   }
-  global __SimpleChromosome* chromosomes = (global __SimpleChromosome*) cs;
-  global __SimpleChromosome* parent_other = (global __SimpleChromosome*) p_other;
-  int i;
-  // keep at least one for .
-  int cross_start = rand_range(ra, SIMPLE_CHROMOSOME_GENE_SIZE - 1);
-  int cross_end = cross_start + rand_range(ra, SIMPLE_CHROMOSOME_GENE_SIZE - cross_start);
-  // copy partial genes from other chromosome
-  for (i = cross_start; i < cross_end; i++) {
-    chromosomes[idx].genes[i] = parent_other[idx].genes[i];
-  }
-
-  input_rand[idx] = ra[0];
+  __SimpleChromosome offspring;
+  simple_chromosome_build_offspring((global __SimpleChromosome*) cs, idx, other_idx, &offspring,
+                                    ra);
+  simple_chromosome_write(&offspring, ((global __SimpleChromosome*) next_cs) + idx);
 }
 
 #endif
@@ -4,7 +4,11 @@
 #include "ga_utils.c"
 
 
-void simple_gene_mutate(global int* gene, uint max, uint* ra) {
+void simple_gene_mutate(global GENE_TYPE* gene, uint max, ga_rand* ra) {
+  *gene = rand_range_exclude(ra, max, *gene);
+}
+
+void simple_gene_mutate_private(GENE_TYPE* gene, uint max, ga_rand* ra) {
   *gene = rand_range_exclude(ra, max, *gene);
 }
 
@@ -1,6 +1,11 @@
 #ifndef __tsp_fitness__
 #define __tsp_fitness__
 
+// The type of gene values, it's defined by OpenCLGA from the cardinality of genes.
+#ifndef GENE_TYPE
+#define GENE_TYPE int
+#endif
+
 typedef struct {
   float x;
   float y;
@@ -24,7 +29,7 @@ float calc_spherical_distance(float x1, float y1, float x2, float y2)
 
 void calc_spherical_fitness(int idx,
                             global Point* points,
-                            global int* chromosomes,
+                            global GENE_TYPE* chromosomes,
                             global float* distances,
                             int chromosome_size,
                             int chromosome_count)
@@ -46,7 +51,7 @@ void calc_spherical_fitness(int idx,
 
 void calc_linear_fitness(int idx,
                          global Point* points,
-                         global int* chromosomes,
+                         global GENE_TYPE* chromosomes,
                          global float* distances,
                          int chromosome_size,
                          int chromosome_count)
@@ -66,4 +71,93 @@ void calc_linear_fitness(int idx,
   distances[idx] = dist;
 }
 
+// The distance matrix of utils.create_distance_table. It's stored as half if TSP_TABLE_HALF is
+// defined. TSP_TABLE_PACKED keeps only the upper triangle without the diagonal, the distance of
+// a < b is at a * n - a * (a + 1) / 2 + b - a - 1.
+// TSP_TABLE_SPACE is the address space of the table, create_distance_table defines it as the one
+// chosen by OpenCLGA for the fitness argument.
+#ifndef TSP_TABLE_SPACE
+#define TSP_TABLE_SPACE global
+#endif
+#ifdef TSP_TABLE_HALF
+typedef half tsp_table_t;
+#define TSP_TABLE_LOAD(table, i) vload_half((i), (table))
+#else
+typedef float tsp_table_t;
+#define TSP_TABLE_LOAD(table, i) (table)[(i)]
+#endif
+
+float tsp_table_distance(TSP_TABLE_SPACE tsp_table_t* table, int n, int a, int b)
+{
+#ifdef TSP_TABLE_PACKED
+  if (a == b) {
+    return 0.0;
+  }
+  int low = min(a, b);
+  int high = max(a, b);
+  return TSP_TABLE_LOAD(table, low * n - low * (low + 1) / 2 + high - low - 1);
+#else
+  return TSP_TABLE_LOAD(table, a * n + b);
+#endif
+}
+
+// The length of a closed tour of n cities.
+float tsp_table_tour_length(TSP_TABLE_SPACE tsp_table_t* table, global GENE_TYPE* tour, int n)
+{
+  float dist = tsp_table_distance(table, n, tour[n - 1], tour[0]);
+  for (int i = 0; i < n - 1; i++) {
+    dist += tsp_table_distance(table, n, tour[i], tour[i + 1]);
+  }
+  return dist;
+}
+
+// The change of the tour length by swapping the cities at i and j. Only the 4 to 6 edges around
+// them are read, it's the delta helper of ShufflerChromosome.use_improving_only_mutation.
+float tsp_table_swap_delta(global GENE_TYPE* tour, int i, int j, int n,
+                           TSP_TABLE_SPACE tsp_table_t* table)
+{
+  if (i == j || n < 3) {
+    return 0.0;
+  }
+  int a = min(i, j);
+  int b = max(i, j);
+  if (a == 0 && b == n - 1) {
+    // the last city is followed by the first one.
+    a = n - 1;
+    b = 0;
+  }
+  int ta = tour[a];
+  int tb = tour[b];
+  int pa = tour[(a + n - 1) % n];
+  int nb = tour[(b + 1) % n];
+  if ((a + 1) % n == b) {
+    // adjacent cities, the edge between them is kept.
+    return tsp_table_distance(table, n, pa, tb) + tsp_table_distance(table, n, ta, nb) -
+           tsp_table_distance(table, n, pa, ta) - tsp_table_distance(table, n, tb, nb);
+  }
+  int na = tour[a + 1];
+  int pb = tour[b - 1];
+  return tsp_table_distance(table, n, pa, tb) + tsp_table_distance(table, n, tb, na) +
+         tsp_table_distance(table, n, pb, ta) + tsp_table_distance(table, n, ta, nb) -
+         tsp_table_distance(table, n, pa, ta) - tsp_table_distance(table, n, ta, na) -
+         tsp_table_distance(table, n, pb, tb) - tsp_table_distance(table, n, tb, nb);
+}
+
+// The distance function of ShufflerChromosome.use_local_search.
+float tsp_table_edge_distance(int a, int b, int n, TSP_TABLE_SPACE tsp_table_t* table)
+{
+  return tsp_table_distance(table, n, a, b);
+}
+
+void calc_table_fitness(int idx,
+                        TSP_TABLE_SPACE tsp_table_t* table,
+                        global GENE_TYPE* chromosomes,
+                        global float* distances,
+                        int chromosome_size,
+                        int chromosome_count)
+{
+  distances[idx] = tsp_table_tour_length(table, chromosomes + idx * chromosome_size,
+                                         chromosome_size);
+}
+
 #endif
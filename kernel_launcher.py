@@ -0,0 +1,143 @@
+import os
+import json
+import time
+import tempfile
+import pyopencl as cl
+
+DEFAULT_PROFILES_PATH = os.path.join(os.path.expanduser("~"), ".oclGA", "work_group_profiles.json")
+
+class KernelLauncher():
+    # KernelLauncher - launches the kernels of a program with one work-item per chromosome.
+    # The global size is padded to a multiple of the local size, all kernels must skip the
+    # work-items whose global id is out of the population.
+    # The local size of a kernel comes from the work-group profiles which are stored per device,
+    # problem signature and kernel name. If autotune is enabled, a kernel without a stored profile
+    # is benchmarked with candidate local sizes at its first launch and the fastest one is stored.
+    # The launches are recorded by the profiler if it's given, see kernel_profiler.py, the launches
+    # for tuning aren't recorded.
+    def __init__(self, ctx, prg, signature, profiles_path=None, autotune=False, repeat=3,
+                 profiler=None):
+        self.__ctx = ctx
+        self.__prg = prg
+        self.__signature = signature
+        self.__profiles_path = profiles_path if profiles_path is not None else DEFAULT_PROFILES_PATH
+        self.__autotune = autotune
+        self.__repeat = repeat
+        self.__profiler = profiler
+        self.__kernels = {}
+        self.__scratches = {}
+        device = ctx.devices[0]
+        self.__device = device
+        self.__device_key = "%s/%s/%s"%(device.platform.name, device.name, device.driver_version)
+        self.__local_sizes = self.__load_profiles().get(self.__device_key, {})\
+                                                   .get(self.__signature, {})
+
+    @property
+    def local_sizes(self):
+        return dict(self.__local_sizes)
+
+    def __load_profiles(self):
+        if not os.path.isfile(self.__profiles_path):
+            return {}
+        try:
+            with open(self.__profiles_path, "r") as f:
+                return json.load(f)
+        except ValueError:
+            # a broken profile is treated as an empty one, it will be rewritten after tuning.
+            return {}
+
+    def __save_profile(self, name, local_size):
+        # merge with the latest file to keep the profiles stored by other processes.
+        profiles = self.__load_profiles()
+        device_profiles = profiles.setdefault(self.__device_key, {})
+        device_profiles.setdefault(self.__signature, {})[name] = local_size
+        folder = os.path.dirname(self.__profiles_path)
+        if folder and not os.path.isdir(folder):
+            os.makedirs(folder, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=folder if folder else None, suffix=".tmp")
+        with os.fdopen(fd, "w") as f:
+            json.dump(profiles, f, indent=2, sort_keys=True)
+        os.replace(tmp_path, self.__profiles_path)
+
+    def __kernel(self, name):
+        # reuse the kernel objects, retrieving a kernel from program creates a new one every time.
+        if name not in self.__kernels:
+            self.__kernels[name] = cl.Kernel(self.__prg, name)
+        return self.__kernels[name]
+
+    def __candidates(self, name):
+        kernel = self.__kernel(name)
+        kwgi = cl.kernel_work_group_info
+        max_size = min(kernel.get_work_group_info(kwgi.WORK_GROUP_SIZE, self.__device), 1024)
+        multiple = kernel.get_work_group_info(kwgi.PREFERRED_WORK_GROUP_SIZE_MULTIPLE,
+                                              self.__device)
+        candidates = [1]
+        size = multiple
+        while size <= max_size:
+            if size not in candidates:
+                candidates.append(size)
+            size *= 2
+        return candidates
+
+    def __scratch(self, buf, idx):
+        key = (buf.size, idx)
+        if key not in self.__scratches:
+            self.__scratches[key] = cl.Buffer(self.__ctx, cl.mem_flags.READ_WRITE, buf.size)
+        return self.__scratches[key]
+
+    def __tune(self, queue, name, count, args, outputs, wait_for):
+        # The kernel is executed several times while tuning. The buffers it writes are copied to
+        # scratch buffers before and copied back after each candidate, so the tuning doesn't
+        # change the state of GA.
+        if wait_for:
+            cl.wait_for_events(wait_for)
+        backups = [self.__scratch(buf, idx) for idx, buf in enumerate(outputs)]
+        for buf, backup in zip(outputs, backups):
+            cl.enqueue_copy(queue, backup, buf)
+        queue.finish()
+
+        best_size = 1
+        best_time = None
+        for local_size in self.__candidates(name):
+            elapsed = []
+            for i in range(self.__repeat):
+                start = time.perf_counter()
+                self.__enqueue(queue, name, count, args, local_size, None).wait()
+                elapsed.append(time.perf_counter() - start)
+                for buf, backup in zip(outputs, backups):
+                    cl.enqueue_copy(queue, buf, backup)
+                queue.finish()
+            elapsed = sorted(elapsed)[len(elapsed) // 2]
+            if best_time is None or elapsed < best_time:
+                best_size = local_size
+                best_time = elapsed
+
+        self.__local_sizes[name] = best_size
+        self.__save_profile(name, best_size)
+        return best_size
+
+    def __enqueue(self, queue, name, count, args, local_size, wait_for):
+        global_size = (count + local_size - 1) // local_size * local_size
+        return self.__kernel(name)(queue, (global_size,), (local_size,), *args, wait_for=wait_for)
+
+    def launch(self, queue, name, count, args, local_size=None, outputs=None, wait_for=None):
+        # count - the number of work-items needed, the global size is padded from it.
+        # local_size - a fixed local size for the kernels which depend on it, e.g. reductions.
+        #              Otherwise, the local size is picked from the profiles.
+        # outputs - the buffers written by the kernel. They are restored after tuning.
+        if local_size is None:
+            local_size = self.__local_sizes.get(name, None)
+            if local_size is None and self.__autotune:
+                local_size = self.__tune(queue, name, count, args, outputs or [], wait_for)
+            elif local_size is None:
+                local_size = 1
+        evt = self.__enqueue(queue, name, count, args, local_size, wait_for)
+        if self.__profiler is not None:
+            self.__profiler.record(name, evt)
+        return evt
+
+    def record_transfer(self, name, evt):
+        # Records the event of a transfer by the profiler. Returns the event.
+        if self.__profiler is not None:
+            self.__profiler.record(name, evt, "transfer")
+        return evt
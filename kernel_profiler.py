@@ -0,0 +1,91 @@
+import json
+import pyopencl as cl
+
+class KernelProfiler():
+    # KernelProfiler records the OpenCL events of kernel launches and transfers of a queue which is
+    # created with PROFILING_ENABLE. The events are kept until they are completed, then their
+    # queued, submit, start and end times (nanoseconds of the device clock) are stored as records.
+    # generation is the index of the generation which is being enqueued, -1 while populating.
+    KINDS = ["kernel", "transfer"]
+
+    def __init__(self):
+        self.generation = -1
+        self.__pending = []
+        self.__records = []
+
+    def record(self, name, evt, kind="kernel"):
+        assert kind in KernelProfiler.KINDS
+        self.__pending.append((name, kind, self.generation, evt))
+        return evt
+
+    def resolve(self, wait=False):
+        # Moves the completed events to records. All events are waited if wait is True.
+        if wait and len(self.__pending) > 0:
+            cl.wait_for_events([evt for name, kind, generation, evt in self.__pending])
+        pending = []
+        for name, kind, generation, evt in self.__pending:
+            if evt.command_execution_status != cl.command_execution_status.COMPLETE:
+                pending.append((name, kind, generation, evt))
+                continue
+            profile = evt.profile
+            self.__records.append({"name": name, "kind": kind, "generation": generation,
+                                   "queued": profile.queued, "submit": profile.submit,
+                                   "start": profile.start, "end": profile.end})
+        self.__pending = pending
+
+    def clear(self):
+        self.__pending = []
+        self.__records = []
+
+    @property
+    def records(self):
+        return self.__records
+
+    def summary(self):
+        # Aggregates records per name and per generation, the times are in milliseconds.
+        # "kernels" - name : {"kind", "count", "total", "mean", "min", "max", "queue_wait"}, the
+        #             queue_wait is the mean time from queued to start.
+        # "generations" - generation : {"total", name : total time of the name}
+        names = {}
+        generations = {}
+        for record in self.__records:
+            duration = (record["end"] - record["start"]) * 1e-6
+            wait = (record["start"] - record["queued"]) * 1e-6
+            if record["name"] not in names:
+                names[record["name"]] = {"kind": record["kind"], "count": 0, "total": 0.0,
+                                         "min": duration, "max": duration, "queue_wait": 0.0}
+            aggregate = names[record["name"]]
+            aggregate["count"] += 1
+            aggregate["total"] += duration
+            aggregate["min"] = min(aggregate["min"], duration)
+            aggregate["max"] = max(aggregate["max"], duration)
+            aggregate["queue_wait"] += wait
+            generation = generations.setdefault(record["generation"], {"total": 0.0})
+            generation["total"] += duration
+            generation[record["name"]] = generation.get(record["name"], 0.0) + duration
+        for aggregate in names.values():
+            aggregate["mean"] = aggregate["total"] / aggregate["count"]
+            aggregate["queue_wait"] /= aggregate["count"]
+        return {"kernels": names, "generations": generations}
+
+    def export_chrome_trace(self, path):
+        # Writes the records as the Trace Event Format which is loaded by chrome://tracing or
+        # Perfetto. Kernels and transfers are at separated rows, the times are in microseconds
+        # from the first queued command.
+        base = min(record["queued"] for record in self.__records) if self.__records else 0
+        events = []
+        for record in self.__records:
+            events.append({"name": record["name"],
+                           "cat": record["kind"],
+                           "ph": "X",
+                           "pid": 0,
+                           "tid": KernelProfiler.KINDS.index(record["kind"]),
+                           "ts": (record["start"] - base) * 1e-3,
+                           "dur": (record["end"] - record["start"]) * 1e-3,
+                           "args": {"generation": record["generation"],
+                                    "queued": (record["queued"] - base) * 1e-3,
+                                    "submit": (record["submit"] - base) * 1e-3}})
+        metadata = [{"name": "thread_name", "ph": "M", "pid": 0, "tid": i, "args": {"name": kind}}
+                    for i, kind in enumerate(KernelProfiler.KINDS)]
+        with open(path, "w") as f:
+            json.dump({"traceEvents": metadata + events, "displayTimeUnit": "ms"}, f)
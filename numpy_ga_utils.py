@@ -0,0 +1,48 @@
+import numpy
+
+# NumPy counterparts of kernel/ga_utils.c. They are used by the numpy backend of OpenCLGA which
+# runs every GA stage as batched array operations over the whole population.
+
+def utils_calc_ratio(fitnesses, opt_for_max):
+    # Returns the cumulative ratio of each chromosome plus best, worst and avg fitness. The ratio
+    # is calculated in the same way as utils_calc_ratio in ga_utils.c.
+    if opt_for_max:
+        best = fitnesses.max()
+        worst = fitnesses.min()
+    else:
+        best = fitnesses.min()
+        worst = fitnesses.max()
+    diff = (worst - fitnesses) ** 2
+    diff_total = diff.sum()
+    avg = fitnesses.mean()
+    if diff_total > 0:
+        cumulative = numpy.cumsum(diff / diff_total)
+    else:
+        cumulative = numpy.linspace(1.0 / len(fitnesses), 1.0, len(fitnesses))
+    return cumulative, best, worst, avg
+
+def random_choose_by_ratio(rng, cumulative, count):
+    # Picks count indices by the cumulative ratio with a binary search for each random number.
+    chosen = numpy.searchsorted(cumulative, rng.random(count), side="right")
+    return numpy.minimum(chosen, len(cumulative) - 1)
+
+def top_k(fitnesses, k, opt_for_max):
+    # Returns the indices of the best k fitnesses from the best one, the counterpart of ocl_ga_top_k
+    # in ocl_ga.c. argpartition only sorts the selected k.
+    keys = -fitnesses if opt_for_max else fitnesses
+    chosen = numpy.argpartition(keys, k - 1)[:k] if k < len(keys) else numpy.arange(len(keys))
+    return chosen[numpy.argsort(keys[chosen], kind="stable")]
+
+def elements_array(elements):
+    # The gene elements as a 1D array, so kernel values are decoded by indexing it. The elements
+    # which numpy converts to more dimensions, e.g. tuples of coordinates, are kept as objects.
+    try:
+        array = numpy.array(elements)
+    except ValueError:
+        array = None
+    if array is not None and array.ndim == 1:
+        return array
+    array = numpy.empty(len(elements), dtype=object)
+    for i, element in enumerate(elements):
+        array[i] = element
+    return array
@@ -5,14 +5,39 @@ import sys
 import time
 import random
 import numpy
+import threading
 import pickle
-import pyopencl as cl
+import ga_snapshot
+import numpy_ga_utils
+import ga_statistics
+from ga_statistics import GAStatistics
+from ga_checkpoint import BackgroundCheckpointer
+from callback_dispatcher import CallbackDispatcher
+try:
+    import pyopencl as cl
+except ImportError:
+    # pyopencl is optional while running with the numpy backend.
+    cl = None
+else:
+    from kernel_launcher import KernelLauncher
+    from kernel_profiler import KernelProfiler
+    from program_cache import ProgramCache
 
 class OpenCLGA():
+    # The maximal k of get_top_k which is selected at device, see ocl_ga_top_k in ocl_ga.c.
+    TOP_K_MAX = 64
+
     def __init__(self, options):
         self.__init_members(options)
-        self.__init_cl(options["extra_include_path"] if "extra_include_path" in options else [])
-        self.__create_program()
+        if self.__backend == "opencl":
+            self.__init_cl(options["extra_include_path"] if "extra_include_path" in options else [])
+            self.__place_fitness_args()
+            self.__create_program()
+        if self.__checkpoint_path is not None:
+            self.__checkpointer = BackgroundCheckpointer(self.__checkpoint_path,
+                                                         self.__checkpoint_compress,
+                                                         self.__ctx if self.__backend == "opencl"\
+                                                                    else None)
 
     # public properties
     @property
@@ -23,6 +48,11 @@ class OpenCLGA():
     def elapsed_time(self):
         return self.__elapsed_time
 
+    @property
+    def dropped_callbacks(self):
+        # the number of generation_callback calls dropped by callback_policy.
+        return 0 if self.__callback_dispatcher is None else self.__callback_dispatcher.dropped
+
     # private properties
     @property
     def __args_codes(self):
@@ -32,25 +62,48 @@ class OpenCLGA():
     @property
     def __populate_codes(self):
         return "#define POPULATION_SIZE " + str(self.__population) + "\n" +\
-               "#define CHROMOSOME_TYPE " +  self.__sample_chromosome.struct_name + "\n"
+               "#define CHROMOSOME_TYPE " +  self.__sample_chromosome.struct_name + "\n" +\
+               "#define GENE_TYPE " + self.__sample_chromosome.gene_type + "\n"
 
     @property
     def __evaluate_code(self):
         chromosome = self.__sample_chromosome
-        if self.__fitness_args is not None:
-            fit_args = ", ".join(["global " + v["t"] + "* _f_" + v["n"] for v in self.__fitness_args])
-            fit_argv = ", ".join(["_f_" + v["n"] for v in self.__fitness_args])
-            if len(fit_args) > 0:
-                fit_args = ", " + fit_args
-                fit_argv = ", " + fit_argv
-        else:
-            fit_args = ""
-            fit_argv = ""
+        # FITNESS_ARGS is the parameters of fitness functions and helpers. FITNESS_KERNEL_ARGS is
+        # the one of kernels, which takes the global buffer of a local argument too, and
+        # FITNESS_PRELOAD copies them to local memory. FITNESS_SPACE_<name> is the address space
+        # of an argument for declaring it at fitness functions.
+        fit_args = ""
+        fit_argv = ""
+        kernel_args = ""
+        preload = ""
+        extensions = ""
+        spaces = ""
+        for arg, place in zip(self.__fitness_args or [], self.__fitness_places):
+            name = arg["n"]
+            fit_args += ", " + place + " " + arg["t"] + "* _f_" + name
+            fit_argv += ", _f_" + name
+            spaces += "#define FITNESS_SPACE_" + name + " " + place + "\n"
+            if place == "local":
+                kernel_args += ", global " + arg["t"] + "* _g_" + name +\
+                               ", local " + arg["t"] + "* _f_" + name
+                # half can't be assigned without cl_khr_fp16, it's copied as ushort.
+                copy_type = "ushort" if arg["t"] == "half" else arg["t"]
+                preload += "GA_PRELOAD_LOCAL(%s, _f_%s, _g_%s, %d) "%(copy_type, name, name,
+                                                                      numpy.size(arg["v"]))
+            else:
+                kernel_args += ", " + place + " " + arg["t"] + "* _f_" + name
+            if arg["t"] == "double" and len(extensions) == 0:
+                extensions = "#pragma OPENCL EXTENSION cl_khr_fp64 : enable\n"
+        if len(preload) > 0:
+            preload += "barrier(CLK_LOCAL_MEM_FENCE);"
 
-        return "#define CHROMOSOME_SIZE " + chromosome.chromosome_size_define + "\n" +\
+        return extensions + spaces +\
+               "#define CHROMOSOME_SIZE " + chromosome.chromosome_size_define + "\n" +\
                "#define CALCULATE_FITNESS " + self.__fitness_function + "\n" +\
                "#define FITNESS_ARGS " + fit_args + "\n"+\
-               "#define FITNESS_ARGV " + fit_argv + "\n"
+               "#define FITNESS_ARGV " + fit_argv + "\n" +\
+               "#define FITNESS_KERNEL_ARGS " + kernel_args + "\n" +\
+               "#define FITNESS_PRELOAD " + preload + "\n"
 
     @property
     def __include_code(self):
@@ -59,6 +112,43 @@ class OpenCLGA():
                "#include \"" + sample_gene.kernel_file + "\"\n" +\
                "#include \"" + self.__sample_chromosome.kernel_file + "\"\n\n"
 
+    @property
+    def __problem_signature(self):
+        # the kernels are tuned per chromosome type, fitness function and population.
+        return "%s/%d/%s/%d"%(self.__sample_chromosome.struct_name,
+                              self.__sample_chromosome.num_of_genes,
+                              self.__fitness_function,
+                              self.__population)
+
+    @property
+    def __island_code(self):
+        if self.__local_island_size is None:
+            return ""
+        return "\n#include \"" + self.__sample_chromosome.island_kernel_file + "\"\n"
+
+    @property
+    def __fused_code(self):
+        if not self.__fused_generation:
+            return ""
+        return "\n#include \"" + self.__sample_chromosome.fused_kernel_file + "\"\n"
+
+    @property
+    def __local_search_code(self):
+        # the local search kernel of the chromosome, it's included after fitness function.
+        kernel_file = getattr(self.__sample_chromosome, "local_search_kernel_file", None)
+        if kernel_file is None:
+            return ""
+        return "\n#include \"" + kernel_file + "\"\n"
+
+    @property
+    def __generations_per_execution(self):
+        return 1 if self.__local_island_size is None else self.__local_island_generations
+
+    @property
+    def __last_events(self):
+        # the event list which the next generation waits for.
+        return None if self.__last_event is None else [self.__last_event]
+
     # private methods
     def __init_members(self, options):
         self.__sample_chromosome = options["sample_chromosome"]
@@ -66,15 +156,36 @@ class OpenCLGA():
         self.__population = options["population"]
         self.__opt_for_max = options["opt_for_max"] if "opt_for_max" in options else "max"
         self.__np_chromosomes = None
+        self.__dev_top_fitnesses = None
         self.__fitness_function = options["fitness_func"]
-        self.__fitness_kernel_str = options["fitness_kernel_str"]
+        self.__fitness_kernel_str = options["fitness_kernel_str"]\
+                                        if "fitness_kernel_str" in options else None
+        # A fitness argument is {"t": OpenCL type, "v": values, "n": name, "p": placement}. The
+        # placement is "global" (default), "constant", "local" (loaded by each work-group at the
+        # start of kernels) or "auto", see __place_fitness_args.
         self.__fitness_args = options["fitness_args"] if "fitness_args" in options else None
+        self.__fitness_places = []
+        # "opencl" runs all stages as OpenCL kernels. "numpy" runs them as batched NumPy array
+        # operations at host and fitness_func is a vectorized python function which is called as
+        # fitness_func(chromosomes, *fitness_args) and returns fitnesses of all chromosomes.
+        self.__backend = options["backend"] if "backend" in options else "opencl"
+        # The OpenCL device to run on. A context is created by create_some_context if it's None.
+        self.__device = options["device"] if "device" in options else None
+        assert self.__backend in ["opencl", "numpy"]
+        # The random numbers of kernels are generated by Philox keyed on the seed, see ga_utils.c.
+        # The same seed gives the same evolution. It's drawn from python random module by default
+        # to keep random.seed working.
+        self.__rand_seed = numpy.uint64(options["seed"] if "seed" in options\
+                                            else random.getrandbits(64))
+        assert self.__backend == "opencl" or callable(self.__fitness_function)
 
-        # { gen : {"best":  best_fitness,
-        #          "worst": worst_fitness,
-        #          "avg":   avg_fitness},
-        #  "avg_time_per_gen": avg. elapsed time per generation}
-        self.__dictStatistics = {}
+        # The statistics of generations are kept as the records of ga_statistics.DTYPE. They are
+        # streamed to the file at statistics_path if it's given. statistics_diversity calculates
+        # the diversity of genes which reads the whole population at device for each generation.
+        self.__statistics = GAStatistics(options["statistics_path"]\
+                                             if "statistics_path" in options else None)
+        self.__statistics_diversity = options["statistics_diversity"]\
+                                          if "statistics_diversity" in options else False
 
         # Generally in GA, it depends on the problem to treat the maximal fitness
         # value as the best or to treat the minimal fitness value as the best.
@@ -84,9 +195,95 @@ class OpenCLGA():
         self.__forceStop = False;
         self.__generation_index = 0
         self.__generation_time_diff = 0
+        # The migrants of put_migrants wait here until the GA thread writes them at the end of a
+        # batch. The population lock is held while a generation is enqueued, so get_migrants from
+        # another thread, e.g. an asynchronous generation_callback, never reads a half swapped
+        # population.
+        self.__migrants = []
+        self.__migrants_lock = threading.Lock()
+        self.__population_lock = threading.RLock()
         self.__debug_mode = "debug" in options
         self.__generation_callback = options["generation_callback"]\
                                         if "generation_callback" in options else None
+        # generation_callback is called by a background thread through a queue of
+        # callback_queue_size calls if it's given, see callback_dispatcher.py for callback_policy.
+        # It's called at the evolution loop otherwise.
+        self.__callback_dispatcher = None
+        # Records the times of kernel launches and transfers by OpenCL events, see get_profile.
+        self.__profile = options["profile"] if "profile" in options else False
+        self.__profiler = None
+        if self.__generation_callback is not None and "callback_queue_size" in options:
+            self.__callback_dispatcher = CallbackDispatcher(self.__generation_callback,
+                                                            options["callback_queue_size"],
+                                                            options["callback_policy"]\
+                                                                if "callback_policy" in options\
+                                                                else "block")
+        # The number of generations enqueued to the device before the host waits for it. The
+        # statistics of a batch are written to a ring buffer at device and read back in bulk at
+        # the last generation of a batch, on pause and on the end.
+        # The convergence is checked at the device, the kernels of a generation return early once
+        # best and worst meet, but the host only learns it from the statistics of a batch. So a
+        # converged run still enqueues the rest of its batch, as generations which keep the
+        # population as it is, and early termination is decided at the batch boundary.
+        self.__batch_generations = options["batch_generations"]\
+                                        if "batch_generations" in options else 1
+        assert self.__batch_generations >= 1
+        # Benchmarks the local sizes of kernels which aren't tuned for the device and the problem
+        # yet. The tuned local sizes are stored at work_group_profiles and reused by later runs.
+        self.__autotune = options["autotune"] if "autotune" in options else False
+        self.__work_group_profiles = options["work_group_profiles"]\
+                                        if "work_group_profiles" in options else None
+        # The built program binaries are cached at program_cache_path (~/.oclGA/programs by
+        # default), and the least recently used ones are evicted beyond program_cache_size bytes.
+        # Set program_cache to False to always build from the source.
+        self.__use_program_cache = options["program_cache"] if "program_cache" in options else True
+        self.__program_cache_path = options["program_cache_path"]\
+                                        if "program_cache_path" in options else None
+        self.__program_cache_size = options["program_cache_size"]\
+                                        if "program_cache_size" in options else None
+        # The persistent island engine evolves local_island_size chromosomes per work-group at
+        # local memory for local_island_generations generations in a launch. It's only supported
+        # by the chromosome which has island_kernel_file.
+        self.__local_island_size = options["local_island_size"]\
+                                        if "local_island_size" in options else None
+        self.__local_island_generations = options["local_island_generations"]\
+                                        if "local_island_generations" in options else 10
+        assert self.__local_island_size is None or\
+               (self.__backend == "opencl" and hasattr(self.__sample_chromosome,
+                                                       "island_kernel_file"))
+        # The fused generation selects, crosses over, mutates and evaluates an offspring in a
+        # single launch after calc_ratio. It's only supported by the chromosome which has
+        # fused_kernel_file, and the persistent island engine is fused already.
+        self.__fused_generation = options["fused_generation"]\
+                                        if "fused_generation" in options else False
+        assert not self.__fused_generation or\
+               (self.__backend == "opencl" and self.__local_island_size is None and\
+                hasattr(self.__sample_chromosome, "fused_kernel_file"))
+        # Writes a snapshot to checkpoint_path every checkpoint_interval generations while running.
+        # The device buffers are copied at device and the snapshot is written by a background
+        # thread, see ga_checkpoint.py. It can be restored as the file of save.
+        self.__checkpoint_path = options["checkpoint_path"]\
+                                    if "checkpoint_path" in options else None
+        self.__checkpoint_interval = options["checkpoint_interval"]\
+                                        if "checkpoint_interval" in options else 100
+        self.__checkpoint_compress = options["checkpoint_compress"]\
+                                        if "checkpoint_compress" in options else False
+        assert self.__checkpoint_interval >= 1
+        self.__checkpointer = None
+        self.__evolution_start_time = None
+        assert self.__backend == "opencl" or\
+               getattr(self.__sample_chromosome, "local_search_kernel_file", None) is None,\
+               "local search is only supported by the opencl backend"
+        # local search shortens tours, the best chromosomes are the ones of the lowest fitnesses.
+        assert self.__opt_for_max == "min" or\
+               getattr(self.__sample_chromosome, "local_search_kernel_file", None) is None,\
+               "local search is only supported with opt_for_max \"min\""
+        self.__last_event = None
+        # The generation indices of the records at the ring buffer which aren't read back yet.
+        self.__pending_statistics = []
+        self.__dev_statistics = None
+        # It is only updated while the statistics are read back from the device.
+        self.__early_terminated = False
 
     def __init_cl(self, extra_include_path):
         # create OpenCL context, queue, and memory
@@ -94,11 +291,17 @@ class OpenCLGA():
         #       at first if it"s in external_process mode, otherwise a exception
         #       will be thrown, since it"s not in interactive mode.
         # TODO: Select a reliable device during runtime by default.
-        self.__ctx = cl.create_some_context()
-        self.__queue = cl.CommandQueue(self.__ctx)
+        self.__ctx = cl.create_some_context() if self.__device is None\
+                                              else cl.Context([self.__device])
+        self.__queue = cl.CommandQueue(self.__ctx,
+                                       properties=cl.command_queue_properties.PROFILING_ENABLE\
+                                                  if self.__profile else 0)
+        self.__profiler = KernelProfiler() if self.__profile else None
         self.__include_path = []
         kernel_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "kernel")
         paths = extra_include_path + [kernel_path]
+        # the program cache reads the included files from the unescaped paths.
+        self.__include_dirs = [os.path.join(os.getcwd(), path) for path in paths]
         for path in paths:
             escapedPath = path.replace(" ", "^ ") if sys.platform.startswith("win")\
                                                   else path.replace(" ", "\\ ")
@@ -117,20 +320,99 @@ class OpenCLGA():
         f = open(os.path.join(kernel_path, "ocl_ga.c"), "r")
         fstr = "".join(f.readlines())
         f.close()
+        source = codes + fstr + self.__island_code + self.__fused_code + self.__local_search_code
         if self.__debug_mode:
             fdbg = open("final.cl", "w")
-            fdbg.write(codes + fstr)
+            fdbg.write(source)
             fdbg.close()
 
-        self.__prg = cl.Program(self.__ctx, codes + fstr).build(self.__include_path);
+        if self.__use_program_cache:
+            cache = ProgramCache(self.__program_cache_path, self.__program_cache_size)
+            self.__prg = cache.build(self.__ctx, source, self.__include_path, self.__include_dirs)
+        else:
+            self.__prg = cl.Program(self.__ctx, source).build(self.__include_path);
+        self.__launcher = KernelLauncher(self.__ctx,
+                                         self.__prg,
+                                         self.__problem_signature,
+                                         self.__work_group_profiles,
+                                         self.__autotune,
+                                         profiler=self.__profiler)
 
     def __type_to_numpy_type(self, t):
-        if t == "float":
-            return numpy.float32
-        elif t == "int":
-            return numpy.int32
-        else:
-            raise "unsupported python type"
+        types = {"char": numpy.int8, "uchar": numpy.uint8,
+                 "short": numpy.int16, "ushort": numpy.uint16,
+                 "int": numpy.int32, "uint": numpy.uint32,
+                 "half": numpy.float16, "float": numpy.float32, "double": numpy.float64}
+        assert t in types, "unsupported fitness argument type %s"%(t)
+        return types[t]
+
+    def __place_fitness_args(self):
+        # Chooses the address space of each fitness argument. "auto" picks constant memory if the
+        # argument fits the remained constant buffer size of the device, then local memory if it
+        # fits half of the local memory and the island engine doesn't use it, or global memory.
+        self.__fitness_places = []
+        if self.__fitness_args is None:
+            return
+        device = self.__ctx.devices[0]
+        constant_size = device.max_constant_buffer_size
+        constant_args = device.max_constant_args
+        # the other half of local memory is kept for kernels, e.g. the reduction of calc_ratio.
+        local_size = device.local_mem_size // 2
+        for arg in self.__fitness_args:
+            place = arg["p"] if "p" in arg else "global"
+            assert place in ["global", "constant", "local", "auto"]
+            assert arg["t"] != "double" or "cl_khr_fp64" in device.extensions,\
+                   "the device doesn't support double"
+            nbytes = numpy.array(arg["v"], dtype=self.__type_to_numpy_type(arg["t"])).nbytes
+            if place == "auto":
+                if nbytes <= constant_size and constant_args > 0:
+                    place = "constant"
+                elif nbytes <= local_size and self.__local_island_size is None:
+                    place = "local"
+                else:
+                    place = "global"
+            if place == "constant":
+                assert nbytes <= constant_size and constant_args > 0,\
+                       "fitness argument %s doesn't fit in constant memory"%(arg["n"])
+                constant_size -= nbytes
+                constant_args -= 1
+            elif place == "local":
+                assert nbytes <= local_size,\
+                       "fitness argument %s doesn't fit in local memory"%(arg["n"])
+                local_size -= nbytes
+            self.__fitness_places.append(place)
+
+    def __create_fitness_args_list(self):
+        # The arguments of fitness kernel. A fitness argument at local memory is followed by the
+        # local memory to load it.
+        self.__fitness_args_list = [self.__dev_chromosomes, self.__dev_fitnesses]
+        if self.__fitness_args is None:
+            return
+        mf = cl.mem_flags
+        for arg, place in zip(self.__fitness_args, self.__fitness_places):
+            values = numpy.array(arg["v"], dtype=self.__type_to_numpy_type(arg["t"]))
+            self.__fitness_args_list.append(cl.Buffer(self.__ctx,
+                                                      mf.READ_ONLY | mf.COPY_HOST_PTR,
+                                                      hostbuf=values))
+            if place == "local":
+                self.__fitness_args_list.append(cl.LocalMemory(values.nbytes))
+
+    def __create_next_population(self):
+        # The population which the crossover writes the offspring to, it's swapped with the
+        # current one at each generation. The persistent island engine evolves in place.
+        if self.__local_island_size is not None:
+            return
+        mf = cl.mem_flags
+        self.__dev_next_chromosomes = cl.Buffer(self.__ctx, mf.READ_WRITE,
+                                                self.__dev_chromosomes.size)
+        self.__dev_next_fitnesses = cl.Buffer(self.__ctx, mf.READ_WRITE, self.__dev_fitnesses.size)
+
+    def __swap_populations(self):
+        self.__dev_chromosomes, self.__dev_next_chromosomes =\
+            self.__dev_next_chromosomes, self.__dev_chromosomes
+        self.__dev_fitnesses, self.__dev_next_fitnesses =\
+            self.__dev_next_fitnesses, self.__dev_fitnesses
+        self.__fitness_args_list[0:2] = [self.__dev_chromosomes, self.__dev_fitnesses]
 
     def __dump_kernel_info(self, prog, ctx, chromosome_wrapper, device = None):
         sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
@@ -152,117 +434,419 @@ class OpenCLGA():
         total_dna_size = self.__population * self.__sample_chromosome.dna_total_length
 
         self.__fitnesses = numpy.zeros(self.__population, dtype=numpy.float32)
-        self.__np_chromosomes = numpy.zeros(total_dna_size, dtype=numpy.int32)
+        self.__np_chromosomes = numpy.zeros(total_dna_size,
+                                           dtype=self.__sample_chromosome.gene_dtype)
 
         mf = cl.mem_flags
-        # Random number should be given by Host program because OpenCL doesn't have a random number
-        # generator. We just include one, Noise.cl.
-        rnum = [random.randint(0, 4294967295) for i in range(self.__population)]
-        ## note: numpy.random.rand() gives us a list float32 and we cast it to uint32 at the calling
-        ##       of kernel function. It just views the original byte order as uint32.
-        self.__dev_rnum = cl.Buffer(self.__ctx, mf.READ_WRITE | mf.COPY_HOST_PTR,
-                             hostbuf=numpy.array(rnum, dtype=numpy.uint32))
-
         self.__dev_chromosomes = cl.Buffer(self.__ctx, mf.READ_WRITE | mf.COPY_HOST_PTR,
                                     hostbuf=self.__np_chromosomes)
         self.__dev_fitnesses = cl.Buffer(self.__ctx, mf.WRITE_ONLY, self.__fitnesses.nbytes)
+        self.__create_next_population()
 
-        self.__fitness_args_list = [self.__dev_chromosomes, self.__dev_fitnesses]
+        ## create buffers for fitness arguments
+        self.__create_fitness_args_list()
 
-        if self.__fitness_args is not None:
-            ## create buffers for fitness arguments
-            for arg in self.__fitness_args:
-                self.__fitness_args_list.append(cl.Buffer(self.__ctx,
-                                                     mf.READ_ONLY | mf.COPY_HOST_PTR,
-                                                     hostbuf=numpy.array(arg["v"],
-                                                     dtype=self.__type_to_numpy_type(arg["t"]))))
-
-        cl.enqueue_copy(self.__queue, self.__dev_fitnesses, self.__fitnesses)
+        self.__launcher.record_transfer("write_fitnesses",
+                                        cl.enqueue_copy(self.__queue, self.__dev_fitnesses,
+                                                        self.__fitnesses))
 
         ## call preexecute_kernels for internal data structure preparation
         self.__sample_chromosome.preexecute_kernels(self.__ctx, self.__queue, self.__population)
+        if self.__local_island_size is not None:
+            self.__sample_chromosome.init_island_kernel(self.__ctx, self.__queue, self.__population,
+                                                        self.__local_island_size)
 
         ## dump information on kernel resources usage
         self.__dump_kernel_info(self.__prg, self.__ctx, self.__sample_chromosome)
 
+    def __preexecute_numpy(self):
+        total_dna_size = self.__population * self.__sample_chromosome.dna_total_length
+
+        self.__fitnesses = numpy.zeros(self.__population, dtype=numpy.float32)
+        self.__np_chromosomes = numpy.zeros(total_dna_size,
+                                           dtype=self.__sample_chromosome.gene_dtype)
+        self.__rng = numpy.random.default_rng(int(self.__rand_seed))
+        self.__np_fitness_args = []
+        if self.__fitness_args is not None:
+            for arg in self.__fitness_args:
+                self.__np_fitness_args.append(numpy.array(arg["v"],
+                                                          dtype=self.__type_to_numpy_type(arg["t"])))
+
+    @property
+    def __np_chromosomes_2d(self):
+        return self.__np_chromosomes.reshape(self.__population, -1)
+
+    def __calculate_fitness_numpy(self):
+        self.__fitnesses[:] = self.__fitness_function(self.__np_chromosomes_2d,
+                                                      *self.__np_fitness_args)
+
+    def __populate_first_generations_numpy(self):
+        self.__sample_chromosome.numpy_populate(self.__rng, self.__np_chromosomes_2d)
+        self.__calculate_fitness_numpy()
+
+    def __execute_single_generation_numpy(self, index, prob_mutate, prob_crossover):
+        self.__sample_chromosome.numpy_crossover(self.__rng,
+                                                 self.__np_chromosomes_2d,
+                                                 self.__fitnesses,
+                                                 prob_crossover,
+                                                 self.__opt_for_max == "max")
+        self.__sample_chromosome.numpy_mutation(self.__rng,
+                                                self.__np_chromosomes_2d,
+                                                prob_mutate)
+        self.__calculate_fitness_numpy()
+
+    def __read_population(self):
+        # Reads the whole population back, the numpy backend always keeps it at host memory.
+        if self.__backend == "numpy":
+            return
+        self.__read_buffers()
+
+    def __read_buffers(self):
+        record = self.__launcher.record_transfer
+        record("read_fitnesses",
+               cl.enqueue_copy(self.__queue, self.__fitnesses, self.__dev_fitnesses))
+        record("read_chromosomes",
+               cl.enqueue_copy(self.__queue, self.__np_chromosomes, self.__dev_chromosomes))
+
+    def __top_k_cl(self, k):
+        # Selects the best k chromosomes by ocl_ga_top_k and reads back only them.
+        sample = self.__sample_chromosome
+        device = self.__queue.device
+        if self.__dev_top_fitnesses is None:
+            mf = cl.mem_flags
+            row_size = numpy.dtype(sample.gene_dtype).itemsize * sample.dna_total_length
+            self.__dev_top_chromosomes = cl.Buffer(self.__ctx, mf.WRITE_ONLY,
+                                                   OpenCLGA.TOP_K_MAX * row_size)
+            self.__dev_top_fitnesses = cl.Buffer(self.__ctx, mf.WRITE_ONLY, OpenCLGA.TOP_K_MAX * 4)
+            kernel = cl.Kernel(self.__prg, "ocl_ga_top_k")
+            max_size = kernel.get_work_group_info(cl.kernel_work_group_info.WORK_GROUP_SIZE,
+                                                  device)
+            self.__top_k_local_size = min(64, max_size)
+        # each work-item keeps k fitnesses and indices at local memory.
+        local_size = self.__top_k_local_size
+        while local_size > 1 and local_size * k * 8 > device.local_mem_size // 2:
+            local_size //= 2
+        evt = self.__launcher.launch(self.__queue,
+                                     "ocl_ga_top_k",
+                                     local_size,
+                                     [self.__dev_chromosomes,
+                                      self.__dev_fitnesses,
+                                      self.__dev_top_chromosomes,
+                                      self.__dev_top_fitnesses,
+                                      numpy.int32(k),
+                                      cl.LocalMemory(4 * local_size * k),
+                                      cl.LocalMemory(4 * local_size * k)],
+                                     local_size=local_size,
+                                     wait_for=self.__last_events)
+        chromosomes = numpy.empty((k, sample.dna_total_length), dtype=sample.gene_dtype)
+        fitnesses = numpy.empty(k, dtype=numpy.float32)
+        record = self.__launcher.record_transfer
+        record("read_top_chromosomes",
+               cl.enqueue_copy(self.__queue, chromosomes, self.__dev_top_chromosomes,
+                               wait_for=[evt]))
+        record("read_top_fitnesses",
+               cl.enqueue_copy(self.__queue, fitnesses, self.__dev_top_fitnesses, wait_for=[evt]))
+        return chromosomes, fitnesses
+
     def __populate_first_generations(self, prob_mutate, prob_crossover):
+        if self.__backend == "numpy":
+            self.__populate_first_generations_numpy()
+            return
+
         ## populate the first generation
-        self.__sample_chromosome.execute_populate(self.__prg,
-                                                  self.__queue,
-                                                  self.__population,
-                                                  self.__dev_chromosomes,
-                                                  self.__dev_rnum)
-
-        self.__prg.ocl_ga_calculate_fitness(self.__queue,
-                                            (self.__population,),
-                                            (1,),
-                                            *self.__fitness_args_list).wait()
-
-    def __execute_single_generation(self, index, prob_mutate, prob_crossover):
-        self.__sample_chromosome.execute_crossover(self.__prg,
-                                                   self.__queue,
+        evt = self.__sample_chromosome.execute_populate(self.__launcher,
+                                                        self.__queue,
+                                                        self.__population,
+                                                        self.__dev_chromosomes,
+                                                        self.__rand_seed)
+
+        self.__last_event = self.__launcher.launch(self.__queue,
+                                                   "ocl_ga_calculate_fitness",
+                                                   self.__population,
+                                                   self.__fitness_args_list,
+                                                   outputs=[self.__dev_fitnesses],
+                                                   wait_for=[evt])
+        self.__last_event.wait()
+
+    def __execute_generations(self, index, generations, prob_mutate, prob_crossover):
+        # generations is always 1 except for the persistent island engine.
+        # The population lock isn't held while the statistics are delivered, a blocked
+        # generation_callback may wait for get_migrants.
+        if self.__backend == "numpy":
+            with self.__population_lock:
+                self.__execute_single_generation_numpy(index, prob_mutate, prob_crossover)
+                values = ga_statistics.calculate(self.__np_chromosomes_2d, self.__fitnesses,
+                                                 self.__opt_for_max == "max",
+                                                 self.__statistics_diversity)
+            self.__append_statistics([index], values.reshape(1, -1))
+            self.__apply_migrants()
+        else:
+            # The kernels of a generation are chained by events without waiting for the device. The
+            # host only synchronizes with the device at the last generation of a batch, where the
+            # early termination is checked by the statistics read back.
+            with self.__population_lock:
+                self.__enqueue_generations_cl(index, generations, prob_mutate, prob_crossover)
+            if (index + generations) // self.__batch_generations >\
+               index // self.__batch_generations or\
+               len(self.__pending_statistics) == self.__batch_generations:
+                self.__sync_statistics()
+                self.__apply_migrants()
+
+        if self.__checkpointer is not None and\
+           (index + generations) // self.__checkpoint_interval >\
+           index // self.__checkpoint_interval:
+            self.__checkpoint(index + generations)
+
+    def __enqueue_generations_cl(self, index, generations, prob_mutate, prob_crossover):
+        if self.__profiler is not None:
+            self.__profiler.generation = index
+        if self.__fused_generation:
+            self.__execute_fused_generation_cl(index, prob_mutate, prob_crossover)
+        elif self.__local_island_size is None:
+            self.__execute_single_generation_cl(index, prob_mutate, prob_crossover)
+        else:
+            self.__execute_island_generations_cl(index, generations, prob_mutate, prob_crossover)
+        if self.__local_search_code != "":
+            self.__execute_local_search_cl(index, generations)
+        self.__execute_statistics_cl(index + generations - 1)
+
+    def __apply_migrants(self):
+        # Replaces the worst chromosomes with the queued migrants.
+        with self.__migrants_lock:
+            migrants = self.__migrants
+            self.__migrants = []
+        with self.__population_lock:
+            for chromosomes, fitnesses in migrants:
+                self.__write_migrants(chromosomes, fitnesses)
+
+    def __write_migrants(self, chromosomes, fitnesses):
+        if self.__backend == "opencl":
+            self.__launcher.record_transfer("read_fitnesses",
+                                            cl.enqueue_copy(self.__queue, self.__fitnesses,
+                                                            self.__dev_fitnesses,
+                                                            wait_for=self.__last_events))
+        order = numpy.argsort(self.__fitnesses)
+        if self.__opt_for_max == "min":
+            order = order[::-1]
+        order = order[:len(fitnesses)]
+        self.__np_chromosomes_2d[order] = chromosomes
+        self.__fitnesses[order] = fitnesses
+        if self.__backend == "numpy":
+            return
+        row_size = self.__np_chromosomes_2d.itemsize * self.__np_chromosomes_2d.shape[1]
+        record = self.__launcher.record_transfer
+        for idx in order:
+            record("write_migrant",
+                   cl.enqueue_copy(self.__queue, self.__dev_chromosomes,
+                                   self.__np_chromosomes_2d[idx],
+                                   device_offset=int(idx) * row_size))
+            record("write_migrant_fitness",
+                   cl.enqueue_copy(self.__queue, self.__dev_fitnesses,
+                                   self.__fitnesses[idx:idx + 1],
+                                   device_offset=int(idx) * self.__fitnesses.itemsize))
+
+    def __checkpoint(self, generation_index):
+        # The values and arrays are the same as __save_state. The checkpoint is skipped if the
+        # previous two are still being written.
+        values = {"generation_idx": generation_index,
+                  "generation_time_diff": self.__generation_time_diff + time.time() -\
+                                          self.__evolution_start_time,
+                  "population": self.__population}
+        if self.__backend == "numpy":
+            values["rng_state"] = self.__rng.bit_generator.state
+            arrays = {"fitnesses": self.__fitnesses, "chromosomes": self.__np_chromosomes,
+                      "statistics": self.__statistics.records}
+            self.__sample_chromosome.numpy_save(arrays)
+            self.__checkpointer.checkpoint_arrays(values, arrays)
+            return
+
+        values["rand_seed"] = int(self.__rand_seed)
+        buffers = {"fitnesses": (self.__dev_fitnesses, numpy.float32),
+                   "chromosomes": (self.__dev_chromosomes, self.__sample_chromosome.gene_dtype)}
+        buffers.update(self.__sample_chromosome.state_buffers())
+        # the statistics of the pending generations aren't included, as the ones of save.
+        self.__checkpointer.checkpoint_buffers(self.__queue, values, buffers,
+                                               wait_for=self.__last_events,
+                                               arrays={"statistics": self.__statistics.records})
+
+    def __execute_statistics_cl(self, index):
+        # Writes the statistics of the generation to the next slot of the ring buffer.
+        if self.__dev_statistics is None:
+            self.__dev_statistics = cl.Buffer(self.__ctx, cl.mem_flags.READ_WRITE,
+                                              self.__batch_generations * 4 *\
+                                              len(ga_statistics.DEVICE_FIELDS))
+            kernel = cl.Kernel(self.__prg, "ocl_ga_statistics")
+            max_size = kernel.get_work_group_info(cl.kernel_work_group_info.WORK_GROUP_SIZE,
+                                                  self.__queue.device)
+            # the reduction needs a power of 2.
+            self.__statistics_local_size = 1
+            while self.__statistics_local_size * 2 <= min(256, max_size):
+                self.__statistics_local_size *= 2
+        local_size = self.__statistics_local_size
+        self.__last_event = self.__launcher.launch(self.__queue,
+                                                   "ocl_ga_statistics",
+                                                   local_size,
+                                                   [self.__dev_chromosomes,
+                                                    self.__dev_fitnesses,
+                                                    self.__dev_statistics,
+                                                    numpy.int32(len(self.__pending_statistics)),
+                                                    numpy.int32(self.__statistics_diversity),
+                                                    cl.LocalMemory(4 * local_size),
+                                                    cl.LocalMemory(4 * local_size),
+                                                    cl.LocalMemory(4 * local_size),
+                                                    cl.LocalMemory(4 * local_size)],
+                                                   local_size=local_size,
+                                                   wait_for=self.__last_events)
+        self.__pending_statistics.append(index)
+
+    def __sync_statistics(self):
+        # Reads the pending records of the ring buffer back in a single copy.
+        if len(self.__pending_statistics) == 0:
+            return
+        values = numpy.empty((len(self.__pending_statistics), len(ga_statistics.DEVICE_FIELDS)),
+                             dtype=numpy.float32)
+        self.__launcher.record_transfer("read_statistics",
+                                        cl.enqueue_copy(self.__queue, values,
+                                                        self.__dev_statistics,
+                                                        wait_for=self.__last_events))
+        indices = self.__pending_statistics
+        self.__pending_statistics = []
+        if self.__profiler is not None:
+            # the device is synchronized, the events of the batch are completed.
+            self.__profiler.resolve()
+        self.__append_statistics(indices, values)
+
+    def __append_statistics(self, indices, values):
+        elapsed = time.time() - self.__evolution_start_time + self.__generation_time_diff
+        records = self.__statistics.append(indices, values, elapsed)
+        self.__early_terminated = ga_statistics.converged(records[-1])
+        if self.__generation_callback is None:
+            return
+        for record in records:
+            if self.__callback_dispatcher is not None:
+                self.__callback_dispatcher.dispatch(int(record["generation"]),
+                                                    ga_statistics.record_to_dict(record))
+            else:
+                self.__generation_callback(int(record["generation"]),
+                                           ga_statistics.record_to_dict(record))
+
+    def __execute_single_generation_cl(self, index, prob_mutate, prob_crossover):
+        evt = self.__sample_chromosome.execute_crossover(self.__launcher,
+                                                         self.__queue,
+                                                         self.__population,
+                                                         index,
+                                                         prob_crossover,
+                                                         self.__dev_chromosomes,
+                                                         self.__dev_fitnesses,
+                                                         self.__dev_next_chromosomes,
+                                                         self.__rand_seed,
+                                                         wait_for=self.__last_events)
+        self.__swap_populations()
+        evt = self.__sample_chromosome.execute_mutation(self.__launcher,
+                                                        self.__queue,
+                                                        self.__population,
+                                                        index,
+                                                        prob_mutate,
+                                                        self.__dev_chromosomes,
+                                                        self.__dev_fitnesses,
+                                                        self.__rand_seed,
+                                                        self.__fitness_args_list[2:],
+                                                        wait_for=[evt])
+
+        self.__last_event = self.__launcher.launch(self.__queue,
+                                                   "ocl_ga_calculate_fitness",
                                                    self.__population,
-                                                   index,
-                                                   prob_crossover,
-                                                   self.__dev_chromosomes,
-                                                   self.__dev_fitnesses,
-                                                   self.__dev_rnum)
-        self.__sample_chromosome.execute_mutation(self.__prg,
-                                                  self.__queue,
-                                                  self.__population,
-                                                  index,
-                                                  prob_mutate,
-                                                  self.__dev_chromosomes,
-                                                  self.__dev_fitnesses,
-                                                  self.__dev_rnum)
-
-        self.__prg.ocl_ga_calculate_fitness(self.__queue,
-                                            (self.__population,),
-                                            (1,),
-                                            *self.__fitness_args_list).wait()
-        self.__dictStatistics[index] = {}
-        self.__dictStatistics[index]["best"] = self.__sample_chromosome.get_current_best()
-        self.__dictStatistics[index]["worst"] = self.__sample_chromosome.get_current_worst()
-        self.__dictStatistics[index]["avg"] = self.__sample_chromosome.get_current_avg()
-        if self.__generation_callback is not None:
-            self.__generation_callback(index, self.__dictStatistics[index])
+                                                   self.__fitness_args_list,
+                                                   outputs=[self.__dev_fitnesses],
+                                                   wait_for=[evt])
+
+    def __execute_fused_generation_cl(self, index, prob_mutate, prob_crossover):
+        evt = self.__sample_chromosome.execute_fused_generation(self.__launcher,
+                                                                self.__queue,
+                                                                self.__population,
+                                                                index,
+                                                                prob_mutate,
+                                                                prob_crossover,
+                                                                self.__dev_chromosomes,
+                                                                self.__dev_fitnesses,
+                                                                self.__dev_next_chromosomes,
+                                                                self.__dev_next_fitnesses,
+                                                                self.__rand_seed,
+                                                                self.__fitness_args_list[2:],
+                                                                wait_for=self.__last_events)
+        self.__swap_populations()
+        self.__last_event = evt
+
+    def __execute_island_generations_cl(self, index, generations, prob_mutate, prob_crossover):
+        evt = self.__sample_chromosome.execute_island_generations(self.__launcher,
+                                                                  self.__queue,
+                                                                  self.__population,
+                                                                  index,
+                                                                  generations,
+                                                                  prob_mutate,
+                                                                  prob_crossover,
+                                                                  self.__dev_chromosomes,
+                                                                  self.__dev_fitnesses,
+                                                                  self.__rand_seed,
+                                                                  self.__fitness_args_list[2:],
+                                                                  wait_for=self.__last_events)
+        self.__last_event = evt
+
+    def __execute_local_search_cl(self, index, generations):
+        evt = self.__sample_chromosome.execute_local_search(self.__launcher,
+                                                            self.__queue,
+                                                            self.__population,
+                                                            index,
+                                                            generations,
+                                                            self.__dev_chromosomes,
+                                                            self.__dev_fitnesses,
+                                                            self.__rand_seed,
+                                                            self.__fitness_args_list[2:],
+                                                            wait_for=self.__last_events)
+        if evt is not None:
+            self.__last_event = evt
 
     def __evolve_by_count(self, count, prob_mutate, prob_crossover):
         start_time = time.time()
-        for i in range(self.__generation_index, count):
-            self.__execute_single_generation(i, prob_mutate, prob_crossover)
-            if self.__sample_chromosome.early_terminated:
+        self.__evolution_start_time = start_time
+        while self.__generation_index < count:
+            generations = min(self.__generations_per_execution, count - self.__generation_index)
+            self.__execute_generations(self.__generation_index, generations,
+                                       prob_mutate, prob_crossover)
+            self.__generation_index += generations
+            if self.__early_terminated:
                 break
 
             if self.__paused:
-                self.__generation_index = i + 1
+                # flush the statistics of the generations which are not at the end of a batch.
+                self.__sync_statistics()
                 self.__generation_time_diff = time.time() - start_time
-                cl.enqueue_read_buffer(self.__queue, self.__dev_fitnesses, self.__fitnesses)
-                cl.enqueue_read_buffer(self.__queue, self.__dev_chromosomes, self.__np_chromosomes).wait()
                 break
             if self.__forceStop:
                 break
 
     def __evolve_by_time(self, max_time, prob_mutate, prob_crossover):
         start_time = time.time()
+        self.__evolution_start_time = start_time
         while True:
-            self.__execute_single_generation(self.__generation_index, prob_mutate, prob_crossover)
+            generations = self.__generations_per_execution
+            self.__execute_generations(self.__generation_index, generations,
+                                       prob_mutate, prob_crossover)
             # calculate elapsed time
             elapsed_time = time.time() - start_time + self.__generation_time_diff
-            self.__generation_index = self.__generation_index + 1
-            if self.__sample_chromosome.early_terminated or elapsed_time > max_time:
+            self.__generation_index = self.__generation_index + generations
+            if self.__early_terminated or elapsed_time > max_time:
                 break
 
             if self.__paused:
+                # flush the statistics of the generations which are not at the end of a batch.
+                self.__sync_statistics()
                 self.__generation_time_diff = time.time() - start_time
-                cl.enqueue_read_buffer(self.__queue, self.__dev_fitnesses, self.__fitnesses)
-                cl.enqueue_read_buffer(self.__queue, self.__dev_chromosomes, self.__np_chromosomes).wait()
                 break
             if self.__forceStop:
                 break
 
     def __start_evolution(self, prob_mutate, prob_crossover):
-        generation_start = time.time()
         ## start the evolution
         if self.__termination["type"] == "time":
             self.__evolve_by_time(self.__termination["time"], prob_mutate, prob_crossover)
@@ -272,66 +856,88 @@ class OpenCLGA():
         if self.__paused:
             return;
 
-        cl.enqueue_read_buffer(self.__queue, self.__dev_fitnesses, self.__fitnesses)
-        cl.enqueue_read_buffer(self.__queue, self.__dev_chromosomes, self.__np_chromosomes).wait()
-
-        total_time_consumption = time.time() - generation_start + self.__generation_time_diff
-        avg_time_per_gen = total_time_consumption / float(len(self.__dictStatistics))
-        self.__dictStatistics["avg_time_per_gen"] = avg_time_per_gen
+        # the population stays at device, get_top_k reads the best ones back.
+        self.__sync_statistics()
 
     def __save_state(self, data):
         # save data from intenal struct
         data["generation_idx"] = self.__generation_index
-        data["statistics"] = self.__dictStatistics
+        data["statistics"] = self.__statistics.records
         data["generation_time_diff"] = self.__generation_time_diff
         data["population"] = self.__population
 
+        if self.__backend == "numpy":
+            data["rng_state"] = self.__rng.bit_generator.state
+            data["fitnesses"] = self.__fitnesses
+            data["chromosomes"] = self.__np_chromosomes
+            self.__sample_chromosome.numpy_save(data)
+            return
+
         # read data from kernel
-        rnum = numpy.zeros(self.__population, dtype=numpy.float32)
-        cl.enqueue_read_buffer(self.__queue, self.__dev_rnum, rnum)
-        cl.enqueue_read_buffer(self.__queue, self.__dev_fitnesses, self.__fitnesses)
-        cl.enqueue_read_buffer(self.__queue, self.__dev_chromosomes, self.__np_chromosomes).wait()
+        self.__read_buffers()
         # save kernel memory to data
-        data["rnum"] = rnum
+        data["rand_seed"] = int(self.__rand_seed)
         data["fitnesses"] = self.__fitnesses
         data["chromosomes"] = self.__np_chromosomes
 
         self.__sample_chromosome.save(data, self.__ctx, self.__queue, self.__population)
 
     def __restore_state(self, data):
+        # The arrays of data may be read-only memory maps of a snapshot.
         self.__generation_index = data["generation_idx"]
-        self.__dictStatistics = data["statistics"]
+        statistics = data["statistics"]
+        if isinstance(statistics, dict):
+            # the statistics of legacy snapshots are dicts.
+            statistics = ga_statistics.from_dict(statistics)
+        self.__statistics.reset(statistics)
+        self.__pending_statistics = []
+        self.__dev_statistics = None
         self.__generation_time_diff = data["generation_time_diff"]
         self.__population = data["population"]
+        # a restored GA continues from the saved generation instead of populating a new one.
+        self.__paused = True
+        # the chromosomes of legacy checkpoints are int32, they're narrowed to the gene type.
+        gene_dtype = self.__sample_chromosome.gene_dtype
 
-        rnum = data["rnum"]
-        self.__fitnesses = data["fitnesses"]
-        self.__np_chromosomes = data["chromosomes"]
-        # restore CL variables
+        if self.__backend == "numpy":
+            self.__preexecute_numpy()
+            self.__rng.bit_generator.state = data["rng_state"]
+            self.__fitnesses = numpy.array(data["fitnesses"], dtype=numpy.float32)
+            self.__np_chromosomes = numpy.array(data["chromosomes"], dtype=gene_dtype)
+            self.__sample_chromosome.numpy_restore(data)
+            return
+
+        # legacy snapshots keep the states of random numbers as rnum instead of the seed, they
+        # continue with the seed of this GA.
+        if "rand_seed" in data:
+            self.__rand_seed = numpy.uint64(data["rand_seed"])
+        fitnesses = numpy.ascontiguousarray(data["fitnesses"], dtype=numpy.float32)
+        chromosomes = numpy.ascontiguousarray(data["chromosomes"], dtype=gene_dtype)
+        # restore CL variables, they are uploaded from the arrays of data without copying at host.
         mf = cl.mem_flags
-        self.__dev_rnum = cl.Buffer(self.__ctx, mf.READ_WRITE | mf.COPY_HOST_PTR,
-                             hostbuf=numpy.array(rnum, dtype=numpy.uint32))
         self.__dev_chromosomes = cl.Buffer(self.__ctx, mf.READ_WRITE | mf.COPY_HOST_PTR,
-                                    hostbuf=self.__np_chromosomes)
-        self.__dev_fitnesses = cl.Buffer(self.__ctx, mf.WRITE_ONLY, self.__fitnesses.nbytes)
-        self.__fitness_args_list = [self.__dev_chromosomes, self.__dev_fitnesses]
-        if self.__fitness_args is not None:
-            ## create buffers for fitness arguments
-            for arg in self.__fitness_args:
-                self.__fitness_args_list.append(cl.Buffer(self.__ctx,
-                                                     mf.READ_ONLY | mf.COPY_HOST_PTR,
-                                                     hostbuf=numpy.array(arg["v"],
-                                                     dtype=self.__type_to_numpy_type(arg["t"]))))
-        # Copy data from main memory to GPU memory
-        cl.enqueue_copy(self.__queue, self.__dev_fitnesses, self.__fitnesses)
-        cl.enqueue_copy(self.__queue, self.__dev_chromosomes, self.__np_chromosomes)
-        cl.enqueue_copy(self.__queue, self.__dev_rnum, rnum).wait()
+                                           hostbuf=chromosomes)
+        self.__dev_fitnesses = cl.Buffer(self.__ctx, mf.WRITE_ONLY | mf.COPY_HOST_PTR,
+                                         hostbuf=fitnesses)
+        self.__create_next_population()
+        ## create buffers for fitness arguments
+        self.__create_fitness_args_list()
+        # the host copies are only read back from device when they are needed, e.g. get_migrants.
+        self.__fitnesses = numpy.empty(fitnesses.shape, dtype=numpy.float32)
+        self.__np_chromosomes = numpy.empty(chromosomes.shape, dtype=gene_dtype)
+        self.__dev_top_fitnesses = None
 
         self.__sample_chromosome.restore(data, self.__ctx, self.__queue, self.__population)
+        if self.__local_island_size is not None:
+            self.__sample_chromosome.init_island_kernel(self.__ctx, self.__queue, self.__population,
+                                                        self.__local_island_size)
 
     # public methods
     def prepare(self):
-        self.__preexecute_kernels()
+        if self.__backend == "numpy":
+            self.__preexecute_numpy()
+        else:
+            self.__preexecute_kernels()
 
     def run(self, prob_mutate, prob_crossover):
         # This function is not supposed to be overriden
@@ -343,6 +949,13 @@ class OpenCLGA():
 
         self.__paused = False
         self.__start_evolution(prob_mutate, prob_crossover)
+        if self.__callback_dispatcher is not None:
+            # all callbacks of the run are delivered before returning.
+            self.__callback_dispatcher.flush()
+        self.__apply_migrants()
+        if self.__checkpointer is not None:
+            # the last checkpoint is completed before returning.
+            self.__checkpointer.flush()
         self.__elapsed_time += time.time() - start_time
 
     def stop(self):
@@ -351,32 +964,84 @@ class OpenCLGA():
     def pause(self):
         self.__paused = True
 
-    def save(self, filename):
+    def save(self, filename, compress=False):
+        # Writes a snapshot file, see ga_snapshot.py. compress stores arrays by zlib.
         assert self.__paused, "save is only availabled while paused"
         data = dict()
         self.__save_state(data)
-        f = open(filename, "wb")
-        pickle.dump(data, f)
-        f.close()
+        arrays = {k: v for k, v in data.items() if isinstance(v, numpy.ndarray)}
+        values = {k: v for k, v in data.items() if not isinstance(v, numpy.ndarray)}
+        ga_snapshot.write_snapshot(filename, values, arrays, compress)
 
     def restore(self, filename):
-        f = open(filename, "rb")
-        data = pickle.load(f)
-        f.close()
+        if ga_snapshot.is_snapshot(filename):
+            values, arrays = ga_snapshot.read_snapshot(filename)
+            data = dict(values)
+            data.update(arrays)
+        else:
+            # legacy pickle checkpoints
+            f = open(filename, "rb")
+            data = pickle.load(f)
+            f.close()
         self.__restore_state(data)
 
+    def get_profile(self):
+        # Returns None if the profile option isn't enabled. Otherwise, the times in milliseconds
+        # of kernel launches and transfers are aggregated per name at "kernels" and per generation
+        # at "generations", and "records" keeps the device times in nanoseconds of each event, see
+        # kernel_profiler.py.
+        if self.__profiler is None:
+            return None
+        self.__profiler.resolve(wait=True)
+        profile = self.__profiler.summary()
+        profile["records"] = list(self.__profiler.records)
+        return profile
+
+    def export_profile_trace(self, path):
+        # Writes the profile as a Chrome trace JSON file, it can be loaded by chrome://tracing.
+        assert self.__profiler is not None, "profile isn't enabled"
+        self.__profiler.resolve(wait=True)
+        self.__profiler.export_chrome_trace(path)
+
     def get_statistics(self):
-        return self.__dictStatistics
+        # Returns the records of ga_statistics.DTYPE, a view which is valid until the next run.
+        return self.__statistics.records
 
-    def get_the_best(self):
-        assert self.__opt_for_max in ["max", "min"]
+    def get_migrants(self, count):
+        # Returns the best count chromosomes (a 2D array) and their fitnesses for migrating to other
+        # islands. It is safe to be called from generation_callback, even an asynchronous one.
+        with self.__population_lock:
+            if self.__backend == "opencl":
+                self.__read_buffers()
+            order = numpy.argsort(self.__fitnesses)
+            if self.__opt_for_max == "max":
+                order = order[::-1]
+            order = order[:count]
+            return self.__np_chromosomes_2d[order].copy(), self.__fitnesses[order].copy()
+
+    def put_migrants(self, chromosomes, fitnesses):
+        # Queues the migrants from other islands. They replace the worst chromosomes at the end of
+        # the current batch, or of the run, at the GA thread.
+        with self.__migrants_lock:
+            self.__migrants.append((chromosomes, fitnesses))
 
-        best_fitness = eval(self.__opt_for_max)(value for value in self.__fitnesses)
-        best_index = list(self.__fitnesses).index(best_fitness)
+    def get_top_k(self, k):
+        # Returns the best k chromosomes (a 2D array of kernel values) from the best one, their
+        # fitnesses and the decoded gene elements (a 2D array). The opencl backend selects them at
+        # device and reads back only k chromosomes if k <= TOP_K_MAX, so the current best can be
+        # polled while running, e.g. from generation_callback.
+        assert 1 <= k <= self.__population
+        if self.__backend == "opencl" and k <= OpenCLGA.TOP_K_MAX:
+            chromosomes, fitnesses = self.__top_k_cl(k)
+        else:
+            self.__read_population()
+            order = numpy_ga_utils.top_k(self.__fitnesses, k, self.__opt_for_max == "max")
+            chromosomes = self.__np_chromosomes_2d[order]
+            fitnesses = self.__fitnesses[order]
+        return chromosomes, fitnesses, self.__sample_chromosome.decode_kernel_values(chromosomes)
 
-        # We had convert chromosome to a cyclic gene. So, the num_of_genes in CL is more than python
-        # by one.
-        startGeneId = best_index * (self.__sample_chromosome.num_of_genes)
-        endGeneId = (best_index + 1) * (self.__sample_chromosome.num_of_genes)
-        best = [v for v in self.__np_chromosomes[startGeneId:endGeneId]]
-        return best, best_fitness, self.__sample_chromosome.from_kernel_value(best)
+    def get_the_best(self):
+        assert self.__opt_for_max in ["max", "min"]
+        chromosomes, fitnesses, elements = self.get_top_k(1)
+        best = [int(v) for v in chromosomes[0]]
+        return best, fitnesses[0], self.__sample_chromosome.from_kernel_value(best)
@@ -1,43 +1,113 @@
 #!/usr/bin/python3
-
+import sys
+import queue
+import socket
+import threading
+import traceback
+import numpy
 from ocl_ga import OpenCLGA
+from ocl_ga_protocol import send_frame, recv_frame
 
-class OpenCLGAClient(OpenCLGA):
-
+class OpenCLGAClient():
+    # OpenCLGAClient connects to an OpenCLGAServer and runs the OpenCLGA it receives as an island.
+    # The statistics of every generation are streamed to the server. Every migration_interval
+    # generations, the best chromosomes are sent to the server and the migrants from other clients
+    # replace the worst ones.
     def __init__(self, ip, port=12345):
         self.__server_ip = ip
         self.__server_port = port
+        self.__ga = None
+        self.__ga_thread = None
+        self.__migrants = queue.Queue()
+        self.__migration_interval = 10
+        self.__migration_size = 5
+        self.__last_migration = 0
+        self.__send_lock = threading.Lock()
+        self.__connect()
 
-    def __connect():
-        pass
+    def __connect(self):
+        self.__socket = socket.create_connection((self.__server_ip, self.__server_port))
+        self.__socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
 
     def __send(self, command, data):
-        pass
+        with self.__send_lock:
+            send_frame(self.__socket, command, data)
 
     def __process_data(self, data):
-        pass
-
-    # public APIs
-    def prepare(self):
-        raise RuntimeError("OpenCL Client doesn't support this one")
+        # Returns False if the client should exit.
+        command = data["command"]
+        if command == "prepare":
+            self.__prepare(data["data"])
+        elif command == "run":
+            self.__ga_thread = threading.Thread(target=self.__run,
+                                                args=(data["data"]["prob_mutate"],
+                                                      data["data"]["prob_crossover"]))
+            self.__ga_thread.start()
+        elif command == "pause":
+            self.__ga.pause()
+        elif command == "stop":
+            self.__ga.stop()
+        elif command == "migrants":
+            self.__migrants.put(data["data"])
+        elif command == "exit":
+            return False
+        return True
 
-    def run(self, prob_mutate, prob_crossover):
-        raise RuntimeError("OpenCL Client doesn't support this one")
+    def __prepare(self, data):
+        options = dict(data["options"])
+        options["generation_callback"] = self.__on_generation
+        self.__migration_interval = data["migration_interval"]
+        self.__migration_size = data["migration_size"]
+        self.__last_migration = 0
+        self.__ga = OpenCLGA(options)
+        self.__ga.prepare()
 
-    def stop(self):
-        raise RuntimeError("OpenCL Client doesn't support this one")
+    def __run(self, prob_mutate, prob_crossover):
+        try:
+            self.__ga.run(prob_mutate, prob_crossover)
+            # the best is reported on pause too, the server may be asked for it at any time.
+            self.__send("result", {"paused": self.__ga.paused,
+                                   "statistics": numpy.array(self.__ga.get_statistics()),
+                                   "best": self.__ga.get_the_best(),
+                                   "elapsed_time": self.__ga.elapsed_time})
+        except OSError:
+            # the server is gone.
+            pass
+        except Exception as e:
+            traceback.print_exc()
+            self.__socket.close()
 
-    def pause(self):
-        raise RuntimeError("OpenCL Client doesn't support this one")
+    def __on_generation(self, index, statistics):
+        # It is called at the thread of OpenCLGA.run.
+        self.__send("generation", {"index": index, "statistics": statistics})
+        if index + 1 - self.__last_migration < self.__migration_interval:
+            return
+        self.__last_migration = index + 1
+        self.__send("migrants", self.__ga.get_migrants(self.__migration_size))
+        while True:
+            try:
+                chromosomes, fitnesses = self.__migrants.get_nowait()
+            except queue.Empty:
+                break
+            self.__ga.put_migrants(chromosomes, fitnesses)
 
-    def save(self, filename):
-        raise RuntimeError("OpenCL Client doesn't support this one")
-
-    def restore(self, filename):
-        raise RuntimeError("OpenCL Client doesn't support this one")
-
-    def get_statistics(self):
-        raise RuntimeError("OpenCL Client doesn't support this one")
+    # public APIs
+    def run_forever(self):
+        # processes the commands of server until it sends exit or the connection is closed.
+        try:
+            while True:
+                data = recv_frame(self.__socket)
+                if data is None or not self.__process_data(data):
+                    break
+        finally:
+            if self.__ga is not None:
+                self.__ga.stop()
+            if self.__ga_thread is not None:
+                self.__ga_thread.join()
+            self.__socket.close()
 
-    def get_the_best(self):
-        raise RuntimeError("OpenCL Client doesn't support this one")
+if __name__ == "__main__":
+    # python3 ocl_ga_client.py <server ip> [port]
+    assert len(sys.argv) > 1, "usage: ocl_ga_client.py <server ip> [port]"
+    client = OpenCLGAClient(sys.argv[1], int(sys.argv[2]) if len(sys.argv) > 2 else 12345)
+    client.run_forever()
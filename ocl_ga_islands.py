@@ -0,0 +1,158 @@
+#!/usr/bin/python3
+
+import copy
+import time
+import queue
+import threading
+import traceback
+import pyopencl as cl
+import utils
+from ocl_ga import OpenCLGA
+
+class OpenCLGAIslands():
+    # OpenCLGAIslands runs an OpenCLGA on each OpenCL device (an island) with its own context, queue
+    # and subpopulation of options["population"] chromosomes. Every migration_interval generations,
+    # an island sends its best migration_size chromosomes to the islands it connects to and replaces
+    # its worst chromosomes with the migrants it received. The migration is asynchronous, an island
+    # never waits for the others. With options["seed"], island i is seeded by seed + i.
+    #
+    # Additional options:
+    #   devices - a list of pyopencl devices or "all" for all devices of all platforms.
+    #   migration_interval - the number of generations between two migrations.
+    #   migration_size - the number of chromosomes sent by a migration.
+    #   migration_topology - "ring" sends to the next island, "all" sends to all other islands. It
+    #                        could be a dict maps an island index to a list of target indices.
+    def __init__(self, options):
+        self.__opt_for_max = options["opt_for_max"] if "opt_for_max" in options else "max"
+        self.__migration_interval = options["migration_interval"]\
+                                        if "migration_interval" in options else 10
+        self.__migration_size = options["migration_size"] if "migration_size" in options else 5
+        self.__generation_callback = options["generation_callback"]\
+                                        if "generation_callback" in options else None
+        self.__elapsed_time = 0
+        self.__paused = False
+        self.__lock = threading.Lock()
+
+        devices = options["devices"] if "devices" in options else "all"
+        if devices == "all":
+            devices = [device for platform in cl.get_platforms()
+                              for device in platform.get_devices()]
+        assert len(devices) > 0, "no OpenCL device is found"
+        self.__devices = devices
+        self.__topology = self.__build_topology(options["migration_topology"]\
+                                                    if "migration_topology" in options else "ring")
+        self.__inboxes = [queue.Queue() for device in devices]
+        self.__last_migrations = [0 for device in devices]
+        self.__islands = [self.__create_island(options, idx) for idx in range(len(devices))]
+
+    # public properties
+    @property
+    def paused(self):
+        return self.__paused
+
+    @property
+    def elapsed_time(self):
+        return self.__elapsed_time
+
+    @property
+    def islands(self):
+        return self.__islands
+
+    # private methods
+    def __build_topology(self, topology):
+        num_of_islands = len(self.__devices)
+        if topology == "ring":
+            return {i: [(i + 1) % num_of_islands] for i in range(num_of_islands)
+                                                  if num_of_islands > 1}
+        elif topology == "all":
+            return {i: [j for j in range(num_of_islands) if j != i] for i in range(num_of_islands)}
+        assert isinstance(topology, dict), "unsupported migration topology"
+        return topology
+
+    def __create_island(self, options, idx):
+        island_options = dict(options)
+        for key in ["devices", "migration_interval", "migration_size", "migration_topology"]:
+            island_options.pop(key, None)
+        # each island owns the device buffers of its chromosome.
+        island_options["sample_chromosome"] = copy.deepcopy(options["sample_chromosome"])
+        island_options["device"] = self.__devices[idx]
+        if "seed" in options:
+            # the islands evolve different populations, even at identical devices.
+            island_options["seed"] = (options["seed"] + idx) % 2**64
+        island_options["generation_callback"] = lambda index, statistics:\
+                                                    self.__on_generation(idx, index, statistics)
+        return OpenCLGA(island_options)
+
+    def __on_generation(self, idx, index, statistics):
+        # It is called at the thread of island idx.
+        if self.__generation_callback is not None:
+            with self.__lock:
+                data = dict(statistics)
+                data["island"] = idx
+                self.__generation_callback(index, data)
+        if index + 1 - self.__last_migrations[idx] >= self.__migration_interval:
+            self.__last_migrations[idx] = index + 1
+            self.__migrate(idx)
+
+    def __migrate(self, idx):
+        island = self.__islands[idx]
+        targets = self.__topology[idx] if idx in self.__topology else []
+        if len(targets) > 0:
+            migrants = island.get_migrants(self.__migration_size)
+            for target in targets:
+                self.__inboxes[target].put(migrants)
+        while True:
+            try:
+                chromosomes, fitnesses = self.__inboxes[idx].get_nowait()
+            except queue.Empty:
+                break
+            island.put_migrants(chromosomes, fitnesses)
+
+    def __run_island(self, island, prob_mutate, prob_crossover, errors):
+        try:
+            island.run(prob_mutate, prob_crossover)
+        except Exception as e:
+            traceback.print_exc()
+            errors.append(e)
+
+    # public methods
+    def prepare(self):
+        for island in self.__islands:
+            island.prepare()
+
+    def run(self, prob_mutate, prob_crossover):
+        start_time = time.time()
+        errors = []
+        threads = [threading.Thread(target=self.__run_island,
+                                    args=(island, prob_mutate, prob_crossover, errors))
+                   for island in self.__islands]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.__paused = all([island.paused for island in self.__islands])
+        self.__elapsed_time += time.time() - start_time
+        if len(errors) > 0:
+            raise errors[0]
+
+    def stop(self):
+        for island in self.__islands:
+            island.stop()
+
+    def pause(self):
+        for island in self.__islands:
+            island.pause()
+
+    def save(self, filename):
+        raise RuntimeError("OpenCLGAIslands doesn't support save or restore")
+
+    def restore(self, filename):
+        raise RuntimeError("OpenCLGAIslands doesn't support save or restore")
+
+    def get_statistics(self):
+        return utils.merge_statistics([island.get_statistics() for island in self.__islands],
+                                      self.__opt_for_max)
+
+    def get_the_best(self):
+        compare = max if self.__opt_for_max == "max" else min
+        return compare([island.get_the_best() for island in self.__islands], key=lambda v: v[1])
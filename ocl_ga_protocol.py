@@ -0,0 +1,135 @@
+import json
+import struct
+import numpy
+from shuffler_chromosome import ShufflerChromosome
+from simple_chromosome import SimpleChromosome
+
+# The frames between OpenCLGAServer and OpenCLGAClient. A frame is the sizes of its parts (3
+# big-endian uint32), a JSON header {"command": command, "arrays": layouts of arrays}, the JSON of
+# data and the payload, the raw bytes of the numpy arrays at data. Nothing is executed while
+# decoding a frame: the arrays are rebuilt by numpy.frombuffer from their dtype and shape, and the
+# other values are JSON values. At data,
+#   a numpy array is kept as {"__array__": index of arrays},
+#   a tuple is kept as {"__tuple__": items},
+#   a dict with non-str keys is kept as {"__items__": [[key, value], ...]},
+#   a chromosome is kept as {"__chromosome__": class name, "data": chromosome.to_dict()}.
+# So the options sent to clients, e.g. the gene elements, must be built from these values. The
+# python fitness function of the numpy backend can't be sent.
+#
+# server -> client commands:
+#   prepare - data: {"options": options of OpenCLGA,
+#                    "migration_interval": number of generations between migrations,
+#                    "migration_size": number of chromosomes sent by a migration}
+#   run - data: {"prob_mutate": prob_mutate, "prob_crossover": prob_crossover}
+#   pause, stop - data: None
+#   migrants - data: (chromosomes, fitnesses) from other clients
+#   exit - data: None, the client closes the connection.
+# client -> server commands:
+#   generation - data: {"index": generation index, "statistics": statistics of the generation}
+#   migrants - data: (chromosomes, fitnesses) of the best chromosomes
+#   result - data: {"paused": paused, "statistics": all statistics, "best": get_the_best(),
+#                   "elapsed_time": elapsed_time}
+
+HEADER = struct.Struct(">III")
+CHROMOSOMES = {"ShufflerChromosome": ShufflerChromosome,
+               "SimpleChromosome": SimpleChromosome}
+
+def _encode(value, arrays):
+    if value is None or isinstance(value, (bool, int, float, str)):
+        return value
+    if isinstance(value, numpy.generic):
+        return value.item()
+    if isinstance(value, numpy.ndarray):
+        assert not value.dtype.hasobject, "arrays of objects can't be sent"
+        arrays.append(numpy.ascontiguousarray(value))
+        return {"__array__": len(arrays) - 1}
+    if isinstance(value, list):
+        return [_encode(v, arrays) for v in value]
+    if isinstance(value, tuple):
+        return {"__tuple__": [_encode(v, arrays) for v in value]}
+    if isinstance(value, dict):
+        if all(isinstance(k, str) for k in value.keys()):
+            return {k: _encode(v, arrays) for k, v in value.items()}
+        return {"__items__": [[_encode(k, arrays), _encode(v, arrays)]
+                              for k, v in value.items()]}
+    if isinstance(value, (ShufflerChromosome, SimpleChromosome)):
+        return {"__chromosome__": type(value).__name__, "data": _encode(value.to_dict(), arrays)}
+    raise TypeError("%s can't be sent"%(type(value)))
+
+def _layout(array):
+    layout = {"dtype": array.dtype.str, "shape": list(array.shape)}
+    if array.dtype.names is not None:
+        # the fields of structured arrays, e.g. the statistics, aren't kept by dtype.str.
+        layout["descr"] = array.dtype.descr
+    return layout
+
+def _decode_arrays(layouts, payload):
+    arrays = []
+    offset = 0
+    for layout in layouts:
+        dtype = numpy.dtype([tuple(field) for field in layout["descr"]])\
+                    if "descr" in layout else numpy.dtype(layout["dtype"])
+        if dtype.hasobject:
+            raise ValueError("arrays of objects can't be received")
+        shape = tuple(int(v) for v in layout["shape"])
+        count = int(numpy.prod(shape))
+        array = numpy.frombuffer(payload, dtype=dtype, count=count, offset=offset)
+        arrays.append(array.reshape(shape).copy())
+        offset += array.nbytes
+    if offset != len(payload):
+        raise ValueError("the arrays don't match the payload")
+    return arrays
+
+def _decode_hook(arrays):
+    def hook(obj):
+        if "__array__" in obj:
+            return arrays[obj["__array__"]]
+        if "__tuple__" in obj:
+            return tuple(obj["__tuple__"])
+        if "__items__" in obj:
+            return {k: v for k, v in obj["__items__"]}
+        if "__chromosome__" in obj:
+            if obj["__chromosome__"] not in CHROMOSOMES:
+                raise ValueError("unknown chromosome %s"%(obj["__chromosome__"]))
+            return CHROMOSOMES[obj["__chromosome__"]].from_dict(obj["data"])
+        return obj
+    return hook
+
+def send_frame(sock, command, data):
+    arrays = []
+    encoded = _encode(data, arrays)
+    header = json.dumps({"command": command,
+                         "arrays": [_layout(array) for array in arrays]}).encode("utf-8")
+    body = json.dumps(encoded).encode("utf-8")
+    payload_size = sum(array.nbytes for array in arrays)
+    sock.sendall(HEADER.pack(len(header), len(body), payload_size) + header + body)
+    for array in arrays:
+        sock.sendall(memoryview(array).cast("B"))
+
+def _recv_exactly(sock, size):
+    chunks = []
+    while size > 0:
+        chunk = sock.recv(min(size, 1 << 20))
+        if not chunk:
+            return None
+        chunks.append(chunk)
+        size -= len(chunk)
+    return b"".join(chunks)
+
+def recv_frame(sock):
+    # Returns the dict of a frame, or None if the connection is closed. It raises if the frame is
+    # malformed, e.g. ValueError.
+    sizes = _recv_exactly(sock, HEADER.size)
+    if sizes is None:
+        return None
+    header_size, body_size, payload_size = HEADER.unpack(sizes)
+    header = _recv_exactly(sock, header_size)
+    body = _recv_exactly(sock, body_size)
+    payload = _recv_exactly(sock, payload_size)
+    if header is None or body is None or payload is None:
+        return None
+    header = json.loads(header.decode("utf-8"))
+    arrays = _decode_arrays(header["arrays"], payload)
+    # the hook converts the markers from the inner values out, e.g. the arrays of a chromosome.
+    data = json.loads(body.decode("utf-8"), object_hook=_decode_hook(arrays))
+    return {"command": header["command"], "data": data}
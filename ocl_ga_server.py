@@ -1,30 +1,170 @@
 #!/usr/bin/python3
+import time
+import socket
+import threading
 import traceback
+import numpy
+import utils
+import ga_statistics
+from ocl_ga_protocol import send_frame, recv_frame
 
 class OpenCLGAServer():
-    def __init__(self, options, port=12345):
+    # OpenCLGAServer distributes the options of OpenCLGA to all connected OpenCLGAClient. Each
+    # client runs an OpenCLGA as an island and streams the statistics of generations, migrants and
+    # its result back. The migrants are forwarded to other clients by migration_topology, "ring"
+    # (default) sends to the next connected client and "all" sends to all other clients. It listens
+    # at host, 127.0.0.1 by default, pass "" or "0.0.0.0" to accept clients of other machines. With
+    # options["seed"], the client of id i is seeded by seed + i.
+    def __init__(self, options, port=12345, host="127.0.0.1"):
         self.__paused = False
         self.__forceStop = False
+        self.__elapsed_time = 0
         self.__options = options
+        self.__opt_for_max = options["opt_for_max"] if "opt_for_max" in options else "max"
+        self.__topology = options["migration_topology"]\
+                            if "migration_topology" in options else "ring"
+        assert self.__topology in ["ring", "all"]
+        # it's called at the receiving thread of a client with the client id in statistics.
+        self.__generation_callback = options["generation_callback"]\
+                                        if "generation_callback" in options else None
         self.__callbacks = {
             "connected": [],
             "disconnected": [],
             "result": []
         }
-        self.__listen_at(port)
+        # client id : {"socket", "address", "connected", "send_lock", "statistics", "streamed",
+        #              "result"}
+        # statistics - the records of the last result.
+        # streamed - the statistics of generations streamed since the last result.
+        # The results of disconnected clients are kept for merging.
+        self.__clients = {}
+        self.__next_client_id = 0
+        self.__prepared = False
+        self.__running = set()
+        self.__run_args = None
+        self.__condition = threading.Condition()
+        self.__closed = False
+        self.__listen_at(host, port)
 
-    def __listen_at(self, port):
+    def __listen_at(self, host, port):
         '''
-        we should create a server socket and bind at all IP address with specified port.
+        we should create a server socket and bind at host with specified port.
         all commands are passed to client and wait for client's feedback.
         '''
-        pass
+        self.__socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.__socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.__socket.bind((host, port))
+        self.__socket.listen()
+        self.__port = self.__socket.getsockname()[1]
+        thread = threading.Thread(target=self.__accept_clients)
+        thread.daemon = True
+        thread.start()
 
-    def __send(self, command, data):
-        pass
+    def __accept_clients(self):
+        while not self.__closed:
+            try:
+                conn, address = self.__socket.accept()
+            except OSError:
+                break
+            conn.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            with self.__condition:
+                client_id = self.__next_client_id
+                self.__next_client_id += 1
+                self.__clients[client_id] = {"socket": conn,
+                                             "address": address,
+                                             "connected": True,
+                                             "send_lock": threading.Lock(),
+                                             "statistics": None,
+                                             "streamed": {},
+                                             "result": None}
+            thread = threading.Thread(target=self.__receive, args=(client_id,))
+            thread.daemon = True
+            thread.start()
+            self.__notify("connected", {"id": client_id, "address": address})
+            # the client joins the current job.
+            if self.__prepared:
+                self.__send(client_id, "prepare", self.__prepare_data(client_id))
+            if self.__run_args is not None:
+                with self.__condition:
+                    self.__running.add(client_id)
+                self.__send(client_id, "run", self.__run_args)
+
+    def __receive(self, client_id):
+        conn = self.__clients[client_id]["socket"]
+        while True:
+            try:
+                data = recv_frame(conn)
+            except Exception as e:
+                # the connection is closed, or a malformed frame is received.
+                data = None
+            if data is None:
+                break
+            try:
+                self.__process_data(client_id, data)
+            except Exception as e:
+                print("exception while processing %s"%(data["command"]))
+                print(traceback.format_exc())
+
+        with self.__condition:
+            client = self.__clients[client_id]
+            client["connected"] = False
+            self.__running.discard(client_id)
+            self.__condition.notify_all()
+        conn.close()
+        self.__notify("disconnected", {"id": client_id, "address": client["address"]})
+
+    def __send(self, client_id, command, data):
+        client = self.__clients[client_id]
+        if not client["connected"]:
+            return
+        try:
+            with client["send_lock"]:
+                send_frame(client["socket"], command, data)
+        except OSError:
+            # the receiving thread handles the disconnection.
+            pass
+
+    @property
+    def __connected_ids(self):
+        return sorted([client_id for client_id, client in list(self.__clients.items())
+                                 if client["connected"]])
 
-    def __process_data(self, data):
-        pass
+    def __broadcast(self, command, data):
+        for client_id in self.__connected_ids:
+            self.__send(client_id, command, data)
+
+    def __migration_targets(self, client_id):
+        ids = self.__connected_ids
+        if len(ids) < 2 or client_id not in ids:
+            return []
+        if self.__topology == "ring":
+            return [ids[(ids.index(client_id) + 1) % len(ids)]]
+        return [i for i in ids if i != client_id]
+
+    def __process_data(self, client_id, data):
+        command = data["command"]
+        if command == "generation":
+            index = data["data"]["index"]
+            statistics = data["data"]["statistics"]
+            with self.__condition:
+                self.__clients[client_id]["streamed"][index] = statistics
+            if self.__generation_callback is not None:
+                statistics = dict(statistics)
+                statistics["client"] = client_id
+                self.__generation_callback(index, statistics)
+        elif command == "migrants":
+            for target in self.__migration_targets(client_id):
+                self.__send(target, "migrants", data["data"])
+        elif command == "result":
+            result = data["data"]
+            with self.__condition:
+                self.__clients[client_id]["result"] = result
+                # the result has the statistics of all generations.
+                self.__clients[client_id]["statistics"] = result["statistics"]
+                self.__clients[client_id]["streamed"] = {}
+                self.__running.discard(client_id)
+                self.__condition.notify_all()
+            self.__notify("result", {"id": client_id, "result": result})
 
     def __notify(self, name, data):
         if name not in self.__callbacks:
@@ -37,6 +177,21 @@ class OpenCLGAServer():
                 print("exception while execution %s callback"%(name))
                 print(traceback.format_exc())
 
+    def __prepare_data(self, client_id):
+        options = dict(self.__options)
+        # callbacks stay at the server, migration is handled by clients.
+        for key in ["generation_callback", "migration_interval", "migration_size",
+                    "migration_topology"]:
+            options.pop(key, None)
+        if "seed" in options:
+            # the clients evolve different populations, even at identical devices.
+            options["seed"] = (options["seed"] + client_id) % 2**64
+        return {"options": options,
+                "migration_interval": self.__options["migration_interval"]\
+                                        if "migration_interval" in self.__options else 10,
+                "migration_size": self.__options["migration_size"]\
+                                        if "migration_size" in self.__options else 5}
+
     # public APIs
     @property
     def paused(self):
@@ -46,6 +201,15 @@ class OpenCLGAServer():
     def elapsed_time(self):
         return self.__elapsed_time
 
+    @property
+    def port(self):
+        return self.__port
+
+    @property
+    def clients(self):
+        # ids of the connected clients
+        return self.__connected_ids
+
     def on(self, name, func):
         if name in self.__callbacks:
             self.__callbacks[name].append(func)
@@ -55,16 +219,42 @@ class OpenCLGAServer():
             self.__callbacks[name].remove(func)
 
     def prepare(self):
-        pass
+        self.__prepared = True
+        for client_id in self.__connected_ids:
+            self.__send(client_id, "prepare", self.__prepare_data(client_id))
 
     def run(self, prob_mutate, prob_crossover):
-        pass
+        # sends run to all clients and waits for their results or disconnections.
+        assert self.__prepared, "prepare should be called before run"
+        start_time = time.time()
+        self.__paused = False
+        self.__forceStop = False
+        with self.__condition:
+            self.__run_args = {"prob_mutate": prob_mutate, "prob_crossover": prob_crossover}
+            self.__running = set(self.__connected_ids)
+        self.__broadcast("run", self.__run_args)
+        with self.__condition:
+            while len(self.__running) > 0:
+                self.__condition.wait()
+            self.__run_args = None
+            results = [self.__clients[client_id]["result"] for client_id in self.__connected_ids
+                                                           if self.__clients[client_id]["result"]]
+        self.__paused = len(results) > 0 and all([result["paused"] for result in results])
+        self.__elapsed_time += time.time() - start_time
 
     def stop(self):
         self.__forceStop = True
+        self.__broadcast("stop", None)
 
     def pause(self):
         self.__paused = True
+        self.__broadcast("pause", None)
+
+    def shutdown(self):
+        # asks all clients to exit and stops listening.
+        self.__closed = True
+        self.__broadcast("exit", None)
+        self.__socket.close()
 
     def save(self, filename):
         raise RuntimeError("OpenCL Server doesn't support save or restore")
@@ -72,9 +262,25 @@ class OpenCLGAServer():
     def restore(self, filename):
         raise RuntimeError("OpenCL Server doesn't support save or restore")
 
+    def __client_statistics(self, client):
+        # The records of the last result and the generations streamed after it.
+        records = [ga_statistics.from_dict(client["streamed"])]
+        if client["statistics"] is not None:
+            records.insert(0, client["statistics"])
+        return numpy.concatenate(records)
+
     def get_statistics(self):
-        # think a good way to deal with asymmetric statistics
-        pass
+        # the statistics of clients are merged by generation into ga_statistics records.
+        with self.__condition:
+            statistics = [self.__client_statistics(client) for client in self.__clients.values()]
+        return utils.merge_statistics(statistics, self.__opt_for_max)
 
     def get_the_best(self):
-        pass
+        # the best of a client is None if it failed to report one.
+        results = [client["result"]["best"] for client in self.__clients.values()
+                                            if client["result"] is not None and\
+                                               client["result"]["best"] is not None]
+        if len(results) == 0:
+            return None
+        compare = max if self.__opt_for_max == "max" else min
+        return compare(results, key=lambda v: v[1])
@@ -0,0 +1,110 @@
+import os
+import re
+import hashlib
+import tempfile
+import pyopencl as cl
+
+DEFAULT_CACHE_PATH = os.path.join(os.path.expanduser("~"), ".oclGA", "programs")
+DEFAULT_CACHE_SIZE = 256 * 1024 * 1024
+
+INCLUDE_PATTERN = re.compile(r"^\s*#\s*include\s*[<\"]([^>\"]+)[>\"]", re.M)
+
+class ProgramCache():
+    # ProgramCache - stores the built program binaries at disk. A binary is keyed by the sha256 of
+    # the source, the contents of all files it includes, the build options and the device/driver.
+    # Binaries are written to a temporary file and renamed, so concurrent writers never leave a
+    # broken file. The least recently used binaries are removed while the cache is larger than
+    # max_size.
+    def __init__(self, path=None, max_size=None):
+        self.__path = path if path is not None else DEFAULT_CACHE_PATH
+        self.__max_size = max_size if max_size is not None else DEFAULT_CACHE_SIZE
+
+    def __read_includes(self, source, include_dirs, visited):
+        # Returns the contents of the included files recursively. A missing file is skipped, it
+        # may be a header of the OpenCL compiler itself.
+        contents = []
+        for name in INCLUDE_PATTERN.findall(source):
+            for folder in include_dirs:
+                file_path = os.path.join(folder, name)
+                if not os.path.isfile(file_path):
+                    continue
+                file_path = os.path.abspath(file_path)
+                if file_path not in visited:
+                    visited.add(file_path)
+                    with open(file_path, "r") as f:
+                        content = f.read()
+                    contents.append(file_path + "\n" + content)
+                    contents.extend(self.__read_includes(content, include_dirs, visited))
+                break
+        return contents
+
+    def __key(self, device, source, options, include_dirs):
+        sha = hashlib.sha256()
+        for part in [device.platform.name, device.platform.version, device.name,
+                     device.version, device.driver_version, " ".join(options), source]:
+            sha.update(part.encode("utf-8"))
+            sha.update(b"\0")
+        for content in self.__read_includes(source, include_dirs, set()):
+            sha.update(content.encode("utf-8"))
+            sha.update(b"\0")
+        return sha.hexdigest()
+
+    def __load(self, file_path):
+        try:
+            with open(file_path, "rb") as f:
+                binary = f.read()
+            # touch it for LRU eviction.
+            os.utime(file_path, None)
+            return binary
+        except OSError:
+            return None
+
+    def __store(self, file_path, binary):
+        os.makedirs(self.__path, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=self.__path, suffix=".tmp")
+        with os.fdopen(fd, "wb") as f:
+            f.write(binary)
+        os.replace(tmp_path, file_path)
+        self.__evict()
+
+    def __evict(self):
+        entries = []
+        for name in os.listdir(self.__path):
+            if not name.endswith(".bin"):
+                continue
+            try:
+                stat = os.stat(os.path.join(self.__path, name))
+            except OSError:
+                # removed by another process
+                continue
+            entries.append((stat.st_mtime, stat.st_size, name))
+        total = sum([size for mtime, size, name in entries])
+        for mtime, size, name in sorted(entries):
+            if total <= self.__max_size:
+                break
+            try:
+                os.remove(os.path.join(self.__path, name))
+            except OSError:
+                pass
+            total -= size
+
+    def build(self, ctx, source, options, include_dirs):
+        # The cache only handles the context of a single device. Otherwise, the program is built
+        # from the source as usual.
+        if len(ctx.devices) != 1:
+            return cl.Program(ctx, source).build(options)
+
+        device = ctx.devices[0]
+        file_path = os.path.join(self.__path,
+                                 self.__key(device, source, options, include_dirs) + ".bin")
+        binary = self.__load(file_path)
+        if binary is not None:
+            try:
+                return cl.Program(ctx, [device], [binary]).build(options)
+            except cl.Error:
+                # The binary is rejected by the driver, rebuild it from the source.
+                pass
+
+        prg = cl.Program(ctx, source).build(options)
+        self.__store(file_path, prg.get_info(cl.program_info.BINARIES)[0])
+        return prg
@@ -1,20 +1,40 @@
 import numpy
-import pyopencl as cl
+try:
+    import pyopencl as cl
+except ImportError:
+    # pyopencl is optional while running with the numpy backend.
+    cl = None
 
+import numpy_ga_utils
 from simple_gene import SimpleGene
 
 class ShufflerChromosome:
+    # The crossover operators and their kernel functions, see shuffler_chromosome.c.
+    # "cut" - a single cut point, the genes before it are copied from the other parent.
+    # "ox" - order crossover.
+    # "pmx" - partially mapped crossover.
+    # "erx" - edge recombination crossover.
+    CROSSOVER_FUNCS = {"cut": "shuffler_chromosome_cut_crossover",
+                       "ox": "shuffler_chromosome_ox_crossover",
+                       "pmx": "shuffler_chromosome_pmx_crossover",
+                       "erx": "shuffler_chromosome_erx_crossover"}
+
     # ShufflerChromosome - a chromosome contains a list of Genes.
     # __genes - an ordered list of Genes
     # __name - name of the chromosome
+    # __crossover - name of the crossover operator
     # dna - an listed of Gene's dna
     # dna_total_length - sum of the lenght of all genes's dna
-    def __init__(self, genes, name = ""):
+    def __init__(self, genes, name = "", crossover = "cut"):
         assert all(isinstance(gene, SimpleGene) for gene in genes)
         assert type(genes) == list
+        assert crossover in ShufflerChromosome.CROSSOVER_FUNCS
         self.__genes = genes
         self.__name = name
+        self.__crossover = crossover
         self.__improving_func = None
+        self.__improving_delta = False
+        self.__local_search_func = None
         self.__best = numpy.zeros(1, dtype=numpy.float32)
         self.__worst = numpy.zeros(1, dtype=numpy.float32)
         self.__avg = numpy.zeros(1, dtype=numpy.float32)
@@ -53,10 +73,40 @@ class ShufflerChromosome:
     def gene_elements_in_kernel(self):
         return [] if len(self.__genes) == 0 else self.__genes[0].elements_in_kernel
 
+    @property
+    def gene_dtype(self):
+        # The narrowest type which keeps the gene values, 0 ~ elements_length - 1, of all genes.
+        max_length = max([gene.elements_length for gene in self.__genes] + [1])
+        if max_length <= 256:
+            return numpy.uint8
+        elif max_length <= 65536:
+            return numpy.uint16
+        return numpy.int32
+
+    @property
+    def gene_type(self):
+        # The OpenCL type of gene_dtype, it's defined as GENE_TYPE for kernels.
+        return {numpy.uint8: "uchar", numpy.uint16: "ushort", numpy.int32: "int"}[self.gene_dtype]
+
     @property
     def kernel_file(self):
         return "shuffler_chromosome.c"
 
+    @property
+    def island_kernel_file(self):
+        # the kernel file of the persistent island engine, it's included after fitness function.
+        return "shuffler_island.c"
+
+    @property
+    def fused_kernel_file(self):
+        # the kernel file of the fused generation, it's included after fitness function.
+        return "shuffler_fused.c"
+
+    @property
+    def local_search_kernel_file(self):
+        # the kernel file of use_local_search, it's included after fitness function.
+        return None if self.__local_search_func is None else "shuffler_local_search.c"
+
     @property
     def struct_name(self):
         return "__ShufflerChromosome";
@@ -72,93 +122,220 @@ class ShufflerChromosome:
     def from_kernel_value(self, data):
         assert len(data) == self.num_of_genes
         genes = [self.__genes[idx].from_kernel_value(v) for idx, v in enumerate(data)]
-        return ShufflerChromosome(genes, self.__name)
-
-    def use_improving_only_mutation(self, helper_func_name):
+        return ShufflerChromosome(genes, self.__name, self.__crossover)
+
+    def to_dict(self):
+        # The JSON values to rebuild the chromosome by from_dict, e.g. to send it to clients.
+        data = SimpleGene.genes_to_dict(self.__genes)
+        data.update({"name": self.__name,
+                     "crossover": self.__crossover,
+                     "improving_func": self.__improving_func,
+                     "improving_delta": self.__improving_delta,
+                     "local_search": None})
+        if self.__local_search_func is not None:
+            data["local_search"] = [self.__local_search_func, self.__local_search_interval,
+                                    self.__local_search_size, self.__local_search_selection,
+                                    self.__local_search_iterations]
+        return data
+
+    @staticmethod
+    def from_dict(data):
+        chromosome = ShufflerChromosome(SimpleGene.genes_from_dict(data), data["name"],
+                                        data["crossover"])
+        if data["improving_func"] is not None:
+            chromosome.use_improving_only_mutation(data["improving_func"], data["improving_delta"])
+        if data["local_search"] is not None:
+            chromosome.use_local_search(*data["local_search"])
+        return chromosome
+
+    def decode_kernel_values(self, values):
+        # Decodes a 2D array of kernel values, a chromosome per row, to the gene elements at once.
+        return numpy_ga_utils.elements_array(self.gene_elements)[values]
+
+    def use_improving_only_mutation(self, helper_func_name, delta=False):
+        # The helper returns the index to swap with the mutated gene idx. If delta is True, the
+        # helper is called as helper(c, i, j, chromosome_size FITNESS_ARGV) and returns the change
+        # of fitness by swapping genes i and j, the swap which improves the fitness most is chosen
+        # by shuffler_chromosome_delta_improving_func. It only reads the changed parts of a
+        # chromosome, e.g. tsp_table_swap_delta of tsp_fitness.c reads 4 to 6 edges of a tour.
         self.__improving_func = helper_func_name
+        self.__improving_delta = delta
+
+    def use_local_search(self, distance_func_name, interval=10, size=16, selection="best",
+                         iterations=5):
+        # Improves size chromosomes by 2-opt and Or-opt moves every interval generations, see
+        # shuffler_local_search.c. The fitness should be the length of a closed tour to minimize.
+        # distance_func_name(a, b, chromosome_size FITNESS_ARGV) returns the distance between 2
+        # gene values, e.g. tsp_table_edge_distance of tsp_fitness.c.
+        # selection - "best" picks the chromosomes with the lowest fitnesses and "random" picks
+        #             random ones.
+        # iterations - the maximal rounds of 2-opt and Or-opt for a chromosome.
+        assert selection in ["best", "random"]
+        assert interval >= 1 and size >= 1 and iterations >= 1
+        self.__local_search_func = distance_func_name
+        self.__local_search_interval = interval
+        self.__local_search_size = size
+        self.__local_search_selection = selection
+        self.__local_search_iterations = iterations
 
     def kernelize(self):
         improving_func = self.__improving_func if self.__improving_func is not None\
                                                else "shuffler_chromosome_dummy_improving_func"
+        delta_func_header = ""
+        if self.__improving_delta:
+            delta_func_header = "float " + improving_func + "(global GENE_TYPE* c," +\
+                                "int i," +\
+                                "int j," +\
+                                "int chromosome_size FITNESS_ARGS);\n"
+            improving_func = "shuffler_chromosome_delta_improving_func"
         candidates = "#define SIMPLE_GENE_ELEMENTS " + self.__genes[0].elements_in_kernel_str
         defines = "#define SHUFFLER_CHROMOSOME_GENE_SIZE " + str(self.num_of_genes) + "\n" +\
-                  "#define IMPROVED_FITNESS_FUNC " + improving_func + "\n"
-
-        improving_func_header = "int " + improving_func + "(global int* c," +\
+                  "#define IMPROVED_FITNESS_FUNC " + improving_func + "\n" +\
+                  "#define SHUFFLER_CHROMOSOME_CROSSOVER " +\
+                  ShufflerChromosome.CROSSOVER_FUNCS[self.__crossover] + "\n"
+        if self.__improving_delta:
+            defines += "#define IMPROVING_DELTA_FUNC " + self.__improving_func + "\n"
+        if self.__local_search_func is not None:
+            defines += "#define LOCAL_SEARCH_DISTANCE " + self.__local_search_func + "\n"
+            delta_func_header += "float " + self.__local_search_func + "(int a," +\
+                                 "int b," +\
+                                 "int chromosome_size FITNESS_ARGS);\n"
+
+        # The fitness arguments are passed to the helper too, e.g. a distance table.
+        improving_func_header = "int " + improving_func + "(global GENE_TYPE* c," +\
                                 "int idx," +\
-                                "int chromosome_size);"
-        return candidates + defines + improving_func_header
+                                "int chromosome_size FITNESS_ARGS);"
+        return candidates + defines + delta_func_header + improving_func_header
 
     def save(self, data, ctx, queue, population):
-        total_dna_size = population * self.dna_total_length
-        # prepare memory
-        other_chromosomes = numpy.zeros(total_dna_size, dtype=numpy.int32)
-        cross_map = numpy.zeros(total_dna_size, dtype=numpy.int32)
-        ratios = numpy.zeros(population, dtype=numpy.float32)
-        # read data from cl
-        cl.enqueue_read_buffer(queue, self.__dev_ratios, ratios)
-        cl.enqueue_read_buffer(queue, self.__dev_best, self.__best)
-        cl.enqueue_read_buffer(queue, self.__dev_worst, self.__worst)
-        cl.enqueue_read_buffer(queue, self.__dev_avg, self.__avg)
-        cl.enqueue_read_buffer(queue, self.__dev_other_chromosomes, other_chromosomes)
-        cl.enqueue_read_buffer(queue, self.__dev_cross_map, cross_map).wait()
-        # save all of them
+        # The scratch buffers, e.g. ratios and parents, are regenerated at every
+        # generation. Only the statistics are saved.
+        cl.enqueue_copy(queue, self.__best, self.__dev_best)
+        cl.enqueue_copy(queue, self.__worst, self.__dev_worst)
+        cl.enqueue_copy(queue, self.__avg, self.__dev_avg).wait()
         data["best"] = self.__best
         data["worst"] = self.__worst
         data["avg"] = self.__avg
-        data["other_chromosomes"] = other_chromosomes
-        data["cross_map"] = cross_map
-        data["ratios"] = ratios
+
+    def state_buffers(self):
+        # The device buffers which are saved by save, {name: (buffer, dtype)}. They are copied by
+        # background checkpoints without reading back at the GA queue.
+        return {"best": (self.__dev_best, numpy.float32),
+                "worst": (self.__dev_worst, numpy.float32),
+                "avg": (self.__dev_avg, numpy.float32)}
 
     def restore(self, data, ctx, queue, population):
-        self.__best = data["best"]
-        self.__worst = data["worst"]
-        self.__avg = data["avg"]
-        other_chromosomes = data["other_chromosomes"]
-        cross_map = data["cross_map"]
-        ratios = data["ratios"]
-        # prepare CL memory
-        mf = cl.mem_flags
-        self.__dev_ratios = cl.Buffer(ctx, mf.WRITE_ONLY, ratios.nbytes)
-        self.__dev_best = cl.Buffer(ctx, mf.READ_WRITE | mf.COPY_HOST_PTR,
-                                    hostbuf=self.__best)
-        self.__dev_worst = cl.Buffer(ctx, mf.READ_WRITE | mf.COPY_HOST_PTR,
-                                     hostbuf=self.__worst)
-        self.__dev_avg = cl.Buffer(ctx, mf.READ_WRITE | mf.COPY_HOST_PTR,
-                                   hostbuf=self.__avg)
-        self.__dev_other_chromosomes = cl.Buffer(ctx, mf.READ_WRITE | mf.COPY_HOST_PTR,
-                                                 hostbuf=other_chromosomes)
-        self.__dev_cross_map = cl.Buffer(ctx, mf.READ_WRITE | mf.COPY_HOST_PTR,
-                                         hostbuf=cross_map)
-        # Copy data from main memory to GPU memory
-        cl.enqueue_copy(queue, self.__dev_ratios, ratios)
-        cl.enqueue_copy(queue, self.__dev_best, self.__best)
-        cl.enqueue_copy(queue, self.__dev_worst, self.__worst)
-        cl.enqueue_copy(queue, self.__dev_avg, self.__avg)
-        cl.enqueue_copy(queue, self.__dev_other_chromosomes, other_chromosomes)
-        cl.enqueue_copy(queue, self.__dev_cross_map, cross_map)
+        # the saved arrays may be read-only, keep writable copies for reading back from device.
+        self.__best = numpy.array(data["best"], dtype=numpy.float32)
+        self.__worst = numpy.array(data["worst"], dtype=numpy.float32)
+        self.__avg = numpy.array(data["avg"], dtype=numpy.float32)
+        self.preexecute_kernels(ctx, queue, population)
 
     def preexecute_kernels(self, ctx, queue, population):
         ## initialize global variables for kernel execution
-        total_dna_size = population * self.dna_total_length
-
-        other_chromosomes = numpy.zeros(total_dna_size, dtype=numpy.int32)
-        cross_map = numpy.zeros(total_dna_size, dtype=numpy.int32)
         ratios = numpy.zeros(population, dtype=numpy.float32)
 
         mf = cl.mem_flags
 
-        self.__dev_ratios = cl.Buffer(ctx, mf.WRITE_ONLY, ratios.nbytes)
+        self.__dev_ratios = cl.Buffer(ctx, mf.READ_WRITE, ratios.nbytes)
+        self.__init_ratio_reduction(ctx, queue, population)
         self.__dev_best = cl.Buffer(ctx, mf.READ_WRITE | mf.COPY_HOST_PTR,
                                     hostbuf=self.__best)
         self.__dev_worst = cl.Buffer(ctx, mf.READ_WRITE | mf.COPY_HOST_PTR,
                                      hostbuf=self.__worst)
         self.__dev_avg = cl.Buffer(ctx, mf.READ_WRITE | mf.COPY_HOST_PTR,
                                    hostbuf=self.__avg)
-        self.__dev_other_chromosomes = cl.Buffer(ctx, mf.READ_WRITE | mf.COPY_HOST_PTR,
-                                                 hostbuf=other_chromosomes)
-        self.__dev_cross_map = cl.Buffer(ctx, mf.READ_WRITE | mf.COPY_HOST_PTR,
-                                         hostbuf=cross_map)
+        # the index of the other parent of each chromosome, it's written by pick_chromosomes.
+        self.__dev_parents = cl.Buffer(ctx, mf.READ_WRITE, 4 * population)
+        if self.__local_search_func is not None:
+            self.__dev_local_search_indices = cl.Buffer(ctx, mf.READ_ONLY,
+                                                        4 * min(self.__local_search_size,
+                                                                population))
+
+    def init_island_kernel(self, ctx, queue, population, island_size):
+        # The persistent island engine evolves an island per work-group at local memory. The island
+        # size must be a power of 2 which divides the population.
+        assert island_size & (island_size - 1) == 0 and population % island_size == 0,\
+               "the island size should be a power of 2 which divides the population"
+        assert island_size <= queue.device.max_work_group_size
+        gene_size = numpy.dtype(self.gene_dtype).itemsize
+        assert island_size * (gene_size * self.dna_total_length + 16) + 4 <=\
+               queue.device.local_mem_size, "the island doesn't fit in local memory"
+        self.__island_size = island_size
+        self.__island_launches = 0
+        num_of_islands = population // island_size
+        mf = cl.mem_flags
+        self.__dev_migrants = [cl.Buffer(ctx, mf.READ_WRITE,
+                                         num_of_islands * self.dna_total_length * gene_size)
+                               for i in range(2)]
+        self.__dev_migrant_fitnesses = [cl.Buffer(ctx, mf.READ_WRITE, num_of_islands * 4)
+                                        for i in range(2)]
+
+    def __init_ratio_reduction(self, ctx, queue, population):
+        # calc_ratio is a tree reduction whose local size must be a power of 2. The number of
+        # work-groups is limited by the local size to let a single work-group merge the partials.
+        max_local_size = min(256, queue.device.max_work_group_size)
+        self.__ratio_local_size = 1 << (max_local_size.bit_length() - 1)
+        # the scan of cumulative ratios needs a work-item per chromosome.
+        self.__scan_groups = (population + self.__ratio_local_size - 1) // self.__ratio_local_size
+        self.__ratio_groups = min(self.__ratio_local_size, self.__scan_groups)
+        mf = cl.mem_flags
+        self.__dev_partials = cl.Buffer(ctx, mf.READ_WRITE, self.__ratio_groups * 3 * 4)
+        self.__dev_diff_total = cl.Buffer(ctx, mf.READ_WRITE, 4)
+        self.__dev_group_sums = cl.Buffer(ctx, mf.READ_WRITE, self.__scan_groups * 4)
+
+    def __execute_calc_ratio(self, launcher, queue, population, dev_fitnesses, wait_for=None):
+        local_size = self.__ratio_local_size
+        local_mems = [cl.LocalMemory(4 * local_size) for i in range(3)]
+        evt = launcher.launch(queue,
+                              "shuffler_chromosome_calc_ratio_partial",
+                              self.__ratio_groups * local_size,
+                              [dev_fitnesses,
+                              self.__dev_partials,
+                              *local_mems],
+                              local_size=local_size,
+                              wait_for=wait_for)
+        evt = launcher.launch(queue,
+                              "shuffler_chromosome_calc_ratio_final",
+                              local_size,
+                              [dev_fitnesses,
+                              self.__dev_partials,
+                              numpy.int32(self.__ratio_groups),
+                              self.__dev_best,
+                              self.__dev_worst,
+                              self.__dev_avg,
+                              self.__dev_diff_total,
+                              *local_mems],
+                              local_size=local_size,
+                              wait_for=[evt])
+        # __dev_ratios keeps the cumulative ratios for the binary search of pick_chromosomes.
+        evt = launcher.launch(queue,
+                              "shuffler_chromosome_calc_ratio",
+                              self.__scan_groups * local_size,
+                              [dev_fitnesses,
+                              self.__dev_ratios,
+                              self.__dev_group_sums,
+                              self.__dev_worst,
+                              self.__dev_diff_total,
+                              local_mems[0]],
+                              local_size=local_size,
+                              wait_for=[evt])
+        evt = launcher.launch(queue,
+                              "shuffler_chromosome_calc_ratio_scan_groups",
+                              local_size,
+                              [self.__dev_group_sums,
+                              numpy.int32(self.__scan_groups),
+                              local_mems[0]],
+                              local_size=local_size,
+                              wait_for=[evt])
+        return launcher.launch(queue,
+                               "shuffler_chromosome_calc_ratio_add_offsets",
+                               self.__scan_groups * local_size,
+                               [self.__dev_ratios,
+                               self.__dev_group_sums],
+                               local_size=local_size,
+                               wait_for=[evt])
+
     def get_current_best(self):
         return self.__best[0]
 
@@ -172,69 +349,236 @@ class ShufflerChromosome:
         return ["shuffler_chromosome_populate"]
 
     def get_crossover_kernel_names(self):
-        return ["shuffler_chromosome_calc_ratio",\
+        return ["shuffler_chromosome_calc_ratio_partial",\
+                "shuffler_chromosome_calc_ratio_final",\
+                "shuffler_chromosome_calc_ratio",\
+                "shuffler_chromosome_calc_ratio_scan_groups",\
+                "shuffler_chromosome_calc_ratio_add_offsets",\
                 "shuffler_chromosome_pick_chromosomes",\
                 "shuffler_chromosome_do_crossover"]
 
     def get_mutation_kernel_names(self):
         return ["shuffler_chromosome_single_gene_mutate"]
 
-    def execute_populate(self, prg, queue, population, dev_chromosomes, dev_rnum):
-        prg.shuffler_chromosome_populate(queue,
-                                         (population,),
-                                         (1,),
-                                         dev_chromosomes,
-                                         dev_rnum).wait()
-
-    def execute_crossover(self, prg, queue, population, generation_idx, prob_crossover,
-                          dev_chromosomes, dev_fitnesses, dev_rnum):
-        prg.shuffler_chromosome_calc_ratio(queue,
-                                           (1,),
-                                           (1,),
-                                           dev_fitnesses,
-                                           self.__dev_ratios,
-                                           self.__dev_best,
-                                           self.__dev_worst,
-                                           self.__dev_avg).wait()
-
-        cl.enqueue_read_buffer(queue, self.__dev_best, self.__best)
-        cl.enqueue_read_buffer(queue, self.__dev_avg, self.__avg)
-        cl.enqueue_read_buffer(queue, self.__dev_worst, self.__worst).wait()
+    def execute_populate(self, launcher, queue, population, dev_chromosomes, rand_seed,
+                         wait_for=None):
+        return launcher.launch(queue,
+                               "shuffler_chromosome_populate",
+                               population,
+                               [dev_chromosomes,
+                               rand_seed],
+                               outputs=[dev_chromosomes],
+                               wait_for=wait_for)
+
+    def execute_crossover(self, launcher, queue, population, generation_idx, prob_crossover,
+                          dev_chromosomes, dev_fitnesses, dev_next_chromosomes, rand_seed,
+                          wait_for=None):
+        # pick_chromosomes and do_crossover check the convergence by best and worst at device, so
+        # we don't need to read them back before enqueuing the kernels. The offspring are written
+        # to dev_next_chromosomes, the caller swaps it with dev_chromosomes.
+        evt = self.__execute_calc_ratio(launcher, queue, population, dev_fitnesses, wait_for)
+        evt = launcher.launch(queue,
+                              "shuffler_chromosome_pick_chromosomes",
+                              population,
+                              [self.__dev_ratios,
+                              self.__dev_parents,
+                              self.__dev_best,
+                              self.__dev_worst,
+                              rand_seed,
+                              numpy.int32(generation_idx)],
+                              outputs=[self.__dev_parents],
+                              wait_for=[evt])
+        return launcher.launch(queue,
+                               "shuffler_chromosome_do_crossover",
+                               population,
+                               [dev_chromosomes,
+                               dev_fitnesses,
+                               self.__dev_parents,
+                               dev_next_chromosomes,
+                               self.__dev_best,
+                               self.__dev_worst,
+                               numpy.float32(prob_crossover),
+                               rand_seed,
+                               numpy.int32(generation_idx)],
+                               outputs=[dev_next_chromosomes],
+                               wait_for=[evt])
+
+    def execute_mutation(self, launcher, queue, population, generation_idx, prob_mutate,
+                         dev_chromosomes, dev_fitnesses, rand_seed, fitness_args, wait_for=None):
+        improve = numpy.int32(self.__improving_func is not None)
+        return launcher.launch(queue,
+                               "shuffler_chromosome_single_gene_mutate",
+                               population,
+                               [dev_chromosomes,
+                               numpy.float32(prob_mutate),
+                               rand_seed,
+                               numpy.int32(generation_idx),
+                               improve,
+                               self.__dev_best,
+                               self.__dev_worst] + fitness_args,
+                               outputs=[dev_chromosomes],
+                               wait_for=wait_for)
+
+    def execute_fused_generation(self, launcher, queue, population, generation_idx, prob_mutate,
+                                 prob_crossover, dev_chromosomes, dev_fitnesses,
+                                 dev_next_chromosomes, dev_next_fitnesses, rand_seed, fitness_args,
+                                 wait_for=None):
+        # Selects, crosses over, mutates and evaluates the offspring in a single launch after
+        # calc_ratio. The offspring and fitnesses are written to dev_next_chromosomes and
+        # dev_next_fitnesses, the caller swaps them with the current ones.
+        improve = numpy.int32(self.__improving_func is not None)
+        evt = self.__execute_calc_ratio(launcher, queue, population, dev_fitnesses, wait_for)
+        return launcher.launch(queue,
+                               "shuffler_chromosome_fused_generation",
+                               population,
+                               [dev_chromosomes,
+                               dev_fitnesses,
+                               dev_next_chromosomes,
+                               dev_next_fitnesses,
+                               self.__dev_ratios,
+                               self.__dev_best,
+                               self.__dev_worst,
+                               numpy.float32(prob_crossover),
+                               numpy.float32(prob_mutate),
+                               rand_seed,
+                               numpy.int32(generation_idx),
+                               improve] + fitness_args,
+                               outputs=[dev_next_chromosomes, dev_next_fitnesses],
+                               wait_for=[evt])
+
+    def execute_local_search(self, launcher, queue, population, generation_idx, generations,
+                             dev_chromosomes, dev_fitnesses, rand_seed, fitness_args,
+                             wait_for=None):
+        # Returns None if the local search doesn't run at these generations. The best chromosomes
+        # are picked by reading fitnesses back, it waits for the device. The random ones are picked
+        # by the rng of (rand_seed, generation_idx), so a seeded run is reproducible.
+        if (generation_idx + generations) // self.__local_search_interval ==\
+           generation_idx // self.__local_search_interval:
+            return None
+        size = min(self.__local_search_size, population)
+        if self.__local_search_selection == "best":
+            fitnesses = numpy.empty(population, dtype=numpy.float32)
+            launcher.record_transfer("read_local_search_fitnesses",
+                                     cl.enqueue_copy(queue, fitnesses, dev_fitnesses,
+                                                     wait_for=wait_for))
+            indices = numpy.argsort(fitnesses, kind="stable")[:size]
+        else:
+            rng = numpy.random.default_rng((int(rand_seed), generation_idx))
+            indices = rng.choice(population, size, replace=False)
+        # it's kept until the copy is done.
+        self.__local_search_indices = numpy.array(indices, dtype=numpy.int32)
+        evt = launcher.record_transfer("write_local_search_indices",
+                                       cl.enqueue_copy(queue, self.__dev_local_search_indices,
+                                                       self.__local_search_indices,
+                                                       wait_for=wait_for, is_blocking=False))
+        return launcher.launch(queue,
+                               "shuffler_chromosome_local_search",
+                               size,
+                               [dev_chromosomes,
+                                dev_fitnesses,
+                                self.__dev_local_search_indices,
+                                numpy.int32(size),
+                                numpy.int32(self.__local_search_iterations)] + fitness_args,
+                               outputs=[dev_chromosomes, dev_fitnesses],
+                               wait_for=[evt])
+
+    def execute_island_generations(self, launcher, queue, population, generation_idx, generations,
+                                   prob_mutate, prob_crossover, dev_chromosomes, dev_fitnesses,
+                                   rand_seed, fitness_args, wait_for=None):
+        # Migrants are swapped between two buffers at each launch, because an island may write its
+        # migrant before the next island reads the one of the last launch.
+        parity = self.__island_launches % 2
+        local_size = self.__island_size
+        improve = numpy.int32(self.__improving_func is not None)
+        gene_size = numpy.dtype(self.gene_dtype).itemsize
+        evt = launcher.launch(queue,
+                              "shuffler_chromosome_island_evolve",
+                              population,
+                              [dev_chromosomes,
+                               dev_fitnesses,
+                               rand_seed,
+                               numpy.int32(generation_idx),
+                               self.__dev_migrants[parity],
+                               self.__dev_migrant_fitnesses[parity],
+                               self.__dev_migrants[1 - parity],
+                               self.__dev_migrant_fitnesses[1 - parity],
+                               numpy.int32(self.__island_launches > 0),
+                               numpy.int32(generations),
+                               numpy.float32(prob_mutate),
+                               numpy.float32(prob_crossover),
+                               improve,
+                               cl.LocalMemory(gene_size * local_size * self.dna_total_length),
+                               cl.LocalMemory(4 * local_size),
+                               cl.LocalMemory(4 * local_size),
+                               cl.LocalMemory(4 * local_size),
+                               cl.LocalMemory(4 * local_size),
+                               cl.LocalMemory(4),
+                               *fitness_args],
+                              local_size=local_size,
+                              wait_for=wait_for)
+        self.__island_launches += 1
+        # best, worst and avg aren't updated by the island engine. They are only read by save, and
+        # the kernels which use them run calc_ratio first, e.g. after restoring without islands.
+        return evt
+
+    # numpy backend: chromosomes is a 2D view (population x num_of_genes) of the population.
+    def numpy_save(self, data):
+        data["best"] = self.__best
+        data["worst"] = self.__worst
+        data["avg"] = self.__avg
+
+    def numpy_restore(self, data):
+        self.__best = numpy.array(data["best"], dtype=numpy.float32)
+        self.__worst = numpy.array(data["worst"], dtype=numpy.float32)
+        self.__avg = numpy.array(data["avg"], dtype=numpy.float32)
+
+    def numpy_populate(self, rng, chromosomes):
+        population, size = chromosomes.shape
+        elements = numpy.array(self.gene_elements_in_kernel, dtype=chromosomes.dtype)
+        # sorting random keys gives us an independent permutation for each chromosome.
+        chromosomes[:] = elements[numpy.argsort(rng.random((population, size)), axis=1)]
+
+    def numpy_crossover(self, rng, chromosomes, fitnesses, prob_crossover, opt_for_max):
+        assert self.__crossover == "cut", "numpy backend only supports the cut crossover"
+        population, size = chromosomes.shape
+        cumulative, best, worst, avg = numpy_ga_utils.utils_calc_ratio(fitnesses, opt_for_max)
+        self.__best[0] = best
+        self.__worst[0] = worst
+        self.__avg[0] = avg
 
         if self.early_terminated:
             return
 
-        prg.shuffler_chromosome_pick_chromosomes(queue,
-                                                 (population,),
-                                                 (1,),
-                                                 dev_chromosomes,
-                                                 dev_fitnesses,
-                                                 self.__dev_other_chromosomes,
-                                                 self.__dev_ratios,
-                                                 self.__dev_best,
-                                                 self.__dev_worst,
-                                                 dev_rnum).wait()
-        prg.shuffler_chromosome_do_crossover(queue,
-                                             (population,),
-                                             (1,),
-                                             dev_chromosomes,
-                                             dev_fitnesses,
-                                             self.__dev_other_chromosomes,
-                                             self.__dev_cross_map,
-                                             self.__dev_best,
-                                             self.__dev_worst,
-                                             self.__dev_avg,
-                                             numpy.float32(prob_crossover),
-                                             dev_rnum,
-                                             numpy.int32(generation_idx)).wait()
-
-
-    def execute_mutation(self, prg, queue, population, generation_idx, prob_mutate,
-                         dev_chromosomes, dev_fitnesses, dev_rnum):
-        prg.shuffler_chromosome_single_gene_mutate(queue,
-                                            (population,),
-                                            (1,),
-                                            dev_chromosomes,
-                                            numpy.float32(prob_mutate),
-                                            dev_rnum,
-                                            numpy.int32(self.__improving_func is not None)).wait()
+        parents = numpy_ga_utils.random_choose_by_ratio(rng, cumulative, population)
+        # keep the best one and cross over the others by probability.
+        crossed = numpy.nonzero((numpy.abs(fitnesses - best) >= 0.000001) &\
+                                (rng.random(population) < prob_crossover))[0]
+        selves = chromosomes[crossed]
+        others = chromosomes[parents[crossed]]
+        rows = numpy.arange(len(crossed))[:, None]
+        # we must be cross over at least one element and must not cross over all of the element.
+        cross_point = rng.integers(1, size, len(crossed))
+        head = numpy.arange(size) < cross_point[:, None]
+        # cross_map marks the genes copied from the other chromosome.
+        cross_map = numpy.zeros((len(crossed), size), dtype=bool)
+        cross_map[rows, others] = head
+        # the remained genes of self chromosome are appended in order after the cross point.
+        remained = ~cross_map[rows, selves]
+        position = cross_point[:, None] + numpy.cumsum(remained, axis=1) - 1
+        children = numpy.where(head, others, 0)
+        r, c = numpy.nonzero(remained)
+        children[r, position[r, c]] = selves[r, c]
+        chromosomes[crossed] = children
+
+    def numpy_mutation(self, rng, chromosomes, prob_mutate):
+        population, size = chromosomes.shape
+        mutated = numpy.nonzero(rng.random(population) <= prob_mutate)[0]
+        i = rng.integers(0, size, len(mutated))
+        if self.__improving_func is not None:
+            assert callable(self.__improving_func),\
+                   "numpy backend needs a vectorized python function for improving only mutation"
+            j = numpy.asarray(self.__improving_func(chromosomes[mutated], i))
+        else:
+            j = (i + rng.integers(1, size, len(mutated))) % size
+        chromosomes[mutated, i], chromosomes[mutated, j] = chromosomes[mutated, j],\
+                                                           chromosomes[mutated, i]
@@ -1,6 +1,11 @@
 import numpy
-import pyopencl as cl
+try:
+    import pyopencl as cl
+except ImportError:
+    # pyopencl is optional while running with the numpy backend.
+    cl = None
 
+import numpy_ga_utils
 from simple_gene import SimpleGene
 
 class SimpleChromosome:
@@ -53,10 +58,30 @@ class SimpleChromosome:
     def gene_elements_in_kernel(self):
         return [] if len(self.__genes) == 0 else self.__genes[0].elements_in_kernel
 
+    @property
+    def gene_dtype(self):
+        # The narrowest type which keeps the gene values, 0 ~ elements_length - 1, of all genes.
+        max_length = max([gene.elements_length for gene in self.__genes] + [1])
+        if max_length <= 256:
+            return numpy.uint8
+        elif max_length <= 65536:
+            return numpy.uint16
+        return numpy.int32
+
+    @property
+    def gene_type(self):
+        # The OpenCL type of gene_dtype, it's defined as GENE_TYPE for kernels.
+        return {numpy.uint8: "uchar", numpy.uint16: "ushort", numpy.int32: "int"}[self.gene_dtype]
+
     @property
     def kernel_file(self):
         return "simple_chromosome.c"
 
+    @property
+    def fused_kernel_file(self):
+        # the kernel file of the fused generation, it's included after fitness function.
+        return "simple_fused.c"
+
     @property
     def struct_name(self):
         return "__SimpleChromosome";
@@ -74,76 +99,143 @@ class SimpleChromosome:
         genes = [self.__genes[idx].from_kernel_value(v) for idx, v in enumerate(data)]
         return SimpleChromosome(genes, self.__name)
 
+    def to_dict(self):
+        # The JSON values to rebuild the chromosome by from_dict, e.g. to send it to clients.
+        data = SimpleGene.genes_to_dict(self.__genes)
+        data["name"] = self.__name
+        return data
+
+    @staticmethod
+    def from_dict(data):
+        return SimpleChromosome(SimpleGene.genes_from_dict(data), data["name"])
+
+    def decode_kernel_values(self, values):
+        # Decodes a 2D array of kernel values, a chromosome per row, to the gene elements at once.
+        # The genes may have different elements, so each column is decoded by its gene.
+        if all(gene.elements is self.gene_elements for gene in self.__genes):
+            return numpy_ga_utils.elements_array(self.gene_elements)[values]
+        decoded = numpy.empty(values.shape, dtype=object)
+        for i, gene in enumerate(self.__genes):
+            decoded[:, i] = numpy_ga_utils.elements_array(gene.elements)[values[:, i]]
+        return decoded
+
     def kernelize(self):
         elements_size_list = [str(gene.elements_length) for gene in self.__genes]
         candidates = "#define SIMPLE_CHROMOSOME_GENE_ELEMENTS_SIZE {" +\
                             ", ".join(elements_size_list) + "}\n"
         defines = "#define SIMPLE_CHROMOSOME_GENE_SIZE " + str(self.num_of_genes) + "\n" +\
                   "#define SIMPLE_CHROMOSOME_GENE_MUTATE_FUNC " +\
-                        self.__genes[0].mutate_func_name + "\n"
+                        self.__genes[0].mutate_func_name + "\n" +\
+                  "#define SIMPLE_CHROMOSOME_GENE_PRIVATE_MUTATE_FUNC " +\
+                        self.__genes[0].private_mutate_func_name + "\n"
 
         return candidates + defines
 
     def save(self, data, ctx, queue, population):
-        total_dna_size = population * self.dna_total_length
-        # prepare memory
-        other_chromosomes = numpy.zeros(total_dna_size, dtype=numpy.int32)
-        ratios = numpy.zeros(population, dtype=numpy.float32)
-        # read data from cl
-        cl.enqueue_read_buffer(queue, self.__dev_ratios, ratios)
-        cl.enqueue_read_buffer(queue, self.__dev_best, self.__best)
-        cl.enqueue_read_buffer(queue, self.__dev_worst, self.__worst)
-        cl.enqueue_read_buffer(queue, self.__dev_avg, self.__avg)
-        cl.enqueue_read_buffer(queue, self.__dev_other_chromosomes, other_chromosomes).wait()
-        # save all of them
+        # The scratch buffers, e.g. ratios and parents, are regenerated at every
+        # generation. Only the statistics are saved.
+        cl.enqueue_copy(queue, self.__best, self.__dev_best)
+        cl.enqueue_copy(queue, self.__worst, self.__dev_worst)
+        cl.enqueue_copy(queue, self.__avg, self.__dev_avg).wait()
         data["best"] = self.__best
         data["worst"] = self.__worst
         data["avg"] = self.__avg
-        data["other_chromosomes"] = other_chromosomes
-        data["ratios"] = ratios
+
+    def state_buffers(self):
+        # The device buffers which are saved by save, {name: (buffer, dtype)}. They are copied by
+        # background checkpoints without reading back at the GA queue.
+        return {"best": (self.__dev_best, numpy.float32),
+                "worst": (self.__dev_worst, numpy.float32),
+                "avg": (self.__dev_avg, numpy.float32)}
 
     def restore(self, data, ctx, queue, population):
-        self.__best = data["best"]
-        self.__worst = data["worst"]
-        self.__avg = data["avg"]
-        other_chromosomes = data["other_chromosomes"]
-        ratios = data["ratios"]
-        # prepare CL memory
-        mf = cl.mem_flags
-        self.__dev_ratios = cl.Buffer(ctx, mf.WRITE_ONLY, ratios.nbytes)
-        self.__dev_best = cl.Buffer(ctx, mf.READ_WRITE | mf.COPY_HOST_PTR,
-                                    hostbuf=self.__best)
-        self.__dev_worst = cl.Buffer(ctx, mf.READ_WRITE | mf.COPY_HOST_PTR,
-                                     hostbuf=self.__worst)
-        self.__dev_avg = cl.Buffer(ctx, mf.READ_WRITE | mf.COPY_HOST_PTR,
-                                   hostbuf=self.__avg)
-        self.__dev_other_chromosomes = cl.Buffer(ctx, mf.READ_WRITE | mf.COPY_HOST_PTR,
-                                                 hostbuf=other_chromosomes)
-        # Copy data from main memory to GPU memory
-        cl.enqueue_copy(queue, self.__dev_ratios, ratios)
-        cl.enqueue_copy(queue, self.__dev_best, self.__best)
-        cl.enqueue_copy(queue, self.__dev_worst, self.__worst)
-        cl.enqueue_copy(queue, self.__dev_avg, self.__avg)
-        cl.enqueue_copy(queue, self.__dev_other_chromosomes, other_chromosomes)
+        # the saved arrays may be read-only, keep writable copies for reading back from device.
+        self.__best = numpy.array(data["best"], dtype=numpy.float32)
+        self.__worst = numpy.array(data["worst"], dtype=numpy.float32)
+        self.__avg = numpy.array(data["avg"], dtype=numpy.float32)
+        self.preexecute_kernels(ctx, queue, population)
 
     def preexecute_kernels(self, ctx, queue, population):
         ## initialize global variables for kernel execution
-        total_dna_size = population * self.dna_total_length
-
-        other_chromosomes = numpy.zeros(total_dna_size, dtype=numpy.int32)
         ratios = numpy.zeros(population, dtype=numpy.float32)
 
         mf = cl.mem_flags
 
-        self.__dev_ratios = cl.Buffer(ctx, mf.WRITE_ONLY, ratios.nbytes)
+        self.__dev_ratios = cl.Buffer(ctx, mf.READ_WRITE, ratios.nbytes)
+        self.__init_ratio_reduction(ctx, queue, population)
         self.__dev_best = cl.Buffer(ctx, mf.READ_WRITE | mf.COPY_HOST_PTR,
                                     hostbuf=self.__best)
         self.__dev_worst = cl.Buffer(ctx, mf.READ_WRITE | mf.COPY_HOST_PTR,
                                      hostbuf=self.__worst)
         self.__dev_avg = cl.Buffer(ctx, mf.READ_WRITE | mf.COPY_HOST_PTR,
                                    hostbuf=self.__avg)
-        self.__dev_other_chromosomes = cl.Buffer(ctx, mf.READ_WRITE | mf.COPY_HOST_PTR,
-                                                 hostbuf=other_chromosomes)
+        # the index of the other parent of each chromosome, it's written by pick_chromosomes.
+        self.__dev_parents = cl.Buffer(ctx, mf.READ_WRITE, 4 * population)
+
+    def __init_ratio_reduction(self, ctx, queue, population):
+        # calc_ratio is a tree reduction whose local size must be a power of 2. The number of
+        # work-groups is limited by the local size to let a single work-group merge the partials.
+        max_local_size = min(256, queue.device.max_work_group_size)
+        self.__ratio_local_size = 1 << (max_local_size.bit_length() - 1)
+        # the scan of cumulative ratios needs a work-item per chromosome.
+        self.__scan_groups = (population + self.__ratio_local_size - 1) // self.__ratio_local_size
+        self.__ratio_groups = min(self.__ratio_local_size, self.__scan_groups)
+        mf = cl.mem_flags
+        self.__dev_partials = cl.Buffer(ctx, mf.READ_WRITE, self.__ratio_groups * 3 * 4)
+        self.__dev_diff_total = cl.Buffer(ctx, mf.READ_WRITE, 4)
+        self.__dev_group_sums = cl.Buffer(ctx, mf.READ_WRITE, self.__scan_groups * 4)
+
+    def __execute_calc_ratio(self, launcher, queue, population, dev_fitnesses, wait_for=None):
+        local_size = self.__ratio_local_size
+        local_mems = [cl.LocalMemory(4 * local_size) for i in range(3)]
+        evt = launcher.launch(queue,
+                              "simple_chromosome_calc_ratio_partial",
+                              self.__ratio_groups * local_size,
+                              [dev_fitnesses,
+                              self.__dev_partials,
+                              *local_mems],
+                              local_size=local_size,
+                              wait_for=wait_for)
+        evt = launcher.launch(queue,
+                              "simple_chromosome_calc_ratio_final",
+                              local_size,
+                              [dev_fitnesses,
+                              self.__dev_partials,
+                              numpy.int32(self.__ratio_groups),
+                              self.__dev_best,
+                              self.__dev_worst,
+                              self.__dev_avg,
+                              self.__dev_diff_total,
+                              *local_mems],
+                              local_size=local_size,
+                              wait_for=[evt])
+        # __dev_ratios keeps the cumulative ratios for the binary search of pick_chromosomes.
+        evt = launcher.launch(queue,
+                              "simple_chromosome_calc_ratio",
+                              self.__scan_groups * local_size,
+                              [dev_fitnesses,
+                              self.__dev_ratios,
+                              self.__dev_group_sums,
+                              self.__dev_worst,
+                              self.__dev_diff_total,
+                              local_mems[0]],
+                              local_size=local_size,
+                              wait_for=[evt])
+        evt = launcher.launch(queue,
+                              "simple_chromosome_calc_ratio_scan_groups",
+                              local_size,
+                              [self.__dev_group_sums,
+                              numpy.int32(self.__scan_groups),
+                              local_mems[0]],
+                              local_size=local_size,
+                              wait_for=[evt])
+        return launcher.launch(queue,
+                               "simple_chromosome_calc_ratio_add_offsets",
+                               self.__scan_groups * local_size,
+                               [self.__dev_ratios,
+                               self.__dev_group_sums],
+                               local_size=local_size,
+                               wait_for=[evt])
 
     def get_current_best(self):
         return self.__best[0]
@@ -158,63 +250,140 @@ class SimpleChromosome:
         return ["simple_chromosome_populate"]
 
     def get_crossover_kernel_names(self):
-        return ["simple_chromosome_calc_ratio",\
+        return ["simple_chromosome_calc_ratio_partial",\
+                "simple_chromosome_calc_ratio_final",\
+                "simple_chromosome_calc_ratio",\
+                "simple_chromosome_calc_ratio_scan_groups",\
+                "simple_chromosome_calc_ratio_add_offsets",\
                 "simple_chromosome_pick_chromosomes",\
                 "simple_chromosome_do_crossover"]
 
     def get_mutation_kernel_names(self):
         return ["simple_chromosome_mutate_all"]
 
-    def execute_populate(self, prg, queue, population, dev_chromosomes, dev_rnum):
-        prg.simple_chromosome_populate(queue,
-                                       (population,),
-                                       (1,),
-                                       dev_chromosomes,
-                                       dev_rnum).wait()
-
-    def execute_crossover(self, prg, queue, population, generation_idx, prob_crossover,
-                          dev_chromosomes, dev_fitnesses, dev_rnum):
-        prg.simple_chromosome_calc_ratio(queue,
-                                         (1,),
-                                         (1,),
-                                         dev_fitnesses,
-                                         self.__dev_ratios,
-                                         self.__dev_best,
-                                         self.__dev_worst,
-                                         self.__dev_avg).wait()
-
-        cl.enqueue_read_buffer(queue, self.__dev_best, self.__best)
-        cl.enqueue_read_buffer(queue, self.__dev_avg, self.__avg)
-        cl.enqueue_read_buffer(queue, self.__dev_worst, self.__worst).wait()
+    def execute_populate(self, launcher, queue, population, dev_chromosomes, rand_seed,
+                         wait_for=None):
+        return launcher.launch(queue,
+                               "simple_chromosome_populate",
+                               population,
+                               [dev_chromosomes,
+                               rand_seed],
+                               outputs=[dev_chromosomes],
+                               wait_for=wait_for)
+
+    def execute_crossover(self, launcher, queue, population, generation_idx, prob_crossover,
+                          dev_chromosomes, dev_fitnesses, dev_next_chromosomes, rand_seed,
+                          wait_for=None):
+        # pick_chromosomes and do_crossover check the convergence by best and worst at device, so
+        # we don't need to read them back before enqueuing the kernels. The offspring are written
+        # to dev_next_chromosomes, the caller swaps it with dev_chromosomes.
+        evt = self.__execute_calc_ratio(launcher, queue, population, dev_fitnesses, wait_for)
+        evt = launcher.launch(queue,
+                              "simple_chromosome_pick_chromosomes",
+                              population,
+                              [self.__dev_ratios,
+                              self.__dev_parents,
+                              self.__dev_best,
+                              self.__dev_worst,
+                              rand_seed,
+                              numpy.int32(generation_idx)],
+                              outputs=[self.__dev_parents],
+                              wait_for=[evt])
+        return launcher.launch(queue,
+                               "simple_chromosome_do_crossover",
+                               population,
+                               [dev_chromosomes,
+                               dev_fitnesses,
+                               self.__dev_parents,
+                               dev_next_chromosomes,
+                               self.__dev_best,
+                               self.__dev_worst,
+                               numpy.float32(prob_crossover),
+                               rand_seed,
+                               numpy.int32(generation_idx)],
+                               outputs=[dev_next_chromosomes],
+                               wait_for=[evt])
+
+    def execute_mutation(self, launcher, queue, population, generation_idx, prob_mutate,
+                         dev_chromosomes, dev_fitnesses, rand_seed, fitness_args, wait_for=None):
+        return launcher.launch(queue,
+                               "simple_chromosome_mutate_all",
+                               population,
+                               [dev_chromosomes,
+                               numpy.float32(prob_mutate),
+                               rand_seed,
+                               numpy.int32(generation_idx),
+                               self.__dev_best,
+                               self.__dev_worst],
+                               outputs=[dev_chromosomes],
+                               wait_for=wait_for)
+
+    def execute_fused_generation(self, launcher, queue, population, generation_idx, prob_mutate,
+                                 prob_crossover, dev_chromosomes, dev_fitnesses,
+                                 dev_next_chromosomes, dev_next_fitnesses, rand_seed, fitness_args,
+                                 wait_for=None):
+        # Selects, crosses over, mutates and evaluates the offspring in a single launch after
+        # calc_ratio. The offspring and fitnesses are written to dev_next_chromosomes and
+        # dev_next_fitnesses, the caller swaps them with the current ones.
+        evt = self.__execute_calc_ratio(launcher, queue, population, dev_fitnesses, wait_for)
+        return launcher.launch(queue,
+                               "simple_chromosome_fused_generation",
+                               population,
+                               [dev_chromosomes,
+                               dev_fitnesses,
+                               dev_next_chromosomes,
+                               dev_next_fitnesses,
+                               self.__dev_ratios,
+                               self.__dev_best,
+                               self.__dev_worst,
+                               numpy.float32(prob_crossover),
+                               numpy.float32(prob_mutate),
+                               rand_seed,
+                               numpy.int32(generation_idx)] + fitness_args,
+                               outputs=[dev_next_chromosomes, dev_next_fitnesses],
+                               wait_for=[evt])
+
+    # numpy backend: chromosomes is a 2D view (population x num_of_genes) of the population.
+    def numpy_save(self, data):
+        data["best"] = self.__best
+        data["worst"] = self.__worst
+        data["avg"] = self.__avg
+
+    def numpy_restore(self, data):
+        self.__best = numpy.array(data["best"], dtype=numpy.float32)
+        self.__worst = numpy.array(data["worst"], dtype=numpy.float32)
+        self.__avg = numpy.array(data["avg"], dtype=numpy.float32)
+
+    def numpy_populate(self, rng, chromosomes):
+        elements_size = numpy.array([gene.elements_length for gene in self.__genes])
+        chromosomes[:] = rng.integers(0, elements_size, size=chromosomes.shape)
+
+    def numpy_crossover(self, rng, chromosomes, fitnesses, prob_crossover, opt_for_max):
+        population, size = chromosomes.shape
+        cumulative, best, worst, avg = numpy_ga_utils.utils_calc_ratio(fitnesses, opt_for_max)
+        self.__best[0] = best
+        self.__worst[0] = worst
+        self.__avg[0] = avg
 
         if self.early_terminated:
             return
 
-        prg.simple_chromosome_pick_chromosomes(queue,
-                                               (population,),
-                                               (1,),
-                                               dev_chromosomes,
-                                               dev_fitnesses,
-                                               self.__dev_other_chromosomes,
-                                               self.__dev_ratios,
-                                               dev_rnum).wait()
-        prg.simple_chromosome_do_crossover(queue,
-                                             (population,),
-                                             (1,),
-                                             dev_chromosomes,
-                                             dev_fitnesses,
-                                             self.__dev_other_chromosomes,
-                                             self.__dev_best,
-                                             numpy.float32(prob_crossover),
-                                             dev_rnum,
-                                             numpy.int32(generation_idx)).wait()
-
-
-    def execute_mutation(self, prg, queue, population, generation_idx, prob_mutate,
-                         dev_chromosomes, dev_fitnesses, dev_rnum):
-        prg.simple_chromosome_mutate_all(queue,
-                                         (population,),
-                                         (1,),
-                                         dev_chromosomes,
-                                         numpy.float32(prob_mutate),
-                                         dev_rnum).wait()
+        parents = numpy_ga_utils.random_choose_by_ratio(rng, cumulative, population)
+        # keep the best one and cross over the others by probability.
+        crossed = numpy.nonzero((numpy.abs(fitnesses - best) >= 0.000001) &\
+                                (rng.random(population) < prob_crossover))[0]
+        cross_start = rng.integers(0, size - 1, len(crossed))
+        cross_end = cross_start + rng.integers(0, size - cross_start)
+        positions = numpy.arange(size)
+        copied = (positions >= cross_start[:, None]) & (positions < cross_end[:, None])
+        chromosomes[crossed] = numpy.where(copied,
+                                           chromosomes[parents[crossed]],
+                                           chromosomes[crossed])
+
+    def numpy_mutation(self, rng, chromosomes, prob_mutate):
+        elements_size = numpy.array([gene.elements_length for gene in self.__genes])
+        # a gene with single element cannot be mutated to another one.
+        mutated = (rng.random(chromosomes.shape) <= prob_mutate) & (elements_size > 1)
+        # shifting by 1 ~ size-1 chooses an excluded element as simple_gene_mutate does.
+        shift = rng.integers(1, numpy.maximum(elements_size, 2), size=chromosomes.shape)
+        chromosomes[:] = numpy.where(mutated, (chromosomes + shift) % elements_size, chromosomes)
@@ -7,6 +7,26 @@ class SimpleGene:
     def clone_gene(g):
         return SimpleGene(g.dna, g.elements, g.name)
 
+    @staticmethod
+    def genes_to_dict(genes):
+        # The JSON values of genes for genes_from_dict. The elements lists shared by genes are
+        # kept once, so the elements must be JSON values.
+        elements = []
+        indices = {}
+        items = []
+        for gene in genes:
+            if id(gene.elements) not in indices:
+                indices[id(gene.elements)] = len(elements)
+                elements.append(gene.elements)
+            items.append({"dna": gene.dna, "elements": indices[id(gene.elements)],
+                          "name": gene.name})
+        return {"elements": elements, "genes": items}
+
+    @staticmethod
+    def genes_from_dict(data):
+        return [SimpleGene(item["dna"], data["elements"][item["elements"]], item["name"])
+                for item in data["genes"]]
+
     # SimpleGene - is a Gene with only one DNA.
     # dna - an object.
     # elements - a set of element which is the basic component of dna.
@@ -60,6 +80,11 @@ class SimpleGene:
         # excluded elments randomly.
         return "simple_gene_mutate"
 
+    @property
+    def private_mutate_func_name(self):
+        # The mutate function for a gene at private memory, e.g. of the fused generation.
+        return "simple_gene_mutate_private"
+
     @property
     def elements_in_kernel_str(self):
         # Chromosome can use this function to declare elements array
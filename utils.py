@@ -1,4 +1,6 @@
 import random
+import numpy
+import ga_statistics
 from math import pi, sqrt, asin, cos, sin, pow
 
 def get_testing_params():
@@ -22,6 +24,60 @@ def calc_spherical_distance(x1, y1, x2, y2):
     s = round( s * 10000 ) / 10000
     return s
 
+def calculate_distance_matrix(xs, ys, spherical=False, dtype=numpy.float32, packed=False):
+    # The distances between all pairs of cities, computed as calc_linear_distance or
+    # calc_spherical_distance of tsp_fitness.c. A packed matrix keeps only the upper triangle
+    # without the diagonal, row by row, see tsp_table_distance.
+    xs = numpy.asarray(xs, dtype=numpy.float64)
+    ys = numpy.asarray(ys, dtype=numpy.float64)
+    if spherical:
+        rad_x = numpy.radians(xs)
+        a = rad_x[:, None] - rad_x[None, :]
+        b = numpy.radians(ys)[:, None] - numpy.radians(ys)[None, :]
+        h = numpy.sin(a / 2) ** 2 + numpy.cos(rad_x)[:, None] * numpy.cos(rad_x)[None, :] *\
+            numpy.sin(b / 2) ** 2
+        matrix = 2 * numpy.arcsin(numpy.sqrt(numpy.clip(h, 0, 1))) * 6378.137
+    else:
+        matrix = numpy.hypot(xs[:, None] - xs[None, :], ys[:, None] - ys[None, :])
+    if packed:
+        matrix = matrix[numpy.triu_indices(len(xs), 1)]
+    return numpy.ascontiguousarray(matrix, dtype=dtype)
+
+def create_distance_table(xs, ys, name="distances", spherical=False, half=False, packed=False):
+    # Returns the fitness argument of the distance matrix and the defines for reading it. The
+    # defines should be put before including tsp_fitness.c at fitness_kernel_str. half stores the
+    # distances as 16 bits floats, it halves the memory traffic with about 3 significant digits.
+    # The table is placed automatically, e.g. at constant memory if it fits.
+    table = calculate_distance_matrix(xs, ys, spherical,
+                                      numpy.float16 if half else numpy.float32, packed)
+    defines = ("#define TSP_TABLE_HALF\n" if half else "") +\
+              ("#define TSP_TABLE_PACKED\n" if packed else "") +\
+              "#define TSP_TABLE_SPACE FITNESS_SPACE_" + name + "\n"
+    return {"t": "half" if half else "float", "v": table, "n": name, "p": "auto"}, defines
+
+def merge_statistics(statistics_list, opt_for_max):
+    # Merges the statistics of several OpenCLGA, e.g. islands or clients, to the records of
+    # ga_statistics. The statistics of a generation are merged from the ones which reached it. avg
+    # is the mean of averages, since all of them have the same population. std and diversity can't
+    # be merged from them, they are NaN. The dicts of older versions, e.g. the statistics streamed
+    # by clients, are converted to records.
+    records_list = [statistics if isinstance(statistics, numpy.ndarray)\
+                    else ga_statistics.from_dict(statistics) for statistics in statistics_list]
+    records = numpy.concatenate([numpy.zeros(0, dtype=ga_statistics.DTYPE)] + records_list)
+    generations, indices = numpy.unique(records["generation"], return_inverse=True)
+    merged = numpy.zeros(len(generations), dtype=ga_statistics.DTYPE)
+    merged["generation"] = generations
+    compare = numpy.maximum if opt_for_max == "max" else numpy.minimum
+    opposite = numpy.minimum if opt_for_max == "max" else numpy.maximum
+    for name, func in [("best", compare), ("worst", opposite)]:
+        merged[name] = records[name][numpy.unique(indices, return_index=True)[1]]
+        func.at(merged[name], indices, records[name])
+    merged["avg"] = numpy.bincount(indices, weights=records["avg"]) / numpy.bincount(indices)
+    merged["std"] = numpy.nan
+    merged["diversity"] = numpy.nan
+    numpy.maximum.at(merged["elapsed"], indices, records["elapsed"])
+    return merged
+
 def plot_tsp_result(city_info, city_ids):
     import matplotlib.pyplot as plt
     x = []
@@ -39,6 +95,7 @@ def plot_tsp_result(city_info, city_ids):
     plt.show()
 
 def plot_ga_result(statistics):
+    # statistics - the records of OpenCLGA.get_statistics or the dict of older versions.
     import matplotlib.pyplot as plt
 
     gen = []
@@ -47,6 +104,13 @@ def plot_ga_result(statistics):
     avgs = []
 
     avg_time_per_gen = 0
+    if isinstance(statistics, numpy.ndarray):
+        gen = statistics["generation"]
+        bests = statistics["best"]
+        worsts = statistics["worst"]
+        avgs = statistics["avg"]
+        avg_time_per_gen = ga_statistics.avg_time_per_gen(statistics)
+        statistics = {}
     for key, value in statistics.items():
         if key != "avg_time_per_gen":
             gen.append(key)
@@ -86,17 +150,16 @@ def calculate_estimated_kernel_usage(prog, ctx, kernel_names):
         from pyopencl import context_info as ci
         from pyopencl import kernel_work_group_info as kwgi
         devices = ctx.get_info(ci.DEVICES)
-        assert len(devices) == 1, "Should only one device is used !"
-        device = devices[0]
-        for name in kernel_names:
-            kerKer = cl.Kernel(prog, name)
-            lm = kerKer.get_work_group_info(kwgi.LOCAL_MEM_SIZE, device)
-            pm = kerKer.get_work_group_info(kwgi.PRIVATE_MEM_SIZE, device)
-            cwgs = kerKer.get_work_group_info(kwgi.COMPILE_WORK_GROUP_SIZE, device)
-            pwgsm = kerKer.get_work_group_info(kwgi.PREFERRED_WORK_GROUP_SIZE_MULTIPLE, device)
-            print("[%s]\tEstimated usage : Local mem (%d)/ Private mem (%d)"\
-                  "/ Compile WG size (%s)/ Preffered WG size multiple (%d)"\
-                  %(name, lm, pm, str(cwgs), pwgsm))
+        for device in devices:
+            for name in kernel_names:
+                kerKer = cl.Kernel(prog, name)
+                lm = kerKer.get_work_group_info(kwgi.LOCAL_MEM_SIZE, device)
+                pm = kerKer.get_work_group_info(kwgi.PRIVATE_MEM_SIZE, device)
+                cwgs = kerKer.get_work_group_info(kwgi.COMPILE_WORK_GROUP_SIZE, device)
+                pwgsm = kerKer.get_work_group_info(kwgi.PREFERRED_WORK_GROUP_SIZE_MULTIPLE, device)
+                print("[%s][%s]\tEstimated usage : Local mem (%d)/ Private mem (%d)"\
+                      "/ Compile WG size (%s)/ Preffered WG size multiple (%d)"\
+                      %(device.name, name, lm, pm, str(cwgs), pwgsm))
     except:
         import traceback
         traceback.print_exc()